@@ -63,6 +63,15 @@ class GitCLI:
     def git_fetch(self, *args):
         return self._execute_command("git", "fetch", *args)
 
+    def git_ls_remote(self, *args):
+        return self._execute_command("git", "ls-remote", *args)
+
+    def git_repack(self, *args):
+        return self._execute_command("git", "repack", *args)
+
+    def git_gc(self, *args):
+        return self._execute_command("git", "gc", *args)
+
     def git_rev_parse(self, *args):
         return self._execute_command("git", "rev-parse", *args)
 
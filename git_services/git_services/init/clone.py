@@ -17,6 +17,17 @@ if __name__ == "__main__":
         config.user,
         config.lfs_auto_fetch,
         config.mount_path,
+        config.strategy,
+        config.depth,
+        config.shallow_since,
+        config.autosave_discovery,
+        config.lfs_include,
+        config.lfs_exclude,
+        config.lfs_concurrent_transfers,
+        config.reference_cache_path,
+        config.reference_cache_lock_timeout_seconds,
+        config.reference_cache_max_age_seconds,
+        config.wait_for_server_timeout_seconds,
     )
     git_cloner.run(
         config.git_autosave, config.branch, config.commit_sha, config.s3_mount
@@ -1,10 +1,14 @@
+import fcntl
 import logging
 import os
+import random
 import re
 from contextlib import contextmanager
-from datetime import datetime, timedelta
+from hashlib import sha256
 from pathlib import Path
-from time import sleep
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+from time import monotonic, sleep, time
 from urllib.parse import urljoin, urlparse
 
 import requests
@@ -18,6 +22,12 @@ class GitCloner:
     remote_origin_prefix = f"remotes/{remote_name}"
     autosave_branch_prefix = "renku/autosave"
     proxy_url = "http://localhost:8080"
+    request_timeout_seconds = 10
+    initial_backoff_seconds = 1
+    max_backoff_seconds = 60
+    max_deepen_attempts = 5
+    lfs_progress_interval_seconds = 10
+    credentials_path = Path("/tmp/git-credentials")
 
     def __init__(
         self,
@@ -26,6 +36,17 @@ class GitCloner:
         user: User,
         lfs_auto_fetch=False,
         repo_directory=".",
+        strategy="full",
+        depth=1,
+        shallow_since=None,
+        autosave_discovery="fetch",
+        lfs_include="",
+        lfs_exclude="",
+        lfs_concurrent_transfers=8,
+        reference_cache_path=None,
+        reference_cache_lock_timeout_seconds=60,
+        reference_cache_max_age_seconds=300,
+        wait_for_server_timeout_seconds=600,
     ):
         logging.basicConfig(level=logging.INFO)
         self.git_url = git_url
@@ -38,24 +59,64 @@ class GitCloner:
         self.user = user
         self.git_host = urlparse(git_url).netloc
         self.lfs_auto_fetch = lfs_auto_fetch
-        self._wait_for_server()
+        # NOTE: Comma separated path patterns that limit which LFS files are downloaded
+        self.lfs_include = lfs_include
+        self.lfs_exclude = lfs_exclude
+        self.lfs_concurrent_transfers = lfs_concurrent_transfers
+        # NOTE: A directory shared by the sessions on a node with a bare repository per project
+        # from which the objects are copied instead of downloading them again.
+        self.reference_cache_path = reference_cache_path
+        self.reference_cache_lock_timeout_seconds = reference_cache_lock_timeout_seconds
+        # NOTE: The cache is not fetched again if it was updated less than this long ago
+        self.reference_cache_max_age_seconds = reference_cache_max_age_seconds
+        # NOTE: The strategy determines how much of the repository is fetched:
+        # - full: all branches with their whole history
+        # - single-branch: only the session branch with its whole history
+        # - shallow: only the session branch with its history limited by depth or shallow_since
+        # - blobless: all branches and history but file contents are fetched on demand
+        self.strategy = strategy
+        self.depth = depth
+        self.shallow_since = shallow_since
+        # NOTE: With ls-remote the autosave branch is found by querying the remote before
+        # anything is fetched, with fetch the branches are listed after they are fetched.
+        self.autosave_discovery = autosave_discovery
+        # NOTE: Reuse the same connection for all the requests made while waiting for git
+        self.http_session = requests.Session()
+        self._wait_for_server(wait_for_server_timeout_seconds)
 
-    def _wait_for_server(self, timeout_mins=None):
-        start = datetime.now()
+    def _wait_for_server(self, timeout_seconds):
+        """Wait until git responds or raise GitServerUnavailableError after timeout_seconds.
 
+        A HEAD request without following redirects is enough to know that git is up. The
+        delays between the attempts grow exponentially and are randomized so that the init
+        containers of many sessions do not all retry at the same time when git is down."""
+        logging.info(f"Waiting for git to become available with timeout {timeout_seconds}s...")
+        deadline = monotonic() + timeout_seconds
+        backoff = self.initial_backoff_seconds
+        attempt = 0
         while True:
-            logging.info(
-                f"Waiting for git to become available with timeout mins {timeout_mins}..."
-            )
-            res = requests.get(self.git_url)
-            if res.status_code >= 200 and res.status_code < 400:
-                logging.info("Git is available")
-                return
-            if timeout_mins is not None:
-                timeout_tdelta = timedelta(minutes=timeout_mins)
-                if datetime.now() - start > timeout_tdelta:
-                    raise errors.GitServerUnavailableError
-            sleep(5)
+            attempt += 1
+            remaining = deadline - monotonic()
+            try:
+                res = self.http_session.head(
+                    self.git_url,
+                    timeout=max(min(self.request_timeout_seconds, remaining), 1),
+                    allow_redirects=False,
+                )
+            except (requests.ConnectionError, requests.Timeout) as err:
+                logging.info(f"Git is not reachable: {err}")
+            else:
+                if res.status_code >= 200 and res.status_code < 400:
+                    logging.info("Git is available")
+                    return
+                logging.info(f"Git responded with status code {res.status_code}")
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise errors.GitServerUnavailableError
+            delay = min(backoff / 2 + random.uniform(0, backoff / 2), remaining)
+            logging.info(f"Checking git again in {delay:.1f}s (attempt {attempt})")
+            sleep(delay)
+            backoff = min(backoff * 2, self.max_backoff_seconds)
 
     def _initialize_repo(self):
         logging.info("Intitializing repo")
@@ -93,7 +154,7 @@ class GitCloner:
         # NOTE: If "lfs." is included in urljoin it does not work properly
         lfs_auth_setting = "lfs." + urljoin(f"{self.repo_url}/", "info/lfs.access")
         try:
-            credential_loc = Path("/tmp/git-credentials")
+            credential_loc = self.credentials_path
             with open(credential_loc, "w") as f:
                 f.write(f"https://oauth2:{self.user.oauth_token}@{self.git_host}")
             # NOTE: This is required to let LFS know that it should use basic auth to pull data.
@@ -121,23 +182,206 @@ class GitCloner:
                     f"been deleted. Detailed error: {err}"
                 )
 
-    def _clone(self, branch):
-        logging.info(f"Cloning branch {branch}")
-        if self.lfs_auto_fetch:
-            self.cli.git_lfs("install", "--local")
-        else:
-            self.cli.git_lfs("install", "--skip-smudge", "--local")
-        self.cli.git_remote("add", self.remote_name, self.repo_url)
-        self.cli.git_fetch(self.remote_name)
+    def _branch_refspec(self, branch):
+        return f"+refs/heads/{branch}:refs/{self.remote_origin_prefix}/{branch}"
+
+    def _shallow_args(self):
+        if self.strategy != "shallow":
+            return []
+        if self.shallow_since is not None:
+            return [f"--shallow-since={self.shallow_since}"]
+        return [f"--depth={self.depth}"]
+
+    def _fetch(self, *refspecs):
+        """Fetch the given refspecs (or all branches) according to the clone strategy."""
+        args = []
+        if self.strategy == "blobless":
+            args.append("--filter=blob:none")
+        args += self._shallow_args()
+        self.cli.git_fetch(*args, self.remote_name, *refspecs)
+
+    def _fetch_session_branch(self, branch, autosave_branch=None):
+        logging.info(f"Fetching with the {self.strategy} strategy")
+        if self.strategy == "blobless":
+            # NOTE: The remote has to be marked as a promisor so that git fetches the
+            # missing file contents from it when they are needed.
+            self.cli.git_config(f"remote.{self.remote_name}.promisor", "true")
+            self.cli.git_config(f"remote.{self.remote_name}.partialclonefilter", "blob:none")
+        if self.strategy in ["full", "blobless"]:
+            self._fetch()
+            return
         try:
-            self.cli.git_checkout(branch)
+            branches = [branch] if autosave_branch is None else [branch, autosave_branch]
+            self._fetch(*[self._branch_refspec(b) for b in branches])
         except GitCommandError as err:
-            if err.returncode != 0 or len(err.stderr) != 0:
-                if "no space left on device" in str(err.stderr).lower():
-                    # INFO: not enough disk space
-                    raise errors.NoDiskSpaceError from err
-                else:
-                    raise errors.BranchDoesNotExistError from err
+            if "no space left on device" in str(err.stderr).lower():
+                raise errors.NoDiskSpaceError from err
+            raise errors.BranchDoesNotExistError from err
+
+    def _commit_exists(self, commit_sha):
+        try:
+            self.cli.git_rev_parse("--verify", f"{commit_sha}^{{commit}}")
+        except GitCommandError:
+            return False
+        return True
+
+    def _is_shallow(self):
+        return self.cli.git_rev_parse("--is-shallow-repository").strip().lower() == "true"
+
+    def _ensure_commit(self, commit_sha, branch):
+        """Fetch more history if a commit is not in what has been fetched so far, i.e. when
+        the commit is older than the history of a shallow clone."""
+        if self._commit_exists(commit_sha):
+            return
+        logging.info(f"Commit {commit_sha} is missing, fetching more history")
+        if self._is_shallow():
+            deepen_by = self.depth
+            for _ in range(self.max_deepen_attempts):
+                deepen_by *= 4
+                self.cli.git_fetch(
+                    f"--deepen={deepen_by}", self.remote_name, self._branch_refspec(branch)
+                )
+                if self._commit_exists(commit_sha):
+                    return
+                if not self._is_shallow():
+                    break
+            else:
+                self.cli.git_fetch("--unshallow", self.remote_name, self._branch_refspec(branch))
+        if not self._commit_exists(commit_sha):
+            # NOTE: The commit is not on the session branch, fetch all branches
+            self.cli.git_fetch(self.remote_name)
+
+    def _lock_reference_cache(self, lock_file, operation):
+        deadline = monotonic() + self.reference_cache_lock_timeout_seconds
+        while True:
+            try:
+                fcntl.flock(lock_file, operation | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if monotonic() > deadline:
+                    raise TimeoutError("Timed out waiting for the lock of the reference cache")
+                sleep(1)
+
+    def _reference_cache_fetch_args(self, branch, autosave_branch=None):
+        """The filter and refspecs used to update the cache, they follow the clone strategy. The
+        cache is never shallow: history that is missing in the cache would be assumed to be
+        present when a repository that borrows from the cache fetches from the remote."""
+        args = ["--filter=blob:none"] if self.strategy == "blobless" else []
+        if self.strategy in ["full", "blobless"]:
+            return args + ["--prune", "+refs/heads/*:refs/heads/*"]
+        branches = [branch] if autosave_branch is None else [branch, autosave_branch]
+        return args + [f"+refs/heads/{b}:refs/heads/{b}" for b in branches]
+
+    def _reference_cache_is_recent(self, cache_cli, branch, autosave_branch=None):
+        """Whether the cache was fetched recently and contains the branches of the session."""
+        fetch_head = cache_cli.repo_directory / "FETCH_HEAD"
+        if not fetch_head.exists():
+            return False
+        if time() - fetch_head.stat().st_mtime > self.reference_cache_max_age_seconds:
+            return False
+        branches = [branch] if autosave_branch is None else [branch, autosave_branch]
+        try:
+            for b in branches:
+                cache_cli.git_rev_parse("--verify", f"refs/heads/{b}")
+        except GitCommandError:
+            return False
+        return True
+
+    def _update_reference_cache(self, cache_dir, branch, autosave_branch=None):
+        """Fetch the repository into the cache and let git decide if the cache should be
+        compacted, this has to be called while holding the exclusive lock of the cache."""
+        if not (cache_dir / "HEAD").exists():
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            cache_cli = GitCLI(cache_dir)
+            cache_cli.git_init("--bare")
+            cache_cli.git_remote("add", self.remote_name, self.repo_url)
+            if self.strategy == "blobless":
+                cache_cli.git_config(f"remote.{self.remote_name}.promisor", "true")
+                cache_cli.git_config(f"remote.{self.remote_name}.partialclonefilter", "blob:none")
+        cache_cli = GitCLI(cache_dir)
+        if self._reference_cache_is_recent(cache_cli, branch, autosave_branch):
+            logging.info(f"The reference cache {cache_dir} is up to date")
+            return
+        logging.info(f"Updating the reference cache {cache_dir}")
+        start = monotonic()
+        if not self.user.is_anonymous:
+            cache_cli.git_config("credential.helper", f"store --file={self.credentials_path}")
+        try:
+            cache_cli.git_fetch(
+                "--no-tags",
+                self.remote_name,
+                *self._reference_cache_fetch_args(branch, autosave_branch),
+            )
+        finally:
+            if not self.user.is_anonymous:
+                cache_cli.git_config("--unset", "credential.helper")
+        cache_cli.git_gc("--auto")
+        logging.info(f"Updated the reference cache in {monotonic() - start:.1f}s")
+
+    @contextmanager
+    def _reference_cache(self, branch, autosave_branch=None):
+        """Borrow the objects of a node-local cache of the repository (like git clone
+        --reference) while fetching and checking out, then copy the borrowed objects into the
+        repository (like --dissociate) because the cache is not available in the session.
+
+        The cache is updated while holding an exclusive lock and it is only read while holding
+        a shared lock. If the cache cannot be used the repository is cloned without it."""
+        if self.reference_cache_path is None:
+            yield
+            return
+        # NOTE: A repository with all blobs must not borrow from a cache without them
+        cache_name = sha256(self.repo_url.encode()).hexdigest()
+        if self.strategy == "blobless":
+            cache_name += "-blobless"
+        cache_dir = Path(self.reference_cache_path) / f"{cache_name}.git"
+        alternates = self.repo_directory / ".git" / "objects" / "info" / "alternates"
+        lock_file = None
+        try:
+            cache_dir.parent.mkdir(parents=True, exist_ok=True)
+            lock_file = open(cache_dir.with_suffix(".lock"), "a")
+            self._lock_reference_cache(lock_file, fcntl.LOCK_EX)
+            self._update_reference_cache(cache_dir, branch, autosave_branch)
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            alternates.parent.mkdir(parents=True, exist_ok=True)
+            alternates.write_text(f"{(cache_dir / 'objects').absolute()}\n")
+        except (GitCommandError, OSError) as err:
+            logging.warning(
+                "Cloning without the reference cache, it cannot be used: "
+                f"{getattr(err, 'stderr', err)}"
+            )
+            alternates.unlink(missing_ok=True)
+            # NOTE: Closing the lock file releases the lock
+            if lock_file is not None:
+                lock_file.close()
+            lock_file = None
+        if lock_file is None:
+            yield
+            return
+        try:
+            yield
+            logging.info("Copying the objects borrowed from the reference cache")
+            self.cli.git_repack("-a", "-d")
+        finally:
+            alternates.unlink(missing_ok=True)
+            lock_file.close()
+
+    def _clone(self, branch, autosave_branch=None):
+        logging.info(f"Cloning branch {branch}")
+        # NOTE: LFS files are not downloaded one at a time by the smudge filter on checkout,
+        # they are downloaded concurrently once the final commit is checked out (see run).
+        self.cli.git_lfs("install", "--skip-smudge", "--local")
+        self.cli.git_remote("add", self.remote_name, self.repo_url)
+        with self._reference_cache(branch, autosave_branch):
+            self._fetch_session_branch(branch, autosave_branch)
+            try:
+                self.cli.git_checkout(branch)
+            except GitCommandError as err:
+                if err.returncode != 0 or len(err.stderr) != 0:
+                    if "no space left on device" in str(err.stderr).lower():
+                        # INFO: not enough disk space
+                        raise errors.NoDiskSpaceError from err
+                    else:
+                        raise errors.BranchDoesNotExistError from err
         try:
             logging.info("Dealing with submodules")
             self.cli.git_submodule("init")
@@ -145,6 +389,107 @@ class GitCloner:
         except GitCommandError as err:
             raise errors.GitSubmoduleError from err
 
+    def _configure_lfs(self):
+        self.cli.git_config("lfs.concurrenttransfers", str(self.lfs_concurrent_transfers))
+        # NOTE: The patterns are stored in the config so that the smudge filter and later
+        # fetches in the session respect them too.
+        if self.lfs_include:
+            self.cli.git_config("lfs.fetchinclude", self.lfs_include)
+        if self.lfs_exclude:
+            self.cli.git_config("lfs.fetchexclude", self.lfs_exclude)
+
+    @contextmanager
+    def _lfs_errors(self):
+        try:
+            yield
+        except GitCommandError as err:
+            if "no space left on device" in str(err.stderr).lower():
+                raise errors.NoDiskSpaceError from err
+            raise errors.GitLFSError from err
+
+    def _fetch_lfs_files(self):
+        """Download the LFS files of the checked out branch concurrently and replace their
+        pointers in the working tree. The smudge filter is enabled afterwards so that LFS
+        files are downloaded when other branches are checked out in the session."""
+        logging.info(
+            f"Fetching LFS files with {self.lfs_concurrent_transfers} concurrent transfers, "
+            f"include: '{self.lfs_include}', exclude: '{self.lfs_exclude}'"
+        )
+        self._configure_lfs()
+        start = monotonic()
+        with self._lfs_errors():
+            with self._log_lfs_progress():
+                self.cli.git_lfs("fetch", self.remote_name)
+            logging.info(f"Fetched LFS files in {monotonic() - start:.1f}s")
+            self.cli.git_lfs("checkout")
+            self.cli.git_lfs("install", "--local", "--force")
+            # NOTE: Files marked with * are checked out, the ones marked with - are pointers
+            lfs_files = self.cli.git_lfs("ls-files").splitlines()
+        checked_out = len([line for line in lfs_files if " * " in line])
+        logging.info(
+            f"Checked out {checked_out} of {len(lfs_files)} LFS files "
+            f"in {monotonic() - start:.1f}s"
+        )
+
+    @contextmanager
+    def _log_lfs_progress(self):
+        """Periodically log the transfer progress that git lfs writes to GIT_LFS_PROGRESS.
+        Each line of the file has the format: <direction> <file>/<total files>
+        <bytes>/<total bytes> <name>"""
+        with TemporaryDirectory() as progress_dir:
+            progress_path = Path(progress_dir) / "progress"
+            progress_path.touch()
+            done = Event()
+
+            def _log_progress():
+                buffer = ""
+                with open(progress_path) as progress:
+                    while True:
+                        finished = done.wait(self.lfs_progress_interval_seconds)
+                        buffer += progress.read()
+                        *lines, buffer = buffer.split("\n")
+                        if len(lines) > 0:
+                            logging.info(f"LFS progress: {lines[-1]}")
+                        if finished:
+                            return
+
+            logger = Thread(target=_log_progress, daemon=True)
+            previous_progress_path = os.environ.get("GIT_LFS_PROGRESS")
+            os.environ["GIT_LFS_PROGRESS"] = str(progress_path)
+            logger.start()
+            try:
+                yield
+            finally:
+                if previous_progress_path is None:
+                    os.environ.pop("GIT_LFS_PROGRESS")
+                else:
+                    os.environ["GIT_LFS_PROGRESS"] = previous_progress_path
+                done.set()
+                logger.join()
+
+    def _autosave_prefix(self, session_branch, root_commit_sha):
+        return (
+            f"{self.autosave_branch_prefix}/{self.user.username}/"
+            f"{session_branch}/{root_commit_sha[:7]}"
+        )
+
+    def _ls_remote_autosave_branch(self, session_branch, root_commit_sha):
+        """Find the autosave branch of the session without fetching anything, only the
+        refs of the autosave branches of the session are requested from the remote."""
+        logging.info("Checking for autosaves with ls-remote")
+        if self.user.full_name is None and self.user.email is None:
+            # INFO: There can be no autosaves for anonymous users
+            return None
+        autosave_prefix = self._autosave_prefix(session_branch, root_commit_sha)
+        refs = self.cli.git_ls_remote("--heads", self.repo_url, f"refs/heads/{autosave_prefix}/*")
+        autosave_regex = f"^refs/heads/({re.escape(autosave_prefix)}/" + r"[a-zA-Z0-9]{7})$"
+        for line in refs.splitlines():
+            match = re.match(autosave_regex, line.split()[-1])
+            if match is not None:
+                logging.info(f"Autosave found {match.group(1)}")
+                return match.group(1)
+        return None
+
     def _get_autosave_branch(self, session_branch, root_commit_sha):
         logging.info("Checking for autosaves")
         if self.user.full_name is None and self.user.email is None:
@@ -155,6 +500,14 @@ class GitCloner:
             f"{self.user.username}/{session_branch}/{root_commit_sha[:7]}/"
             r"[a-zA-Z0-9]{7}$"
         )
+        if self.strategy != "full":
+            # NOTE: Only the autosave branches of this session are fetched, the other
+            # strategies do not fetch them with the session branch.
+            autosave_prefix = self._autosave_prefix(session_branch, root_commit_sha)
+            self._fetch(
+                f"+refs/heads/{autosave_prefix}/*:"
+                f"refs/{self.remote_origin_prefix}/{autosave_prefix}/*"
+            )
         branches = self.cli.git_branch("-a").split()
         autosave = [
             branch
@@ -172,15 +525,26 @@ class GitCloner:
         # INFO: Check if the found autosave branch has a valid format, fail otherwise
         if len(autosave_items) < 7:
             raise errors.UnexpectedAutosaveFormatError
+        pre_save_local_commit_sha = autosave_items[7]
+        autosave_local_branch = "/".join(autosave_items[2:])
+        if self.strategy == "shallow":
+            self._ensure_commit(pre_save_local_commit_sha, autosave_local_branch)
         # INFO: Reset the file tree to the auto-saved state.
         self.cli.git_reset("--hard", autosave_branch)
+        if self.lfs_auto_fetch:
+            # NOTE: The LFS files that were added or changed in the autosave are not in the
+            # final commit, so they are checked out while HEAD is still the autosave.
+            logging.info(f"Fetching LFS files of {autosave_local_branch}")
+            self._configure_lfs()
+            with self._lfs_errors():
+                with self._log_lfs_progress():
+                    self.cli.git_lfs("fetch", self.remote_name, autosave_local_branch)
+                self.cli.git_lfs("checkout")
         # INFO: Reset HEAD to the last committed change prior to the autosave commit.
-        pre_save_local_commit_sha = autosave_items[7]
         self.cli.git_reset("--soft", pre_save_local_commit_sha)
         # INFO: Unstage all modified files.
         self.cli.git_reset("HEAD", ".")
         # INFO: Delete the autosave branch both remotely and locally.
-        autosave_local_branch = "/".join(autosave_items[2:])
         logging.info(f"Recovery successful, deleting branch {autosave_local_branch}")
         self.cli.git_push(self.remote_name, "--delete", autosave_local_branch)
 
@@ -199,17 +563,32 @@ class GitCloner:
         self._initialize_repo()
         if self.user.is_anonymous:
             self._clone(session_branch)
+            if self.lfs_auto_fetch:
+                self._fetch_lfs_files()
         else:
             with self._temp_plaintext_credentials():
-                self._clone(session_branch)
-                if recover_autosave:
-                    autosave_branch = self._get_autosave_branch(
+                if recover_autosave and self.autosave_discovery == "ls-remote":
+                    autosave_branch = self._ls_remote_autosave_branch(
                         session_branch, root_commit_sha
                     )
+                    # NOTE: The autosave branch is fetched together with the session branch
+                    self._clone(session_branch, autosave_branch)
+                    if autosave_branch is not None:
+                        autosave_branch = f"{self.remote_origin_prefix}/{autosave_branch}"
+                else:
+                    self._clone(session_branch)
+                    if recover_autosave:
+                        autosave_branch = self._get_autosave_branch(session_branch, root_commit_sha)
+                if recover_autosave:
                     if autosave_branch is None:
+                        self._ensure_commit(root_commit_sha, session_branch)
                         self.cli.git_reset("--hard", root_commit_sha)
                     else:
                         self._recover_autosave(autosave_branch)
+                # NOTE: The LFS files are fetched for the commit that is checked out in the
+                # end, i.e. after the reset to the root commit or the autosave recovery.
+                if self.lfs_auto_fetch:
+                    self._fetch_lfs_files()
         self._setup_proxy()
         if s3_mount:
             self._setup_cloudstorage_symlink(s3_mount)
@@ -40,8 +40,40 @@ class Config:
     lfs_auto_fetch: Union[str, bool] = "0"
     mount_path: str = "/work"
     s3_mount: str = ""
+    strategy: str = "full"
+    depth: Union[str, int] = "1"
+    shallow_since: Optional[str] = None
+    autosave_discovery: str = "fetch"
+    lfs_include: str = ""
+    lfs_exclude: str = ""
+    lfs_concurrent_transfers: Union[str, int] = "8"
+    reference_cache_path: Optional[str] = None
+    reference_cache_lock_timeout_seconds: Union[str, int] = "60"
+    reference_cache_max_age_seconds: Union[str, int] = "300"
+    wait_for_server_timeout_seconds: Union[str, int] = "600"
 
     def __post_init__(self):
+        allowed_strategies = ["full", "single-branch", "shallow", "blobless"]
+        if self.strategy not in allowed_strategies:
+            raise ValueError(f"strategy can only be one of {', '.join(allowed_strategies)}")
+        self.depth = int(self.depth)
+        if self.depth < 1:
+            raise ValueError("depth has to be a positive integer")
+        allowed_discovery = ["fetch", "ls-remote"]
+        if self.autosave_discovery not in allowed_discovery:
+            raise ValueError(
+                f"autosave_discovery can only be one of {', '.join(allowed_discovery)}"
+            )
+        self.lfs_concurrent_transfers = int(self.lfs_concurrent_transfers)
+        if self.lfs_concurrent_transfers < 1:
+            raise ValueError("lfs_concurrent_transfers has to be a positive integer")
+        self.reference_cache_lock_timeout_seconds = int(self.reference_cache_lock_timeout_seconds)
+        self.reference_cache_max_age_seconds = int(self.reference_cache_max_age_seconds)
+        self.wait_for_server_timeout_seconds = int(self.wait_for_server_timeout_seconds)
+        if self.reference_cache_path == "":
+            self.reference_cache_path = None
+        if self.shallow_since == "":
+            self.shallow_since = None
         allowed_string_flags = ["0", "1"]
         if self.git_autosave not in allowed_string_flags:
             raise ValueError("git_autosave can only be a string with values '0' or '1'")
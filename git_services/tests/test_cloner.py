@@ -0,0 +1,330 @@
+import fcntl
+import os
+from hashlib import sha256
+from unittest import mock
+
+import pytest
+import requests
+
+from git_services.cli import GitCLI, GitCommandError
+from git_services.init import errors
+from git_services.init.cloner import GitCloner
+from git_services.init.config import User
+
+
+@pytest.fixture
+def origin(tmp_path):
+    """A repository with a few commits on master and an autosave branch."""
+    origin_dir = tmp_path / "origin"
+    origin_dir.mkdir()
+    cli = GitCLI(origin_dir)
+    cli.git_init("--initial-branch", "master")
+    cli.git_config("user.name", "Test User")
+    cli.git_config("user.email", "test.user@renku.ch")
+    cli.git_config("uploadpack.allowFilter", "true")
+    cli.git_config("uploadpack.allowAnySHA1InWant", "true")
+    commits = []
+    for i in range(5):
+        with open(origin_dir / "file", "w") as f:
+            f.write(f"version {i}")
+        cli.git_add("file")
+        cli.git_commit("-m", f"commit {i}")
+        commits.append(cli.git_rev_parse("HEAD").strip())
+    cli.git_branch("other", commits[0])
+    autosave = f"renku/autosave/john/master/{commits[1][:7]}/{commits[4][:7]}"
+    cli.git_branch(autosave, commits[4])
+    return origin_dir, commits, autosave
+
+
+@pytest.fixture
+def make_cloner(tmp_path, origin):
+    repo_dir = tmp_path / "repo"
+    repo_dir.mkdir()
+
+    def _make_cloner(**kwargs):
+        with mock.patch.object(GitCloner, "_wait_for_server"):
+            cloner = GitCloner(
+                "https://gitlab.example.com",
+                f"file://{origin[0]}",
+                User(username="john", full_name="John Doe", email="john@renku.ch"),
+                repo_directory=repo_dir,
+                **kwargs,
+            )
+        cloner.cli.git_lfs = mock.MagicMock()
+        cloner._initialize_repo()
+        return cloner
+
+    return _make_cloner
+
+
+def remote_branches(cloner):
+    return cloner.cli.git_branch("-r", "--format=%(refname:short)").split()
+
+
+def test_full_clone_fetches_all_branches(make_cloner):
+    cloner = make_cloner()
+    cloner._clone("master")
+    assert "origin/other" in remote_branches(cloner)
+    assert cloner._is_shallow() is False
+
+
+def test_single_branch_clone(make_cloner):
+    cloner = make_cloner(strategy="single-branch")
+    cloner._clone("master")
+    assert remote_branches(cloner) == ["origin/master"]
+    assert cloner._is_shallow() is False
+
+
+def test_shallow_clone_deepens_for_missing_commit(make_cloner, origin):
+    _, commits, _ = origin
+    cloner = make_cloner(strategy="shallow", depth=1)
+    cloner._clone("master")
+    assert cloner._is_shallow() is True
+    assert not cloner._commit_exists(commits[0])
+    cloner._ensure_commit(commits[0], "master")
+    assert cloner._commit_exists(commits[0])
+
+
+def test_blobless_clone_marks_remote_as_promisor(make_cloner):
+    cloner = make_cloner(strategy="blobless")
+    cloner._clone("master")
+    assert cloner.cli.git_config("remote.origin.promisor").strip() == "true"
+    assert "origin/other" in remote_branches(cloner)
+    with open(cloner.repo_directory / "file") as f:
+        assert f.read() == "version 4"
+
+
+@pytest.mark.parametrize("strategy", ["single-branch", "shallow"])
+def test_missing_branch(make_cloner, strategy):
+    cloner = make_cloner(strategy=strategy)
+    with pytest.raises(errors.BranchDoesNotExistError):
+        cloner._clone("missing")
+
+
+@pytest.mark.parametrize("strategy", ["full", "single-branch", "shallow", "blobless"])
+def test_autosave_branch_is_found(make_cloner, origin, strategy):
+    _, commits, autosave = origin
+    cloner = make_cloner(strategy=strategy)
+    cloner._clone("master")
+    assert cloner._get_autosave_branch("master", commits[1]) == f"remotes/origin/{autosave}"
+    assert cloner._get_autosave_branch("master", commits[2]) is None
+    if strategy in ["single-branch", "shallow"]:
+        assert "origin/other" not in remote_branches(cloner)
+
+
+@pytest.mark.parametrize("strategy", ["full", "single-branch", "shallow"])
+def test_autosave_branch_is_found_with_ls_remote(make_cloner, origin, strategy):
+    _, commits, autosave = origin
+    cloner = make_cloner(strategy=strategy, autosave_discovery="ls-remote")
+    assert cloner._ls_remote_autosave_branch("master", commits[2]) is None
+    assert cloner._ls_remote_autosave_branch("master", commits[1]) == autosave
+    # NOTE: ls-remote does not fetch anything
+    assert remote_branches(cloner) == []
+    cloner._clone("master", autosave)
+    assert f"origin/{autosave}" in remote_branches(cloner)
+    if strategy != "full":
+        assert sorted(remote_branches(cloner)) == ["origin/master", f"origin/{autosave}"]
+
+
+def test_lfs_files_are_fetched_after_checkout(make_cloner):
+    cloner = make_cloner(
+        lfs_auto_fetch=True, lfs_include="data/*", lfs_exclude="*.bin", lfs_concurrent_transfers=4
+    )
+    cloner.cli.git_lfs.return_value = "0123456789 * data/file\n0123456789 - data/other.bin\n"
+    cloner._clone("master")
+    cloner._fetch_lfs_files()
+    lfs_commands = [call.args for call in cloner.cli.git_lfs.call_args_list]
+    assert lfs_commands == [
+        ("install", "--skip-smudge", "--local"),
+        ("fetch", "origin"),
+        ("checkout",),
+        ("install", "--local", "--force"),
+        ("ls-files",),
+    ]
+    assert cloner.cli.git_config("lfs.concurrenttransfers").strip() == "4"
+    assert cloner.cli.git_config("lfs.fetchinclude").strip() == "data/*"
+    assert cloner.cli.git_config("lfs.fetchexclude").strip() == "*.bin"
+
+
+def test_lfs_fetch_error(make_cloner):
+    cloner = make_cloner(lfs_auto_fetch=True)
+    cloner.cli.git_lfs.side_effect = GitCommandError(2, "", "batch response: error")
+    with pytest.raises(errors.GitLFSError):
+        cloner._fetch_lfs_files()
+
+
+@pytest.mark.parametrize("recover_autosave", [False, True])
+def test_lfs_files_are_fetched_for_the_final_commit(make_cloner, origin, recover_autosave):
+    _, commits, _ = origin
+    cloner = make_cloner(lfs_auto_fetch=True)
+    cloner.user.oauth_token = "token"
+    root_commit = commits[2] if recover_autosave else commits[4]
+
+    def _check_final_state():
+        assert cloner.cli.git_rev_parse("HEAD").strip() == root_commit
+        assert "credential.helper" in cloner.cli.git_config("--list")
+
+    with mock.patch.object(GitCloner, "_fetch_lfs_files") as fetch_lfs_files, mock.patch.object(
+        GitCloner, "_setup_proxy"
+    ), mock.patch.object(GitCloner, "_repo_exists", return_value=False), mock.patch.object(
+        GitCloner, "credentials_path", cloner.repo_directory.parent / "git-credentials"
+    ):
+        fetch_lfs_files.side_effect = _check_final_state
+        cloner.run(recover_autosave, "master", root_commit, None)
+    fetch_lfs_files.assert_called_once()
+
+
+def test_lfs_files_of_the_autosave_are_checked_out(make_cloner, origin):
+    _, commits, autosave = origin
+    cloner = make_cloner(lfs_auto_fetch=True)
+    cloner._clone("master")
+    commands = []
+    git_reset = cloner.cli.git_reset
+
+    def _git_reset(*args):
+        commands.append(("reset",) + args)
+        return git_reset(*args)
+
+    cloner.cli.git_lfs.side_effect = lambda *args: commands.append(("lfs",) + args) or ""
+    with mock.patch.object(cloner.cli, "git_reset", side_effect=_git_reset):
+        cloner._recover_autosave(f"remotes/origin/{autosave}")
+    assert commands == [
+        ("reset", "--hard", f"remotes/origin/{autosave}"),
+        ("lfs", "fetch", "origin", autosave),
+        ("lfs", "checkout"),
+        ("reset", "--soft", commits[4][:7]),
+        ("reset", "HEAD", "."),
+    ]
+
+
+def test_lfs_progress_is_logged(make_cloner, caplog):
+    cloner = make_cloner()
+    cloner.lfs_progress_interval_seconds = 0.01
+    with caplog.at_level("INFO"), cloner._log_lfs_progress():
+        with open(os.environ["GIT_LFS_PROGRESS"], "a") as f:
+            f.write("download 1/2 10/10 data/file\ndownload 2/2 5/")
+    assert "GIT_LFS_PROGRESS" not in os.environ
+    assert "LFS progress: download 1/2 10/10 data/file" in caplog.messages
+    assert not any("download 2/2" in message for message in caplog.messages)
+
+
+def test_clone_with_reference_cache(make_cloner, tmp_path):
+    cache_path = tmp_path / "cache"
+    cloner = make_cloner(reference_cache_path=str(cache_path))
+    cloner._clone("master")
+    cache_dirs = list(cache_path.glob("*.git"))
+    assert len(cache_dirs) == 1
+    cache_cli = GitCLI(cache_dirs[0])
+    assert "other" in cache_cli.git_branch("--format=%(refname:short)").split()
+    # NOTE: The repository does not depend on the cache after it is cloned
+    assert not (cloner.repo_directory / ".git" / "objects" / "info" / "alternates").exists()
+    cloner.cli._execute_command("git", "fsck", "--connectivity-only")
+    assert "credential.helper" not in cache_cli.git_config("--list")
+
+
+@pytest.mark.parametrize("strategy", ["single-branch", "shallow", "blobless"])
+def test_reference_cache_follows_the_strategy(make_cloner, origin, tmp_path, strategy):
+    _, _, autosave = origin
+    cache_path = tmp_path / "cache"
+    cloner = make_cloner(strategy=strategy, reference_cache_path=str(cache_path))
+    cloner._clone("master")
+    (cache_dir,) = cache_path.glob("*.git")
+    cache_cli = GitCLI(cache_dir)
+    branches = sorted(cache_cli.git_branch("--format=%(refname:short)").split())
+    assert not (cache_dir / "shallow").exists()
+    if strategy == "blobless":
+        assert branches == ["master", "other", autosave]
+        assert cache_dir.name.endswith("-blobless.git")
+        assert cache_cli.git_config("remote.origin.partialclonefilter").strip() == "blob:none"
+    else:
+        assert branches == ["master"]
+    with open(cloner.repo_directory / "file") as f:
+        assert f.read() == "version 4"
+
+
+def test_recent_reference_cache_is_not_updated(make_cloner, origin, tmp_path):
+    origin_dir, commits, _ = origin
+    cache_dir = tmp_path / "cache.git"
+    cloner = make_cloner(strategy="single-branch")
+    cloner._update_reference_cache(cache_dir, "master")
+    origin_cli = GitCLI(origin_dir)
+    origin_cli.git_commit("--allow-empty", "-m", "new commit")
+    new_commit = origin_cli.git_rev_parse("HEAD").strip()
+    cache_cli = GitCLI(cache_dir)
+    cloner._update_reference_cache(cache_dir, "master")
+    assert cache_cli.git_rev_parse("refs/heads/master").strip() == commits[4]
+    # NOTE: A branch that is missing in the cache is always fetched
+    cloner._update_reference_cache(cache_dir, "other")
+    assert cache_cli.git_rev_parse("refs/heads/other").strip() == commits[0]
+    os.utime(cache_dir / "FETCH_HEAD", (0, 0))
+    cloner._update_reference_cache(cache_dir, "master")
+    assert cache_cli.git_rev_parse("refs/heads/master").strip() == new_commit
+
+
+def test_reference_cache_is_compacted_under_the_exclusive_lock(make_cloner, tmp_path):
+    cache_path = tmp_path / "cache"
+    cloner = make_cloner(reference_cache_path=str(cache_path))
+    lock_path = cache_path / f"{sha256(cloner.repo_url.encode()).hexdigest()}.lock"
+
+    def _check_exclusive_lock(*args):
+        assert args == ("--auto",)
+        with open(lock_path) as f:
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+
+    with mock.patch.object(GitCLI, "git_gc", side_effect=_check_exclusive_lock) as git_gc:
+        cloner._clone("master")
+    git_gc.assert_called_once()
+
+
+def test_clone_with_unusable_reference_cache(make_cloner, tmp_path):
+    cache_path = tmp_path / "cache"
+    cache_path.write_text("not a directory")
+    cloner = make_cloner(reference_cache_path=str(cache_path / "repos"))
+    cloner._clone("master")
+    assert (cloner.repo_directory / "file").exists()
+
+
+def test_clone_with_locked_reference_cache(make_cloner, tmp_path, origin):
+    cache_path = tmp_path / "cache"
+    cloner = make_cloner(
+        reference_cache_path=str(cache_path), reference_cache_lock_timeout_seconds=0
+    )
+    cache_path.mkdir()
+    with open(cache_path / f"{sha256(cloner.repo_url.encode()).hexdigest()}.lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        cloner._clone("master")
+    assert (cloner.repo_directory / "file").exists()
+    assert list(cache_path.glob("*.git")) == []
+
+
+@mock.patch("git_services.init.cloner.sleep")
+def test_wait_for_server_backs_off_until_available(sleep):
+    cloner = GitCloner.__new__(GitCloner)
+    cloner.git_url = "https://gitlab.example.com"
+    cloner.http_session = mock.MagicMock()
+    cloner.http_session.head.side_effect = [
+        requests.ConnectionError(),
+        mock.MagicMock(status_code=502),
+        requests.Timeout(),
+        mock.MagicMock(status_code=302),
+    ]
+    cloner._wait_for_server(600)
+    assert cloner.http_session.head.call_count == 4
+    assert cloner.http_session.head.call_args.kwargs["allow_redirects"] is False
+    delays = [call.args[0] for call in sleep.call_args_list]
+    for delay, backoff in zip(delays, [1, 2, 4]):
+        assert backoff / 2 <= delay <= backoff
+
+
+@mock.patch("git_services.init.cloner.sleep")
+@mock.patch("git_services.init.cloner.monotonic")
+def test_wait_for_server_deadline(monotonic, sleep):
+    monotonic.side_effect = [0, 0, 30, 30, 61]
+    cloner = GitCloner.__new__(GitCloner)
+    cloner.git_url = "https://gitlab.example.com"
+    cloner.http_session = mock.MagicMock()
+    cloner.http_session.head.side_effect = requests.ConnectionError()
+    with pytest.raises(errors.GitServerUnavailableError):
+        cloner._wait_for_server(60)
+    assert cloner.http_session.head.call_count == 2
@@ -25,16 +25,25 @@ from apispec_webframeworks.flask import FlaskPlugin
 from flask import Blueprint, Flask, jsonify
 
 from .config import config as config
+from .api.admin import admin_delete_servers, admin_list_servers, admin_patch_culling
 from .api.notebooks import (
     autosave_info,
     check_docker_image,
     delete_autosave,
     launch_notebook,
     server_logs,
+    server_logs_stream,
     server_options,
     stop_server,
     user_server,
     user_servers,
+    user_servers_events,
+)
+from .api.schemas.admin import (
+    AdminCullingPatchRequest,
+    AdminServersDeleteRequest,
+    AdminServersListRequest,
+    AdminServersListResponse,
 )
 from .api.schemas.autosave import AutosavesList
 from .api.schemas.config_server_options import ServerOptionsEndpointResponse
@@ -44,10 +53,14 @@ from .api.schemas.servers_get import (
     NotebookResponse,
     ServersGetRequest,
     ServersGetResponse,
+    ServersListRequest,
+    ServersSummaryResponse,
 )
 from .api.schemas.servers_post import LaunchNotebookRequest
 from .api.schemas.version import VersionResponse
 from .errors.utils import handle_exception
+from .util.metrics import instrument_app
+from .util.tracing import configure_tracing
 
 
 # From: http://flask.pocoo.org/snippets/35/
@@ -92,16 +105,19 @@ def create_app():
     app = Flask(__name__)
     app.wsgi_app = _ReverseProxied(app.wsgi_app)
 
+    from .api.admin import bp as admin_bp
     from .api.auth import bp as auth_bp
     from .api.health import bp as health_bp
     from .api.notebooks import bp as notebooks_bp
 
-    for bp in [auth_bp, health_bp, notebooks_bp]:
+    for bp in [admin_bp, auth_bp, health_bp, notebooks_bp]:
         app.register_blueprint(bp)
 
     # Return errors as JSON
     app.errorhandler(Exception)(handle_exception)
 
+    instrument_app(app)
+
     app.logger.debug(config)
 
     if config.sentry.enabled:
@@ -114,6 +130,7 @@ def create_app():
             integrations=[FlaskIntegration()],
             traces_sample_rate=config.sentry.sample_rate,
         )
+    configure_tracing()
     return app
 
 
@@ -138,6 +155,8 @@ def register_swagger(app):
     spec.components.schema("NotebookResponse", schema=NotebookResponse)
     spec.components.schema("ServersGetRequest", schema=ServersGetRequest)
     spec.components.schema("ServersGetResponse", schema=ServersGetResponse)
+    spec.components.schema("ServersListRequest", schema=ServersListRequest)
+    spec.components.schema("ServersSummaryResponse", schema=ServersSummaryResponse)
     spec.components.schema("ServerLogs", schema=ServerLogs)
     spec.components.schema(
         "ServerOptionsEndpointResponse", schema=ServerOptionsEndpointResponse
@@ -145,17 +164,28 @@ def register_swagger(app):
     spec.components.schema("AutosavesList", schema=AutosavesList)
     spec.components.schema("VersionResponse", schema=VersionResponse)
     spec.components.schema("ErrorResponse", schema=ErrorResponse)
+    spec.components.schema("AdminServersListRequest", schema=AdminServersListRequest)
+    spec.components.schema("AdminServersListResponse", schema=AdminServersListResponse)
+    spec.components.schema(
+        "AdminServersDeleteRequest", schema=AdminServersDeleteRequest
+    )
+    spec.components.schema("AdminCullingPatchRequest", schema=AdminCullingPatchRequest)
     # Register endpoints
     with app.test_request_context():
         spec.path(view=user_server)
         spec.path(view=user_servers)
+        spec.path(view=user_servers_events)
         spec.path(view=launch_notebook)
         spec.path(view=stop_server)
         spec.path(view=server_options)
         spec.path(view=server_logs)
+        spec.path(view=server_logs_stream)
         spec.path(view=autosave_info)
         spec.path(view=delete_autosave)
         spec.path(view=check_docker_image)
+        spec.path(view=admin_list_servers)
+        spec.path(view=admin_delete_servers)
+        spec.path(view=admin_patch_culling)
     # Register security scheme
     security_scheme = {
         "type": "openIdConnect",
@@ -163,6 +193,15 @@ def register_swagger(app):
         "openIdConnectUrl": config.sessions.oidc.config_url,
     }
     spec.components.security_scheme("oauth2-swagger", security_scheme)
+    spec.components.security_scheme(
+        "admin-key",
+        {
+            "type": "apiKey",
+            "in": "header",
+            "name": "Renku-Auth-Admin-Key",
+            "description": "The API key of the admin endpoints.",
+        },
+    )
 
     bp = Blueprint("swagger_blueprint", __name__, url_prefix=config.service_prefix)
 
@@ -0,0 +1,341 @@
+"""Endpoints for administrators to inspect and manage the sessions of all users."""
+import hmac
+import json
+from concurrent.futures import as_completed
+from functools import wraps
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from flask import Blueprint, Response, request, stream_with_context
+from kubernetes import client
+from kubernetes.client.exceptions import ApiException
+from kubernetes.client.models import V1DeleteOptions
+from webargs.flaskparser import use_args
+
+from ..config import config
+from ..errors.user import AuthenticationError, UserInputError
+from ..util.concurrency import AppContextThreadPoolExecutor
+from ..util.informer import record_write
+from ..util.metrics import track_dependency
+from .schemas.admin import (
+    AdminCullingPatchRequest,
+    AdminServersDeleteRequest,
+    AdminServersListRequest,
+    AdminServersListResponse,
+)
+
+bp = Blueprint("admin_blueprint", __name__, url_prefix=f"{config.service_prefix}/admin")
+
+_admin_key_header = "Renku-Auth-Admin-Key"
+
+
+def admin_authenticated(f):
+    """Decorator for checking that the request carries the admin API key."""
+
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if not config.admin.api_key:
+            raise AuthenticationError(
+                message="The admin API is not enabled.",
+                detail="An admin API key has to be configured to use the admin API.",
+            )
+        key = request.headers.get(_admin_key_header, "")
+        if not hmac.compare_digest(key.encode(), config.admin.api_key.encode()):
+            raise AuthenticationError(
+                message="The admin API key is missing or invalid.",
+                detail=f"The admin API key should be provided in the {_admin_key_header} "
+                "header.",
+            )
+        return f(*args, **kwargs)
+
+    return decorated
+
+
+def _k8s_api():
+    return client.CustomObjectsApi(client.ApiClient())
+
+
+def _list_page(
+    k8s_api, label_selector: Optional[str], limit: int, continue_token: Optional[str]
+) -> Dict[str, Any]:
+    kwargs = {"limit": limit}
+    if label_selector:
+        kwargs["label_selector"] = label_selector
+    if continue_token:
+        kwargs["_continue"] = continue_token
+    with track_dependency("kubernetes", "list"):
+        return k8s_api.list_namespaced_custom_object(
+            group=config.amalthea.group,
+            version=config.amalthea.version,
+            namespace=config.k8s.namespace,
+            plural=config.amalthea.plural,
+            **kwargs,
+        )
+
+
+def _safe_username(js: Dict[str, Any]) -> Optional[str]:
+    prefix = config.session_get_endpoint_annotations.renku_annotation_prefix
+    return js.get("metadata", {}).get("labels", {}).get(f"{prefix}safe-username")
+
+
+def _iter_batches(
+    k8s_api, names: Optional[List[str]], label_selector: Optional[str]
+) -> Iterator[List[Tuple[str, Optional[str]]]]:
+    """Get the names and the safe usernames of the selected sessions one page at a
+    time. The safe username is None for the sessions that are selected by name."""
+    page_size = config.admin.page_size
+    if names:
+        names = iter(dict.fromkeys(names))
+        while True:
+            batch = list(islice(names, page_size))
+            if len(batch) == 0:
+                return
+            yield [(name, None) for name in batch]
+    continue_token = None
+    while True:
+        page = _list_page(k8s_api, label_selector, page_size, continue_token)
+        yield [(js["metadata"]["name"], _safe_username(js)) for js in page["items"]]
+        continue_token = page["metadata"].get("continue")
+        if not continue_token:
+            return
+
+
+def _run_bulk(
+    names: Optional[List[str]],
+    label_selector: Optional[str],
+    operation: Callable[[Any, str, Optional[str]], None],
+) -> Iterator[str]:
+    """Run an operation on the selected sessions concurrently, one page of sessions
+    at a time. Yields newline delimited JSON with the result for each session and a
+    summary at the end."""
+    k8s_api = _k8s_api()
+    summary = {"succeeded": 0, "failed": 0, "not_found": 0}
+
+    def _run(name, safe_username):
+        try:
+            operation(k8s_api, name, safe_username)
+        except ApiException as err:
+            if err.status == 404:
+                return {"name": name, "result": "not_found"}
+            return {"name": name, "result": "failed", "error": err.reason}
+        return {"name": name, "result": "succeeded"}
+
+    with AppContextThreadPoolExecutor(max_workers=config.admin.workers) as executor:
+        for batch in _iter_batches(k8s_api, names, label_selector):
+            futures = [executor.submit(_run, *selected) for selected in batch]
+            for future in as_completed(futures):
+                result = future.result()
+                summary[result["result"]] += 1
+                yield json.dumps(result) + "\n"
+    yield json.dumps({"summary": summary}) + "\n"
+
+
+def _check_selection(names: Optional[List[str]], label_selector: Optional[str]):
+    if not names and not label_selector:
+        raise UserInputError(
+            message="Either the names or a label selector of the sessions is required."
+        )
+
+
+def _ndjson_response(lines: Iterable[str]) -> Response:
+    return Response(
+        stream_with_context(lines),
+        mimetype="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _summarize_session(js: Dict[str, Any]) -> Dict[str, Any]:
+    prefix = config.session_get_endpoint_annotations.renku_annotation_prefix
+    annotations = js["metadata"].get("annotations", {})
+    return {
+        "name": js["metadata"]["name"],
+        "created": js["metadata"].get("creationTimestamp"),
+        "username": annotations.get(f"{prefix}username"),
+        "namespace": annotations.get(f"{prefix}namespace"),
+        "project": annotations.get(f"{prefix}projectName"),
+        "branch": annotations.get(f"{prefix}branch"),
+        "commit_sha": annotations.get(f"{prefix}commit-sha"),
+        "image": js.get("spec", {}).get("jupyterServer", {}).get("image"),
+        "state": js.get("status", {}).get("state"),
+        "culling": js.get("spec", {}).get("culling", {}),
+    }
+
+
+@bp.route("servers", methods=["GET"])
+@use_args(AdminServersListRequest(), location="query", as_kwargs=True)
+@admin_authenticated
+def admin_list_servers(label_selector, limit, continue_token):
+    """
+    List the sessions of all users one page at a time.
+
+    ---
+    get:
+      description: |
+        The sessions of all users, one page at a time. The continue token of the
+        response is passed to the next request to get the next page, it is null on
+        the last page.
+      parameters:
+        - in: query
+          schema: AdminServersListRequest
+      responses:
+        200:
+          description: A page of sessions.
+          content:
+            application/json:
+              schema: AdminServersListResponse
+        401:
+          description: The admin API key is missing or invalid.
+          content:
+            application/json:
+              schema: ErrorResponse
+      security:
+        - admin-key: []
+      tags:
+        - admin
+    """
+    page = _list_page(
+        _k8s_api(), label_selector, limit or config.admin.page_size, continue_token
+    )
+    return AdminServersListResponse().dump(
+        {
+            "servers": [_summarize_session(js) for js in page["items"]],
+            "continue_token": page["metadata"].get("continue") or None,
+        }
+    )
+
+
+@bp.route("servers", methods=["DELETE"])
+@use_args(AdminServersDeleteRequest(), location="json", as_kwargs=True)
+@admin_authenticated
+def admin_delete_servers(names, label_selector, forced):
+    """
+    Delete the sessions with the given names or the ones that match a label selector.
+
+    ---
+    delete:
+      description: |
+        Delete the sessions with the given names or the ones that match a label
+        selector. The progress is streamed while the sessions are deleted.
+      requestBody:
+        content:
+          application/json:
+            schema: AdminServersDeleteRequest
+      responses:
+        200:
+          description: |
+            The result of each session as a line of newline delimited JSON with its
+            name and a result that is succeeded, failed (with an error) or not_found.
+            The last line contains a summary with the number of sessions per result.
+          content:
+            application/x-ndjson:
+              schema:
+                type: string
+        422:
+          description: Neither the names nor a label selector of the sessions are given.
+          content:
+            application/json:
+              schema: ErrorResponse
+        401:
+          description: The admin API key is missing or invalid.
+          content:
+            application/json:
+              schema: ErrorResponse
+      security:
+        - admin-key: []
+      tags:
+        - admin
+    """
+    _check_selection(names, label_selector)
+
+    def _delete(k8s_api, name, safe_username):
+        with track_dependency("kubernetes", "delete"):
+            res = k8s_api.delete_namespaced_custom_object(
+                group=config.amalthea.group,
+                version=config.amalthea.version,
+                namespace=config.k8s.namespace,
+                plural=config.amalthea.plural,
+                name=name,
+                grace_period_seconds=0 if forced else None,
+                body=V1DeleteOptions(propagation_policy="Foreground"),
+            )
+        # NOTE: The response is the deleted session unless it is already gone
+        record_write(name, safe_username or _safe_username(res))
+
+    return _ndjson_response(_run_bulk(names, label_selector, _delete))
+
+
+@bp.route("servers/culling", methods=["PATCH"])
+@use_args(AdminCullingPatchRequest(), location="json", as_kwargs=True)
+@admin_authenticated
+def admin_patch_culling(
+    names, label_selector, idle_seconds_threshold, max_age_seconds_threshold
+):
+    """
+    Change the culling thresholds of the sessions with the given names or the ones
+    that match a label selector.
+
+    ---
+    patch:
+      description: |
+        Change the culling thresholds of the sessions with the given names or the
+        ones that match a label selector. At least one threshold is required, the
+        thresholds that are not given are left unchanged. The progress is streamed
+        while the sessions are patched.
+      requestBody:
+        content:
+          application/json:
+            schema: AdminCullingPatchRequest
+      responses:
+        200:
+          description: |
+            The result of each session as a line of newline delimited JSON with its
+            name and a result that is succeeded, failed (with an error) or not_found.
+            The last line contains a summary with the number of sessions per result.
+          content:
+            application/x-ndjson:
+              schema:
+                type: string
+        422:
+          description: Neither the names nor a label selector of the sessions are given.
+          content:
+            application/json:
+              schema: ErrorResponse
+        401:
+          description: The admin API key is missing or invalid.
+          content:
+            application/json:
+              schema: ErrorResponse
+      security:
+        - admin-key: []
+      tags:
+        - admin
+    """
+    _check_selection(names, label_selector)
+    thresholds = {
+        "idleSecondsThreshold": idle_seconds_threshold,
+        "maxAgeSecondsThreshold": max_age_seconds_threshold,
+    }
+    culling = {key: value for key, value in thresholds.items() if value is not None}
+    if len(culling) == 0:
+        raise UserInputError(message="At least one culling threshold is required.")
+    # NOTE: Custom objects are patched with a JSON merge patch
+    patch = {"spec": {"culling": culling}}
+
+    def _patch(k8s_api, name, safe_username):
+        with track_dependency("kubernetes", "patch"):
+            js = k8s_api.patch_namespaced_custom_object(
+                group=config.amalthea.group,
+                version=config.amalthea.version,
+                namespace=config.k8s.namespace,
+                plural=config.amalthea.plural,
+                name=name,
+                body=patch,
+            )
+        record_write(
+            name,
+            safe_username or _safe_username(js),
+            js["metadata"].get("resourceVersion"),
+        )
+
+    return _ndjson_response(_run_bulk(names, label_selector, _patch))
@@ -2,11 +2,13 @@ from typing import TYPE_CHECKING
 
 from ..classes.user import RegisteredUser
 from ...config import config
+from .utils import memoize_config_patches
 
 if TYPE_CHECKING:
     from renku_notebooks.api.classes.server import UserServer
 
 
+@memoize_config_patches
 def session_tolerations():
     patches = []
     tolerations = [
@@ -33,6 +35,7 @@ def session_tolerations():
     return patches
 
 
+@memoize_config_patches
 def termination_grace_period():
     return [
         {
@@ -48,6 +51,7 @@ def termination_grace_period():
     ]
 
 
+@memoize_config_patches
 def session_affinity():
     return [
         {
@@ -63,6 +67,7 @@ def session_affinity():
     ]
 
 
+@memoize_config_patches
 def session_node_selector():
     return [
         {
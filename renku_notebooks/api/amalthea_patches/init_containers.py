@@ -6,12 +6,34 @@ from kubernetes import client
 
 from ..classes.user import RegisteredUser
 from ...config import config
-from .utils import get_certificates_volume_mounts
+from .utils import get_certificates_volume_mounts, memoize_config_patches
 
 if TYPE_CHECKING:
     from renku_notebooks.api.classes.server import UserServer
 
 
+_reference_cache_volume_name = "git-clone-reference-cache"
+_reference_cache_mount_path = "/reference-cache"
+
+
+def _reference_cache_volume():
+    reference_cache = config.sessions.git_clone.reference_cache
+    if reference_cache.host_path:
+        # NOTE: A directory that does not exist is created owned by root, it has to be
+        # created beforehand to be writable by the init container (see values.yaml).
+        return {
+            "name": _reference_cache_volume_name,
+            "hostPath": {
+                "path": reference_cache.host_path,
+                "type": "DirectoryOrCreate",
+            },
+        }
+    return {
+        "name": _reference_cache_volume_name,
+        "persistentVolumeClaim": {"claimName": reference_cache.claim_name},
+    }
+
+
 def git_clone(server: "UserServer"):
     etc_cert_volume_mount = get_certificates_volume_mounts(
         custom_certs=False,
@@ -28,6 +50,18 @@ def git_clone(server: "UserServer"):
             "name": "GIT_CLONE_LFS_AUTO_FETCH",
             "value": "1" if server.server_options["lfs_auto_fetch"] else "0",
         },
+        {
+            "name": "GIT_CLONE_LFS_INCLUDE",
+            "value": server.server_options.get("lfs_include", ""),
+        },
+        {
+            "name": "GIT_CLONE_LFS_EXCLUDE",
+            "value": server.server_options.get("lfs_exclude", ""),
+        },
+        {
+            "name": "GIT_CLONE_LFS_CONCURRENT_TRANSFERS",
+            "value": str(config.sessions.git_clone.lfs_concurrent_transfers),
+        },
         {"name": "GIT_CLONE_COMMIT_SHA", "value": server.commit_sha},
         {"name": "GIT_CLONE_BRANCH", "value": server.branch},
         {
@@ -76,7 +110,63 @@ def git_clone(server: "UserServer"):
             if config.s3_mounts_enabled and server.cloudstorage
             else "",
         },
+        {"name": "GIT_CLONE_STRATEGY", "value": config.sessions.git_clone.strategy},
+        {"name": "GIT_CLONE_DEPTH", "value": str(config.sessions.git_clone.depth)},
+        {
+            "name": "GIT_CLONE_WAIT_FOR_SERVER_TIMEOUT_SECONDS",
+            "value": str(config.sessions.git_clone.wait_for_server_timeout_seconds),
+        },
+        {
+            "name": "GIT_CLONE_AUTOSAVE_DISCOVERY",
+            "value": config.sessions.git_clone.autosave_discovery,
+        },
     ]
+    if config.sessions.git_clone.shallow_since:
+        env.append(
+            {
+                "name": "GIT_CLONE_SHALLOW_SINCE",
+                "value": config.sessions.git_clone.shallow_since,
+            }
+        )
+    volume_mounts = [
+        {"mountPath": "/work", "name": "workspace"},
+        *etc_cert_volume_mount,
+    ]
+    patches = []
+    reference_cache = config.sessions.git_clone.reference_cache
+    if reference_cache.enabled:
+        env += [
+            {
+                "name": "GIT_CLONE_REFERENCE_CACHE_PATH",
+                "value": _reference_cache_mount_path,
+            },
+            {
+                "name": "GIT_CLONE_REFERENCE_CACHE_LOCK_TIMEOUT_SECONDS",
+                "value": str(reference_cache.lock_timeout_seconds),
+            },
+            {
+                "name": "GIT_CLONE_REFERENCE_CACHE_MAX_AGE_SECONDS",
+                "value": str(reference_cache.max_age_seconds),
+            },
+        ]
+        volume_mounts.append(
+            {
+                "mountPath": _reference_cache_mount_path,
+                "name": _reference_cache_volume_name,
+            }
+        )
+        patches.append(
+            {
+                "type": "application/json-patch+json",
+                "patch": [
+                    {
+                        "op": "add",
+                        "path": "/statefulset/spec/template/spec/volumes/-",
+                        "value": _reference_cache_volume(),
+                    },
+                ],
+            }
+        )
     if type(server._user) is RegisteredUser:
         env += [
             {"name": "GIT_CLONE_USER__EMAIL", "value": server._user.gitlab_user.email},
@@ -103,18 +193,17 @@ def git_clone(server: "UserServer"):
                             "runAsUser": 1000,
                             "runAsNonRoot": True,
                         },
-                        "volumeMounts": [
-                            {"mountPath": "/work", "name": "workspace"},
-                            *etc_cert_volume_mount,
-                        ],
+                        "volumeMounts": volume_mounts,
                         "env": env,
                     },
                 },
             ],
-        }
+        },
+        *patches,
     ]
 
 
+@memoize_config_patches
 def certificates():
     initContainer = client.V1Container(
         name="init-certificates",
@@ -176,13 +265,12 @@ def certificates():
 
 
 def download_image(server: "UserServer"):
-    container = client.V1Container(
-        name="download-image",
-        image=server.verified_image,
-        command=["sh", "-c"],
-        args=["exit", "0"],
-    )
-    api_client = client.ApiClient()
+    container = {
+        "name": "download-image",
+        "image": server.verified_image,
+        "command": ["sh", "-c"],
+        "args": ["exit", "0"],
+    }
     return [
         {
             "type": "application/json-patch+json",
@@ -190,7 +278,7 @@ def download_image(server: "UserServer"):
                 {
                     "op": "add",
                     "path": "/statefulset/spec/template/spec/initContainers/-",
-                    "value": api_client.sanitize_for_serialization(container),
+                    "value": container,
                 },
             ],
         },
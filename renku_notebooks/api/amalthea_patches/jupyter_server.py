@@ -1,5 +1,7 @@
 from typing import TYPE_CHECKING
 
+from .utils import memoize_config_patches
+
 if TYPE_CHECKING:
     from renku_notebooks.api.classes.server import UserServer
 
@@ -78,6 +80,7 @@ def env(server: "UserServer"):
     return patches
 
 
+@memoize_config_patches
 def args():
     patches = []
     patches.append(
@@ -137,6 +140,7 @@ def image_pull_secret(server: "UserServer"):
     return patches
 
 
+@memoize_config_patches
 def disable_service_links():
     return [
         {
@@ -1,8 +1,36 @@
+from copy import deepcopy
+from functools import lru_cache, wraps
+from typing import Callable, List
+
 from kubernetes import client
 
 from ...config import config
 
+_memoized_patches: List[Callable] = []
+
+
+def memoize_config_patches(fn: Callable) -> Callable:
+    """Memoize a function whose patches depend only on the config and its arguments.
+
+    The patches are built once per process and every call returns a deep copy of them
+    so that the caller can modify the returned patches."""
+    memoized = lru_cache(maxsize=None)(fn)
+    _memoized_patches.append(memoized)
+
+    @wraps(fn)
+    def _memoize_config_patches(*args, **kwargs):
+        return deepcopy(memoized(*args, **kwargs))
+
+    return _memoize_config_patches
+
+
+def clear_config_patches_cache():
+    """Clear the patches of all functions decorated with memoize_config_patches."""
+    for memoized in _memoized_patches:
+        memoized.cache_clear()
+
 
+@memoize_config_patches
 def get_certificates_volume_mounts(
     etc_certs: bool = True,
     custom_certs: bool = True,
@@ -1,15 +1,61 @@
+from hashlib import sha256
+from threading import Lock
 from typing import Optional
 from urllib.parse import urlparse
 
-import boto3
-from botocore import UNSIGNED
-from botocore.client import Config
-from botocore.exceptions import ClientError, EndpointConnectionError, NoCredentialsError
-
 from ...config import config
+from ...util.cache import TTLCache
+from ...util.metrics import register_cache, track_dependency
+
+# NOTE: Clients are shared by all the mounts with the same endpoint and credentials,
+# boto3 clients are thread-safe but creating them is slow and uses a lot of memory.
+_s3_clients = TTLCache(
+    maxsize=config.s3_client_cache.max_size, ttl=config.s3_client_cache.ttl_seconds
+)
+_s3_clients_lock = Lock()
+register_cache("s3_client", _s3_clients)
+
+
+def _get_s3_client(endpoint, access_key=None, secret_key=None):
+    """Get a shared boto3 S3 client, public buckets are accessed with unsigned requests.
+    The credentials are hashed so that they are not used as the cache key."""
+    public = access_key is None and secret_key is None
+    key = (
+        endpoint,
+        None if public else sha256(f"{access_key}:{secret_key}".encode()).hexdigest(),
+        "unsigned" if public else "signed",
+    )
+    with _s3_clients_lock:
+        s3_client = _s3_clients.get(key)
+        if s3_client is not None:
+            return s3_client
+        # NOTE: boto3 is imported only when a client is needed because importing it is slow
+        import boto3
+        from botocore import UNSIGNED
+        from botocore.client import Config
+
+        if public:
+            s3_client = boto3.session.Session().client(
+                service_name="s3",
+                endpoint_url=endpoint,
+                config=Config(signature_version=UNSIGNED),
+            )
+        else:
+            s3_client = boto3.session.Session().client(
+                service_name="s3",
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                endpoint_url=endpoint,
+            )
+        _s3_clients.set(key, s3_client)
+        return s3_client
 
 
 class S3mount:
+    """The description of an S3 bucket that is mounted in a session. The S3 client is
+    only created when the bucket has to be checked, i.e. not when a mount is read back
+    from a session resource to be listed."""
+
     def __init__(
         self,
         bucket,
@@ -27,22 +73,13 @@ class S3mount:
         self.public = False
         if self.access_key is None and self.secret_key is None:
             self.public = True
-        if self.public:
-            self.client = boto3.session.Session().client(
-                service_name="s3",
-                endpoint_url=self.endpoint,
-                config=Config(signature_version=UNSIGNED),
-            )
-        else:
-            self.client = boto3.session.Session().client(
-                service_name="s3",
-                aws_access_key_id=self.access_key,
-                aws_secret_access_key=self.secret_key,
-                endpoint_url=self.endpoint,
-            )
         self.mount_folder = mount_folder
         self.__head_bucket = {}
 
+    @property
+    def client(self):
+        return _get_s3_client(self.endpoint, self.access_key, self.secret_key)
+
     def get_manifest_patches(
         self, k8s_res_name, k8s_namespace, labels={}, annotations={}
     ):
@@ -136,8 +173,15 @@ class S3mount:
         exists or not."""
         if self.__head_bucket != {}:
             return self.__head_bucket
+        from botocore.exceptions import (
+            ClientError,
+            EndpointConnectionError,
+            NoCredentialsError,
+        )
+
         try:
-            self.__head_bucket = self.client.head_bucket(Bucket=self.bucket)
+            with track_dependency("s3", "head_bucket"):
+                self.__head_bucket = self.client.head_bucket(Bucket=self.bucket)
         except (ClientError, EndpointConnectionError, NoCredentialsError, ValueError):
             self.__head_bucket = None
         return self.__head_bucket
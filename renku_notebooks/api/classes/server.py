@@ -2,7 +2,9 @@ import base64
 import json
 from functools import lru_cache
 from itertools import chain
-from typing import Any, Dict, List, Optional
+from queue import Empty, Full, Queue
+from threading import Event, Thread
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 from urllib.parse import urljoin, urlparse
 
 import gitlab
@@ -24,7 +26,7 @@ from ...errors.intermittent import (
     DeleteServerError,
     IntermittentError,
 )
-from ...errors.programming import ConfigurationError, FilteringResourcesError
+from ...errors.programming import ConfigurationError
 from ...errors.user import MissingResourceError
 from .s3mount import S3mount
 from .user import RegisteredUser, User
@@ -34,10 +36,35 @@ from ...util.check_image import (
     image_exists,
     parse_image_name,
 )
-from ...util.kubernetes_ import (
-    filter_resources_by_annotations,
-    make_server_name,
-)
+from ...util.concurrency import AppContextThreadPoolExecutor
+from ...util.informer import record_write
+from ...util.kubernetes_ import make_label_value, make_server_name
+from ...util.metrics import LAUNCH_PHASE_DURATION, track_dependency
+from ...util.tracing import Trace
+
+
+def _iter_lines(response, chunk_size=4096, max_line_length=65536) -> Iterator[str]:
+    """Split a streamed HTTP response into lines without reading all of it in memory.
+    Lines longer than max_line_length are split."""
+    buffer = b""
+    for chunk in response.stream(chunk_size, decode_content=True):
+        buffer += chunk
+        *complete, buffer = buffer.split(b"\n")
+        for line in complete:
+            yield line.decode(errors="replace")
+        while len(buffer) > max_line_length:
+            yield buffer[:max_line_length].decode(errors="replace")
+            buffer = buffer[max_line_length:]
+    if buffer:
+        yield buffer.decode(errors="replace")
+
+
+def _get_log_limit_bytes(limit_bytes: Optional[int]) -> Optional[int]:
+    """Cap the number of bytes read from the logs of a single container."""
+    max_bytes = config.sessions.log_max_bytes
+    if max_bytes is None or max_bytes <= 0:
+        return limit_bytes
+    return min(limit_bytes, max_bytes) if limit_bytes is not None else max_bytes
 
 
 class UserServer:
@@ -77,6 +104,10 @@ class UserServer:
         self.cloudstorage: Optional[List[S3mount]] = cloudstorage
         self.gl_project_name = f"{self.namespace}/{self.project}"
         self.js: Optional[Dict[str, Any]] = None
+        # NOTE: Whether all the properties of the server were read from its k8s resource,
+        # a server built from a launch request has properties that differ from it.
+        self.from_k8s = False
+        self.launch_trace = Trace("launch_session")
 
     def _check_flask_config(self):
         """Check the app config and ensure minimum required parameters are present."""
@@ -95,6 +126,12 @@ class UserServer:
     def gl_project(self):
         return self._user.get_renku_project(self.gl_project_name)
 
+    @property
+    def _gl_project_lazy(self):
+        """A GitLab project object that is created without calling the GitLab API. It can
+        only be used to make requests for the subresources of the project (i.e. branches)."""
+        return self._user.gitlab_client.projects.get(self.gl_project_name, lazy=True)
+
     @property
     def server_name(self):
         """Make the name that is used to identify a unique user session"""
@@ -142,9 +179,10 @@ class UserServer:
         """Check if a specific branch exists in the user's gitlab
         project. The branch name is not required by the API and therefore
         passing None to this function will return True."""
-        if self.branch is not None and self.gl_project is not None:
+        if self.branch is not None:
             try:
-                self.gl_project.branches.get(self.branch)
+                with track_dependency("gitlab", "branch"):
+                    self._gl_project_lazy.branches.get(self.branch)
             except Exception as err:
                 current_app.logger.warning(
                     f"Branch {self.branch} cannot be verified or does not exist. {err}"
@@ -155,9 +193,10 @@ class UserServer:
 
     def _commit_sha_exists(self):
         """Check if a specific commit sha exists in the user's gitlab project"""
-        if self.commit_sha is not None and self.gl_project is not None:
+        if self.commit_sha is not None:
             try:
-                self.gl_project.commits.get(self.commit_sha)
+                with track_dependency("gitlab", "commit"):
+                    self._gl_project_lazy.commits.get(self.commit_sha)
             except Exception as err:
                 current_app.logger.warning(
                     f"Commit {self.commit_sha} cannot be verified or does not exist. {err}"
@@ -166,29 +205,33 @@ class UserServer:
                 return True
         return False
 
-    def _verify_image(self):
+    def _verify_image(self, gl_project=None):
         """Set the notebook image if not specified in the request. If specific image
         is requested then confirm it exists and it can be accessed."""
-        if self.gl_project is None:
+        if gl_project is None:
+            gl_project = self.gl_project
+        if gl_project is None:
             return
         image = self.image
         if image is None:
             parsed_image = {
                 "hostname": config.git.registry,
-                "image": self.gl_project.path_with_namespace.lower(),
+                "image": gl_project.path_with_namespace.lower(),
                 "tag": self.commit_sha[:7],
             }
             commit_image = (
                 f"{config.git.registry}/"
-                f"{self.gl_project.path_with_namespace.lower()}"
+                f"{gl_project.path_with_namespace.lower()}"
                 f":{self.commit_sha[:7]}"
             )
         else:
             parsed_image = parse_image_name(image)
         # get token
-        token, is_image_private = get_docker_token(**parsed_image, user=self._user)
+        with self.launch_trace.span("registry_token"):
+            token, is_image_private = get_docker_token(**parsed_image, user=self._user)
         # check if images exist
-        image_exists_result = image_exists(**parsed_image, token=token)
+        with self.launch_trace.span("image_exists"):
+            image_exists_result = image_exists(**parsed_image, token=token)
         # assign image
         if image_exists_result and image is None:
             # the image tied to the commit exists
@@ -212,7 +255,8 @@ class UserServer:
         self.using_default_image = verified_image == config.sessions.default_image
         self.verified_image = verified_image
         self.is_image_private = is_image_private
-        image_workdir = get_image_workdir(**parsed_image, token=token)
+        with self.launch_trace.span("image_workdir"):
+            image_workdir = get_image_workdir(**parsed_image, token=token)
         self.image_workdir = (
             image_workdir
             if image_workdir is not None
@@ -380,29 +424,87 @@ class UserServer:
         }
         return manifest
 
-    def start(self):
-        """Create the jupyterserver resource in k8s."""
+    def _run_preflight_checks(self) -> List[str]:
+        """Check that the project, branch, commit and image of the session exist.
+        The checks are independent calls to GitLab and the image registry so they run
+        concurrently, each check is recorded as a span of the launch trace."""
+        trace = self.launch_trace
+
+        def _in_span(name, fn):
+            def _run():
+                with trace.span(name):
+                    return fn()
+
+            return _run
+
+        def _verify_project_image():
+            # NOTE: The image check needs the project path so it reuses the result
+            # of the project check instead of requesting the project again.
+            gl_project = project.result()
+            if gl_project is not None:
+                self._verify_image(gl_project)
+
+        with AppContextThreadPoolExecutor(max_workers=4) as executor:
+            project = executor.submit(_in_span("project", lambda: self.gl_project))
+            branch_exists = executor.submit(_in_span("branch", self._branch_exists))
+            commit_sha_exists = executor.submit(
+                _in_span("commit", self._commit_sha_exists)
+            )
+            image = executor.submit(_in_span("verify_image", _verify_project_image))
         error = []
-        js = None
-        if self.gl_project is None:
+        if project.result() is None:
             error.append(f"project {self.project} does not exist")
-        if not self._branch_exists():
+        if not branch_exists.result():
             error.append(f"branch {self.branch} does not exist")
-        if not self._commit_sha_exists():
+        if not commit_sha_exists.result():
             error.append(f"commit {self.commit_sha} does not exist")
-        self._verify_image()
+        image.result()
+        return error
+
+    def start(self):
+        """Create the jupyterserver resource in k8s. Returns False if the session
+        already existed, i.e. because it was created by a concurrent request."""
+        try:
+            with self.launch_trace:
+                return self._start()
+        finally:
+            timings = self.launch_trace.timings
+            for phase, seconds in timings.items():
+                LAUNCH_PHASE_DURATION.observe(seconds, phase=phase)
+            current_app.logger.debug(
+                f"Launching the session {self.server_name} took "
+                + ", ".join(f"{name}: {secs:.3f}s" for name, secs in timings.items())
+            )
+
+    def _start(self):
+        with self.launch_trace.span("validate"):
+            error = self._run_preflight_checks()
         if self.verified_image is None:
             error.append(f"image {self.image} does not exist or cannot be accessed")
         if len(error) == 0:
+            with self.launch_trace.span("build_manifest"):
+                manifest = self._get_session_manifest()
             try:
-                js = self._k8s_api_instance.create_namespaced_custom_object(
-                    group=config.amalthea.group,
-                    version=config.amalthea.version,
-                    namespace=self._k8s_namespace,
-                    plural=config.amalthea.plural,
-                    body=self._get_session_manifest(),
-                )
+                with self.launch_trace.span("create_cr"), track_dependency(
+                    "kubernetes", "create"
+                ):
+                    js = self._k8s_api_instance.create_namespaced_custom_object(
+                        group=config.amalthea.group,
+                        version=config.amalthea.version,
+                        namespace=self._k8s_namespace,
+                        plural=config.amalthea.plural,
+                        body=manifest,
+                    )
             except ApiException as e:
+                if e.status == 409:
+                    # NOTE: The session was created by a concurrent request in the meantime,
+                    # launching a session is idempotent so the existing session is returned.
+                    # It is read from k8s because the informer may not have seen it yet.
+                    current_app.logger.info(
+                        f"The session {self.server_name} already exists"
+                    )
+                    if self.get_js(direct=True) is not None:
+                        return False
                 current_app.logger.debug(
                     f"Cannot start the session {self.server_name}, error: {e}"
                 )
@@ -411,6 +513,11 @@ class UserServer:
                 )
             else:
                 self.js = js
+                record_write(
+                    self.server_name,
+                    self._user.safe_username,
+                    js["metadata"].get("resourceVersion"),
+                )
         else:
             raise MissingResourceError(
                 message=(
@@ -418,30 +525,17 @@ class UserServer:
                     f"or Docker resources are missing: {', '.join(error)}"
                 )
             )
-        return js
+        return True
 
     def server_exists(self):
         """Check if the user server exists (i.e. is an actual pod in k8s)."""
         return self.js is not None
 
-    def get_js(self):
-        """Get the js resource of the user jupyter user session from k8s."""
-        prefix = config.session_get_endpoint_annotations.renku_annotation_prefix
-        jss = filter_resources_by_annotations(
-            self._user.jss,
-            {f"{prefix}servername": self.server_name},
-        )
-        if len(jss) == 0:
-            self.js = None
-            return None
-        elif len(jss) == 1:
-            self.js = jss[0]
-            return jss[0]
-        else:  # more than one pod was matched
-            raise FilteringResourcesError(
-                message=f"The user session matches {len(jss)} k8s jupyterserver resources, "
-                "it should match only one."
-            )
+    def get_js(self, direct=False):
+        """Get the js resource of the user jupyter user session from k8s. With direct
+        the resource is always read from the k8s API instead of the informer cache."""
+        self.js = self._user.get_js(self.server_name, direct=direct)
+        return self.js
 
     def set_js(self, js):
         self.js = js
@@ -449,28 +543,29 @@ class UserServer:
     def stop(self, forced=False):
         """Stop user's server with specific name"""
         try:
-            status = self._k8s_api_instance.delete_namespaced_custom_object(
-                group=config.amalthea.group,
-                version=config.amalthea.version,
-                namespace=self._k8s_namespace,
-                plural=config.amalthea.plural,
-                name=self.server_name,
-                grace_period_seconds=0 if forced else None,
-                body=V1DeleteOptions(propagation_policy="Foreground"),
-            )
+            with track_dependency("kubernetes", "delete"):
+                status = self._k8s_api_instance.delete_namespaced_custom_object(
+                    group=config.amalthea.group,
+                    version=config.amalthea.version,
+                    namespace=self._k8s_namespace,
+                    plural=config.amalthea.plural,
+                    name=self.server_name,
+                    grace_period_seconds=0 if forced else None,
+                    body=V1DeleteOptions(propagation_policy="Foreground"),
+                )
         except ApiException:
             raise DeleteServerError()
         else:
+            record_write(self.server_name, self._user.safe_username)
             return status
 
-    def get_logs(self, max_log_lines=0):
-        """Get the logs of all containers in the server pod."""
+    def _get_log_containers(self):
+        """Get the name of the main pod of the server and the names of its containers."""
         js = self.js
         if js is None:
             raise MissingResourceError(
                 f"The server {self.server_name} cannot be found."
             )
-        output = {}
         pod_name = js.get("status", {}).get("mainPod", {}).get("name")
         if not pod_name:
             raise MissingResourceError(
@@ -480,27 +575,159 @@ class UserServer:
         all_containers = js["status"]["mainPod"].get("status", {}).get(
             "containerStatuses", []
         ) + js["status"]["mainPod"].get("status", {}).get("initContainerStatuses", [])
-        for container in all_containers:
-            container_name = container["name"]
+        return pod_name, [container["name"] for container in all_containers]
+
+    def get_logs(self, max_log_lines=0, limit_bytes=None):
+        """Get the logs of all containers in the server pod. The logs of the containers
+        are read concurrently and the logs of each container are limited to limit_bytes,
+        which cannot exceed the maximum set in the config."""
+        pod_name, container_names = self._get_log_containers()
+        limit_bytes = _get_log_limit_bytes(limit_bytes)
+
+        def _read_container_logs(container_name):
             try:
-                logs = self._k8s_client.read_namespaced_pod_log(
-                    pod_name,
-                    self._k8s_namespace,
-                    container=container_name,
-                    tail_lines=max_log_lines if max_log_lines > 0 else None,
-                    timestamps=True,
-                )
+                with track_dependency("kubernetes", "logs"):
+                    return self._k8s_client.read_namespaced_pod_log(
+                        pod_name,
+                        self._k8s_namespace,
+                        container=container_name,
+                        tail_lines=max_log_lines if max_log_lines > 0 else None,
+                        limit_bytes=limit_bytes,
+                        timestamps=True,
+                    )
             except ApiException as err:
                 if err.status in [400, 404]:
-                    continue  # container does not exist or is not ready yet
+                    return None  # container does not exist or is not ready yet
                 else:
                     raise IntermittentError(
                         f"Logs cannot be read for server {self.server_name}."
                     )
-            else:
-                output[container_name] = logs
 
-        return output
+        max_workers = max(
+            1, min(len(container_names), config.sessions.log_fetch_workers)
+        )
+        with AppContextThreadPoolExecutor(max_workers=max_workers) as executor:
+            logs = dict(
+                zip(
+                    container_names, executor.map(_read_container_logs, container_names)
+                )
+            )
+        return {name: output for name, output in logs.items() if output is not None}
+
+    def stream_logs(
+        self,
+        containers: Optional[List[str]] = None,
+        follow: bool = False,
+        since_seconds: Optional[int] = None,
+        max_log_lines: Optional[int] = None,
+        limit_bytes: Optional[int] = None,
+    ) -> Iterator[Optional[Tuple[str, str]]]:
+        """Stream the logs of the containers in the server pod as (container, line)
+        tuples. The logs of all containers are read concurrently and interleaved in the
+        order in which the lines arrive. Only a bounded number of lines is buffered so
+        reading stops when the consumer of the logs is slower than the containers.
+        None is yielded when no line arrived for a while, so that the consumer can
+        check that its client is still connected."""
+        pod_name, container_names = self._get_log_containers()
+        if containers:
+            container_names = [name for name in container_names if name in containers]
+        if len(container_names) == 0:
+            raise MissingResourceError(
+                f"None of the requested containers of the server {self.server_name} "
+                "can be found."
+            )
+        return self._stream_container_logs(
+            pod_name,
+            container_names,
+            follow,
+            since_seconds,
+            max_log_lines,
+            limit_bytes,
+        )
+
+    def _stream_container_logs(
+        self,
+        pod_name,
+        container_names,
+        follow,
+        since_seconds,
+        max_log_lines,
+        limit_bytes,
+    ) -> Iterator[Optional[Tuple[str, str]]]:
+        lines: Queue = Queue(maxsize=config.sessions.log_stream_buffer_lines)
+        stop = Event()
+        responses = []
+
+        def _put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    lines.put(item, timeout=1)
+                except Full:
+                    continue
+                return True
+            return False
+
+        def _read_container_logs(container_name):
+            response = None
+            try:
+                response = self._k8s_client.read_namespaced_pod_log(
+                    pod_name,
+                    self._k8s_namespace,
+                    container=container_name,
+                    follow=follow,
+                    since_seconds=since_seconds,
+                    tail_lines=max_log_lines,
+                    limit_bytes=limit_bytes,
+                    timestamps=True,
+                    _preload_content=False,
+                )
+                responses.append(response)
+                if stop.is_set():
+                    return
+                for line in _iter_lines(response):
+                    if not _put((container_name, line)):
+                        break
+            except ApiException as err:
+                if err.status not in [400, 404]:
+                    _put((container_name, err))
+            except Exception as err:
+                if not stop.is_set():
+                    _put((container_name, err))
+            finally:
+                if response is not None:
+                    response.release_conn()
+                _put((container_name, None))
+
+        readers = [
+            Thread(target=_read_container_logs, args=(name,), daemon=True)
+            for name in container_names
+        ]
+        for reader in readers:
+            reader.start()
+        try:
+            running = len(readers)
+            while running > 0:
+                try:
+                    container_name, line = lines.get(
+                        timeout=config.sessions.events_heartbeat_seconds
+                    )
+                except Empty:
+                    yield None
+                    continue
+                if line is None:
+                    running -= 1
+                elif isinstance(line, Exception):
+                    current_app.logger.warning(
+                        f"Streaming the logs of {container_name} in {self.server_name} "
+                        f"failed: {line}"
+                    )
+                else:
+                    yield container_name, line
+        finally:
+            stop.set()
+            # NOTE: Closing the responses unblocks the readers that wait for new lines
+            for response in responses:
+                response.close()
 
     @property
     def server_url(self) -> str:
@@ -533,18 +760,14 @@ class UserServer:
             S3mount.s3mounts_from_js(js),
         )
         server.set_js(js)
+        server.from_k8s = True
         return server
 
     @classmethod
     def from_server_name(cls, user, server_name):
         """Create a Server instance from a Jupyter server name."""
-        jss = user.jss
-        prefix = config.session_get_endpoint_annotations.renku_annotation_prefix
-        jss = filter_resources_by_annotations(
-            jss,
-            {f"{prefix}servername": server_name},
-        )
-        if len(jss) == 0:
+        js = user.get_js(server_name)
+        if js is None:
             raise MissingResourceError(
                 f"The server {server_name} cannot be found.",
                 detail=(
@@ -553,12 +776,6 @@ class UserServer:
                     "the server you are requesting."
                 ),
             )
-        if len(jss) > 1:
-            raise FilteringResourcesError(
-                f"Filtering servers for {server_name} matched too many servers. "
-                f"Expected 1 match but got {len(jss)} matches. This is a bug."
-            )
-        js = jss[0]
         return cls.from_js(user, js)
 
     @staticmethod
@@ -604,6 +821,10 @@ class UserServer:
                     for env in patch.get("value", {}).get("env", []):
                         if env.get("name") == "GIT_CLONE_LFS_AUTO_FETCH":
                             server_options["lfs_auto_fetch"] = env.get("value") == "1"
+                        elif env.get("name") == "GIT_CLONE_LFS_INCLUDE":
+                            server_options["lfs_include"] = env.get("value", "")
+                        elif env.get("name") == "GIT_CLONE_LFS_EXCLUDE":
+                            server_options["lfs_exclude"] = env.get("value", "")
         return {
             **config.server_options.defaults,
             **server_options,
@@ -672,7 +893,30 @@ class UserServer:
             f"{prefix}commit-sha": self.commit_sha,
             f"{prefix}gitlabProjectId": None,
             f"{prefix}safe-username": self._user.safe_username,
+            f"{prefix}schemaVersion": str(config.current_resource_schema_version),
+            **self.get_filter_labels(self.namespace, self.project, self.branch),
         }
         if self.gl_project is not None:
             labels[f"{prefix}gitlabProjectId"] = str(self.gl_project.id)
         return labels
+
+    @staticmethod
+    def get_filter_labels(
+        namespace: Optional[str] = None,
+        project: Optional[str] = None,
+        branch: Optional[str] = None,
+        commit_sha: Optional[str] = None,
+    ) -> Dict[str, str]:
+        """The labels that are used to select the sessions of a project, branch or commit.
+        The project and namespace are not case sensitive in GitLab so they are lowercased."""
+        prefix = config.session_get_endpoint_annotations.renku_annotation_prefix
+        labels = {}
+        if namespace is not None:
+            labels[f"{prefix}namespace-hash"] = make_label_value(namespace.lower())
+        if project is not None:
+            labels[f"{prefix}project-hash"] = make_label_value(project.lower())
+        if branch is not None:
+            labels[f"{prefix}branch-hash"] = make_label_value(branch)
+        if commit_sha is not None:
+            labels[f"{prefix}commit-sha"] = commit_sha
+        return labels
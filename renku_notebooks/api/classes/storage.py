@@ -2,27 +2,38 @@ from abc import abstractmethod
 from datetime import datetime
 import re
 
-import requests
 from flask import current_app
 from gitlab.exceptions import GitlabError
 
 from ...config import config
+from ...util.http_session import get_http_session
 
 
 class Autosave:
-    def __init__(self, user, namespace_project, root_branch_name, root_commit_sha):
+    def __init__(
+        self,
+        user,
+        namespace_project,
+        root_branch_name,
+        root_commit_sha,
+        gl_project=None,
+    ):
         self.user = user
         self.namespace_project = namespace_project
         self.namespace = "/".join(self.namespace_project.split("/")[:-1])
         self.project = self.namespace_project.split("/")[-1]
-        self.gl_project = self.user.get_renku_project(self.namespace_project)
+        self.gl_project = (
+            gl_project
+            if gl_project is not None
+            else self.user.get_renku_project(self.namespace_project)
+        )
         self.root_branch_name = root_branch_name
         self.root_commit_sha = root_commit_sha
 
     def _root_commit_is_parent_of(self, commit_sha):
         if not self.gl_project:
             return False
-        res = requests.get(
+        res = get_http_session().get(
             headers={"Authorization": f"Bearer {self.user.git_token}"},
             url=f"{config.git.url}/api/v4/"
             f"projects/{self.gl_project.id}/repository/merge_base",
@@ -70,19 +81,34 @@ class AutosaveBranch(Autosave):
         root_branch_name,
         root_commit_sha,
         final_commit_sha,
+        gl_project=None,
+        committed_date=None,
     ):
-        super().__init__(user, namespace_project, root_branch_name, root_commit_sha)
+        super().__init__(
+            user, namespace_project, root_branch_name, root_commit_sha, gl_project
+        )
         self.final_commit_sha = final_commit_sha
         self.name = (
             f"renku/autosave/{self.user.username}/{root_branch_name}/"
             f"{root_commit_sha[:7]}/{final_commit_sha[:7]}"
         )
+        self._committed_date = committed_date
+
+    @property
+    def creation_date(self):
+        """The date of the last commit on the autosave branch. When the branch was not
+        instantiated from a branch listing the branch is requested from GitLab."""
+        if self._committed_date is None:
+            try:
+                self._committed_date = self.gl_project.branches.get(self.name).commit[
+                    "committed_date"
+                ]
+            except (GitlabError, AttributeError):
+                return None
         try:
-            self.creation_date = datetime.fromisoformat(
-                self.gl_project.branches.get(self.name).commit["committed_date"]
-            )
-        except (GitlabError, AttributeError):
-            self.creation_date = None
+            return datetime.fromisoformat(self._committed_date)
+        except ValueError:
+            return None
 
     def delete(self):
         try:
@@ -93,7 +119,14 @@ class AutosaveBranch(Autosave):
             return self.name
 
     @classmethod
-    def from_name(cls, user, namespace_project, autosave_name):
+    def from_name(
+        cls,
+        user,
+        namespace_project,
+        autosave_name,
+        gl_project=None,
+        committed_date=None,
+    ):
         match_res = re.match(cls.branch_name_regex, autosave_name)
         if match_res is None:
             current_app.logger.warning(
@@ -112,6 +145,8 @@ class AutosaveBranch(Autosave):
             match_res.group("root_branch_name"),
             match_res.group("root_commit_sha"),
             match_res.group("final_commit_sha"),
+            gl_project=gl_project,
+            committed_date=committed_date,
         )
 
     def __str__(self):
@@ -2,8 +2,11 @@ import base64
 import json
 import re
 from abc import ABC, abstractmethod
-from functools import lru_cache
-from typing import Optional
+from copy import deepcopy
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
+from queue import Empty
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import escapism
 import jwt
@@ -11,11 +14,30 @@ from flask import current_app
 from gitlab import Gitlab
 from gitlab.exceptions import GitlabListError
 from gitlab.v4.objects.projects import Project
-from kubernetes import client
+from kubernetes import client, watch
+from kubernetes.client.exceptions import ApiException
 
 from ...config import config
 from .storage import AutosaveBranch
 from ...errors.programming import ConfigurationError
+from ...util.cache import TTLCache
+from ...util.concurrency import AppContextThreadPoolExecutor
+from ...util.http_session import get_http_session
+from ...util.informer import get_informer
+from ...util.metrics import register_cache, track_dependency
+
+_cached_project_attributes = [
+    "id",
+    "path",
+    "path_with_namespace",
+    "http_url_to_repo",
+    "web_url",
+    "permissions",
+]
+_project_cache = TTLCache(
+    maxsize=config.project_cache.max_size, ttl=config.project_cache.ttl_seconds
+)
+register_cache("gitlab_project", _project_cache)
 
 
 class User(ABC):
@@ -23,35 +45,244 @@ class User(ABC):
     def get_autosaves(self, *args, **kwargs):
         pass
 
+    def cleanup_autosaves(self, namespace_project, session_commit_sha):
+        """Delete the autosaves of a project whose root commit is an ancestor of the
+        commit a session was started from. The autosaves that share the same root
+        commit are checked with a single merge base request to GitLab."""
+        autosaves_by_root_commit = defaultdict(list)
+        for autosave in self.get_autosaves(namespace_project):
+            autosaves_by_root_commit[autosave.root_commit_sha].append(autosave)
+        for autosaves in autosaves_by_root_commit.values():
+            if autosaves[0]._root_commit_is_parent_of(session_commit_sha):
+                for autosave in autosaves:
+                    autosave.delete()
+
     def setup_k8s(self):
         self._k8s_client, self._k8s_namespace = config.k8s.client, config.k8s.namespace
         self._k8s_api_instance = client.CustomObjectsApi(client.ApiClient())
 
+    def _get_synced_informer(self, server_name=None):
+        """Get the informer if the servers of the user (or the server with the given
+        name) can be read from it. They cannot if the informer is not in sync or if it
+        has not yet seen the writes this process made to the servers."""
+        informer = get_informer()
+        if (
+            informer is None
+            or not informer.has_synced
+            or informer.has_pending_writes(self.safe_username, server_name)
+        ):
+            return None
+        return informer
+
     @property
     def jss(self):
         """Get a list of k8s jupyterserver objects for all the active servers of a user."""
+        informer = self._get_synced_informer()
+        if informer is not None:
+            return informer.list(self.safe_username)
         label_selector = (
             config.session_get_endpoint_annotations.renku_annotation_prefix
             + f"safe-username={self.safe_username}"
         )
-        jss = self._k8s_api_instance.list_namespaced_custom_object(
-            group=config.amalthea.group,
-            version=config.amalthea.version,
-            namespace=self._k8s_namespace,
-            plural=config.amalthea.plural,
-            label_selector=label_selector,
-        )
+        with track_dependency("kubernetes", "list"):
+            jss = self._k8s_api_instance.list_namespaced_custom_object(
+                group=config.amalthea.group,
+                version=config.amalthea.version,
+                namespace=self._k8s_namespace,
+                plural=config.amalthea.plural,
+                label_selector=label_selector,
+            )
         return jss["items"]
 
-    @lru_cache(maxsize=8)
-    def get_renku_project(self, namespace_project) -> Optional[Project]:
-        """Retrieve the GitLab project."""
-        try:
-            return self.gitlab_client.projects.get("{0}".format(namespace_project))
-        except Exception as e:
-            current_app.logger.warning(
-                f"Cannot get project: {namespace_project} for user: {self.username}, error: {e}"
+    def get_jss(
+        self,
+        labels: Optional[Dict[str, str]] = None,
+        limit: Optional[int] = None,
+        continue_token: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get the k8s jupyterserver objects of the user that have the given labels.
+
+        When a limit is given the servers are listed one page at a time, the returned
+        continue token is used to get the next page and it is None on the last page."""
+        labels = labels or {}
+        informer = self._get_synced_informer()
+        if limit is None and informer is not None:
+            jss = [
+                js
+                for js in informer.list(self.safe_username)
+                if all(
+                    js["metadata"].get("labels", {}).get(key) == value
+                    for key, value in labels.items()
+                )
+            ]
+            return jss, None
+        label_selector = ",".join(
+            f"{key}={value}"
+            for key, value in {
+                config.session_get_endpoint_annotations.renku_annotation_prefix
+                + "safe-username": self.safe_username,
+                **labels,
+            }.items()
+        )
+        kwargs = {}
+        if limit is not None:
+            kwargs["limit"] = limit
+        if continue_token:
+            kwargs["_continue"] = continue_token
+        with track_dependency("kubernetes", "list"):
+            jss = self._k8s_api_instance.list_namespaced_custom_object(
+                group=config.amalthea.group,
+                version=config.amalthea.version,
+                namespace=self._k8s_namespace,
+                plural=config.amalthea.plural,
+                label_selector=label_selector,
+                **kwargs,
             )
+        return jss["items"], jss["metadata"].get("continue") or None
+
+    def watch_jss(
+        self, resource_version: Optional[str] = None
+    ) -> Iterator[Optional[Tuple[str, Any]]]:
+        """Get the changes to the k8s jupyterserver objects of the user.
+
+        Yields a ("RESET", jss) tuple with all the servers of the user first, followed by
+        (event_type, js) tuples where the event type is ADDED, MODIFIED or DELETED. The
+        jss of the reset are in the format of a k8s list response, with the items and the
+        resource version they were listed at. The reset is repeated if the changes cannot
+        be followed without missing any. When the changes are resumed from a resource
+        version the first reset is skipped, this is only possible without the informer
+        which does not keep a history of the changes. None is yielded when there are no
+        changes for a while so that the caller can check if it should stop."""
+        informer = get_informer()
+        if informer is not None and informer.has_synced:
+            yield from self._watch_jss_from_informer(informer)
+        else:
+            yield from self._watch_jss_from_k8s(resource_version)
+
+    def _watch_jss_from_informer(self, informer):
+        def _reset():
+            items, resource_version = informer.snapshot(self.safe_username)
+            return "RESET", {
+                "items": items,
+                "metadata": {"resourceVersion": resource_version},
+            }
+
+        subscription = informer.subscribe(self.safe_username)
+        try:
+            yield _reset()
+            while True:
+                if subscription.overflowed or not informer.has_synced:
+                    subscription.overflowed = False
+                    informer.wait_for_sync(config.sessions.events_heartbeat_seconds)
+                    yield _reset()
+                try:
+                    yield subscription.events.get(
+                        timeout=config.sessions.events_heartbeat_seconds
+                    )
+                except Empty:
+                    yield None
+        finally:
+            informer.unsubscribe(subscription)
+
+    def _watch_jss_from_k8s(self, resource_version=None):
+        label_selector = (
+            config.session_get_endpoint_annotations.renku_annotation_prefix
+            + f"safe-username={self.safe_username}"
+        )
+        while True:
+            if resource_version is None:
+                with track_dependency("kubernetes", "list"):
+                    jss = self._k8s_api_instance.list_namespaced_custom_object(
+                        group=config.amalthea.group,
+                        version=config.amalthea.version,
+                        namespace=self._k8s_namespace,
+                        plural=config.amalthea.plural,
+                        label_selector=label_selector,
+                    )
+                resource_version = jss["metadata"]["resourceVersion"]
+                yield "RESET", jss
+            try:
+                for event in watch.Watch().stream(
+                    self._k8s_api_instance.list_namespaced_custom_object,
+                    group=config.amalthea.group,
+                    version=config.amalthea.version,
+                    namespace=self._k8s_namespace,
+                    plural=config.amalthea.plural,
+                    label_selector=label_selector,
+                    resource_version=resource_version,
+                    allow_watch_bookmarks=True,
+                    timeout_seconds=config.sessions.events_heartbeat_seconds,
+                ):
+                    js = event["raw_object"]
+                    resource_version = js["metadata"]["resourceVersion"]
+                    if event["type"] in ["ADDED", "MODIFIED", "DELETED"]:
+                        yield event["type"], js
+            except ApiException as err:
+                if err.status != 410:
+                    raise
+                # NOTE: The resource version expired, all servers have to be listed again
+                resource_version = None
+                continue
+            yield None
+
+    def get_js(self, server_name, direct=False) -> Optional[Dict[str, Any]]:
+        """Get the k8s jupyterserver object with the given name if it belongs to the user.
+
+        The object is read from the k8s API instead of the informer if direct is set,
+        i.e. to check if a server that was just created by someone else exists."""
+        informer = None if direct else self._get_synced_informer(server_name)
+        if informer is not None:
+            js = informer.get(server_name)
+        else:
+            try:
+                with track_dependency("kubernetes", "get"):
+                    js = self._k8s_api_instance.get_namespaced_custom_object(
+                        group=config.amalthea.group,
+                        version=config.amalthea.version,
+                        namespace=self._k8s_namespace,
+                        plural=config.amalthea.plural,
+                        name=server_name,
+                    )
+            except ApiException as err:
+                if err.status == 404:
+                    return None
+                raise
+        username_label = (
+            config.session_get_endpoint_annotations.renku_annotation_prefix
+            + "safe-username"
+        )
+        if (
+            js is None
+            or js["metadata"].get("labels", {}).get(username_label)
+            != self.safe_username
+        ):
+            return None
+        return js
+
+    def get_renku_project(self, namespace_project) -> Optional[Project]:
+        """Retrieve the GitLab project.
+
+        The metadata of the project is cached per user for all requests handled by this
+        process, projects that cannot be retrieved are not cached."""
+        cache_key = (self.id, namespace_project)
+        attributes = _project_cache.get(cache_key)
+        if attributes is None:
+            try:
+                with track_dependency("gitlab", "project"):
+                    project = self.gitlab_client.projects.get(
+                        "{0}".format(namespace_project)
+                    )
+            except Exception as e:
+                current_app.logger.warning(
+                    f"Cannot get project: {namespace_project} for user: {self.username}, "
+                    f"error: {e}"
+                )
+                return None
+            attributes = {
+                key: project.attributes.get(key) for key in _cached_project_attributes
+            }
+            _project_cache.set(cache_key, attributes)
+        return Project(self.gitlab_client.projects, deepcopy(attributes))
 
 
 class AnonymousUser(User):
@@ -69,7 +300,9 @@ class AnonymousUser(User):
         if not self.authenticated:
             return
         self.git_url = config.git.url
-        self.gitlab_client = Gitlab(self.git_url, api_version=4, per_page=50)
+        self.gitlab_client = Gitlab(
+            self.git_url, api_version=4, per_page=50, session=get_http_session()
+        )
         self.username = headers[self.auth_header]
         self.safe_username = escapism.escape(self.username, escape_char="-").lower()
         self.full_name = None
@@ -117,6 +350,7 @@ class RegisteredUser(User):
             api_version=4,
             oauth_token=self.git_token,
             per_page=50,
+            session=get_http_session(),
         )
         self.setup_k8s()
 
@@ -145,38 +379,58 @@ class RegisteredUser(User):
         git_token = token_match.group(1) if token_match is not None else None
         return git_url, git_credentials["AuthorizationHeader"], git_token
 
-    def get_autosaves(self, namespace_project=None):
-        """Get a list of autosaves for all projects for the user"""
-        gl_project = (
-            self.get_renku_project(namespace_project)
-            if namespace_project is not None
-            else None
-        )
-        projects = []
-        autosaves = []
-        # add any autosave branches, regardless of wheter pvcs are supported or not
+    def get_autosaves(self, namespace_project=None) -> Iterator[AutosaveBranch]:
+        """Get the autosaves of the user for a single project or for all projects.
+
+        The autosave branches of different projects are listed concurrently and the
+        autosaves of each project are yielded as soon as its branches are listed."""
         if namespace_project is None:  # get autosave branches from all projects
             projects = self.gitlab_client.projects.list(iterator=True)
-        elif gl_project:
-            projects.append(gl_project)
-        for project in projects:
-            try:
-                branches = project.branches.list(
-                    search="^renku/autosave/", iterator=True
+        else:
+            gl_project = self.get_renku_project(namespace_project)
+            projects = [gl_project] if gl_project else []
+        max_workers = config.sessions.autosave_discovery_workers
+        with AppContextThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = set()
+            for project in projects:
+                pending.add(executor.submit(self._get_project_autosaves, project))
+                # NOTE: Bound the number of projects that are queued while the
+                # listing of all projects is paginated through
+                if len(pending) >= 2 * max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            for future in as_completed(pending):
+                yield from future.result()
+
+    def _get_project_autosaves(self, project) -> List[AutosaveBranch]:
+        """Get the autosaves of the user in a single project. The date of each autosave is
+        taken from the commit included in the branch listing."""
+        try:
+            with track_dependency("gitlab", "branches"):
+                branches = list(
+                    project.branches.list(search="^renku/autosave/", iterator=True)
                 )
-            except GitlabListError:
-                branches = []
-            for branch in branches:
-                autosave = AutosaveBranch.from_name(
-                    self, namespace_project, branch.name
+        except GitlabListError:
+            branches = []
+        autosaves = []
+        for branch in branches:
+            autosave = AutosaveBranch.from_name(
+                self,
+                project.path_with_namespace,
+                branch.name,
+                gl_project=project,
+                committed_date=(branch.attributes.get("commit") or {}).get(
+                    "committed_date"
+                ),
+            )
+            if autosave is not None:
+                autosaves.append(autosave)
+            else:
+                current_app.logger.warning(
+                    f"Autosave branch {branch.name} for "
+                    f"project {project.path_with_namespace} cannot be instantiated."
                 )
-                if autosave is not None:
-                    autosaves.append(autosave)
-                else:
-                    current_app.logger.warning(
-                        f"Autosave branch {branch.name} for "
-                        f"project {namespace_project} cannot be instantiated."
-                    )
         return autosaves
 
     def __str__(self):
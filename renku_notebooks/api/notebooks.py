@@ -16,7 +16,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Notebooks service API."""
-from flask import Blueprint, current_app, request, make_response
+import json
+import re
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from math import ceil
+
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    make_response,
+    request,
+    stream_with_context,
+)
 from marshmallow import validate
 from webargs import fields
 from webargs.flaskparser import use_args
@@ -35,11 +48,26 @@ from ..errors.user import ImageParseError, MissingResourceError, UserInputError
 from .schemas.autosave import AutosavesList
 from .schemas.config_server_options import ServerOptionsEndpointResponse
 from .schemas.logs import ServerLogs
-from .schemas.servers_get import NotebookResponse, ServersGetRequest, ServersGetResponse
+from .schemas.servers_get import (
+    NotebookResponse,
+    ServersGetRequest,
+    ServersGetResponse,
+    ServersListRequest,
+    ServersSummaryResponse,
+)
 from .schemas.servers_post import LaunchNotebookRequest
 from .schemas.version import VersionResponse
+from ..util.kubernetes_ import hold_lease
+from ..util.metrics import register_work_queue
+from ..util.single_flight import SingleFlight
+from ..util.work_queue import WorkQueue
 
 bp = Blueprint("notebooks_blueprint", __name__, url_prefix=config.service_prefix)
+autosave_cleanup_queue = WorkQueue(
+    "autosave-cleanup", maxsize=config.sessions.autosave_cleanup_queue_size
+)
+register_work_queue(autosave_cleanup_queue)
+launch_single_flight = SingleFlight()
 
 
 @bp.route("/version")
@@ -73,34 +101,153 @@ def version():
 
 
 @bp.route("servers", methods=["GET"])
-@use_args(ServersGetRequest(), location="query", as_kwargs=True)
+@use_args(ServersListRequest(), location="query", as_kwargs=True)
 @authenticated
-def user_servers(user, **query_params):
+def user_servers(user, limit=None, continue_token=None, light=False, **query_params):
     """
     Return a JSON of running servers for the user.
 
     ---
     get:
-      description: Information about all active servers for a user.
+      description: |
+        Information about all active servers for a user. When a limit is set the
+        servers are returned one page at a time, the continue token of the response
+        is passed in the next request (with the same limit) to get the next page. In
+        the light mode only a summary of each server is returned (see
+        ServersSummaryResponse), without the details of its status and its resources.
       parameters:
         - in: query
-          schema: ServersGetRequest
+          schema: ServersListRequest
       responses:
         200:
           description: Map of all servers for a user.
           content:
             application/json:
               schema: ServersGetResponse
+        422:
+          description: A continue token is given without a limit.
+          content:
+            application/json:
+              schema: ErrorResponse
       tags:
         - servers
     """
-    servers = [UserServer.from_js(user, js) for js in user.jss]
     filter_attrs = list(filter(lambda x: x[1] is not None, query_params.items()))
+    # NOTE: The filters are applied by k8s with label selectors, the label values of
+    # the project, namespace and branch are hashes so the values are checked again below.
+    jss, continue_token = user.get_jss(
+        UserServer.get_filter_labels(**dict(filter_attrs)), limit, continue_token
+    )
+    page = {"continue_token": continue_token} if limit is not None else {}
+    if light:
+        prefix = config.session_get_endpoint_annotations.renku_annotation_prefix
+        annotation_names = {
+            "namespace": f"{prefix}namespace",
+            "project": f"{prefix}projectName",
+            "branch": f"{prefix}branch",
+            "commit_sha": f"{prefix}commit-sha",
+        }
+        filtered_jss = {}
+        for js in jss:
+            annotations = js["metadata"].get("annotations", {})
+            if all(
+                annotations.get(annotation_names[key]) == value
+                for key, value in filter_attrs
+            ):
+                filtered_jss[js["metadata"]["name"]] = js
+        return ServersSummaryResponse().dump({"servers": filtered_jss, **page})
+    servers = [UserServer.from_js(user, js) for js in jss]
     filtered_servers = {}
     for server in servers:
         if all([getattr(server, key, value) == value for key, value in filter_attrs]):
             filtered_servers[server.server_name] = server
-    return ServersGetResponse().dump({"servers": filtered_servers})
+    return ServersGetResponse().dump({"servers": filtered_servers, **page})
+
+
+@bp.route("servers/events", methods=["GET"])
+@use_args(ServersGetRequest(), location="query", as_kwargs=True)
+@authenticated
+def user_servers_events(user, **query_params):
+    """
+    Stream the changes to the servers of the user as server-sent events.
+
+    ---
+    get:
+      description: |
+        Changes to all active servers for a user as a stream of server-sent events.
+        A servers event with the same data as the response of GET /servers is sent
+        first and whenever the state has to be refreshed, it replaces all the servers
+        that the client knows about. It is followed by added and modified events whose
+        data is a single server and deleted events whose data contains the name of the
+        deleted server. The id of each event is a resource version that can be sent in
+        the Last-Event-ID header to resume the stream after a disconnect. Resuming is
+        not always possible, e.g. when the resource version has expired or the servers
+        are read from the cache of the service, which does not keep a history of the
+        changes. In that case the stream starts again with a servers event and clients
+        must replace their state with it instead of applying it on top of the events
+        they received before the disconnect.
+      parameters:
+        - in: query
+          schema: ServersGetRequest
+        - in: header
+          schema:
+            type: string
+          name: Last-Event-ID
+          required: false
+          description: The id of the last event received, used to resume the stream.
+      responses:
+        200:
+          description: A stream of server-sent events with the changes to the servers.
+          content:
+            text/event-stream:
+              schema:
+                type: string
+      tags:
+        - servers
+    """
+    filter_attrs = list(filter(lambda x: x[1] is not None, query_params.items()))
+    resource_version = request.headers.get("Last-Event-ID") or None
+
+    def _matches(server):
+        return all(
+            [getattr(server, key, value) == value for key, value in filter_attrs]
+        )
+
+    def _events():
+        for event in user.watch_jss(resource_version):
+            if event is None:
+                yield ": heartbeat\n\n"
+                continue
+            event_type, data = event
+            if event_type == "RESET":
+                servers = [UserServer.from_js(user, js) for js in data["items"]]
+                output = ServersGetResponse().dump(
+                    {"servers": {s.server_name: s for s in servers if _matches(s)}}
+                )
+                event_id = data["metadata"].get("resourceVersion")
+                yield (
+                    (f"id: {event_id}\n" if event_id else "")
+                    + f"event: servers\ndata: {json.dumps(output)}\n\n"
+                )
+                continue
+            server = UserServer.from_js(user, data)
+            if not _matches(server):
+                continue
+            if event_type == "DELETED":
+                output = {"name": server.server_name}
+            else:
+                output = NotebookResponse().dump(server)
+            yield (
+                f"id: {data['metadata']['resourceVersion']}\n"
+                f"event: {event_type.lower()}\n"
+                f"data: {json.dumps(output)}\n\n"
+            )
+
+    return Response(
+        stream_with_context(_events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @bp.route("servers/<server_name>", methods=["GET"])
@@ -201,16 +348,46 @@ def launch_notebook(
             detail="This can occur if your username has been changed manually or by an admin.",
         )
 
-    server.get_js()
-    if server.server_exists():
-        return NotebookResponse().dump(server)
+    # NOTE: Concurrent requests to launch the same session (i.e. a double click) share
+    # a single validation and creation of the session and get the same response.
+    response, shared = launch_single_flight.do(
+        server.server_name, _launch_server, user, server
+    )
+    if shared:
+        current_app.logger.debug(
+            f"The launch of {server.server_name} was shared with a concurrent request"
+        )
+    return response
+
 
-    server.start()
+def _launch_server(user, server):
+    lease = (
+        hold_lease(
+            f"{server.server_name}-launch",
+            config.k8s.namespace,
+            config.sessions.launch_lease_seconds,
+        )
+        if config.sessions.launch_lease_enabled
+        else nullcontext()
+    )
+    with lease:
+        # NOTE: The informer may lag behind a session that another replica just created.
+        server.get_js(direct=True)
+        if server.server_exists() or not server.start():
+            return NotebookResponse().dump(server), 200, {}
 
     current_app.logger.debug(f"Server {server.server_name} has been started")
-    for autosave in user.get_autosaves(server.gl_project.path_with_namespace):
-        autosave.cleanup(server.commit_sha)
-    return NotebookResponse().dump(server), 201
+    namespace_project = server.gl_project.path_with_namespace
+    autosave_cleanup_queue.enqueue(
+        (user.id, namespace_project, server.commit_sha),
+        user.cleanup_autosaves,
+        namespace_project,
+        server.commit_sha,
+    )
+    headers = {}
+    if config.tracing.server_timing_enabled:
+        headers["Server-Timing"] = server.launch_trace.server_timing()
+    return NotebookResponse().dump(server), 201, headers
 
 
 @bp.route("servers/<server_name>", methods=["DELETE"])
@@ -293,13 +470,17 @@ def server_options(user):
         "max_lines": fields.Integer(
             load_default=250,
             validate=validate.Range(min=1, max=None, min_inclusive=True),
-        )
+        ),
+        "limit_bytes": fields.Integer(
+            load_default=None,
+            validate=validate.Range(min=1, max=None, min_inclusive=True),
+        ),
     },
     as_kwargs=True,
     location="query",
 )
 @authenticated
-def server_logs(user, max_lines, server_name):
+def server_logs(user, max_lines, limit_bytes, server_name):
     """
     Return the logs of the running server.
 
@@ -322,6 +503,14 @@ def server_logs(user, max_lines, server_name):
           required: false
           description: |
             The maximum number of (most recent) lines to return from the logs.
+        - in: query
+          schema:
+            type: integer
+            minimum: 1
+          name: limit_bytes
+          required: false
+          description: |
+            The maximum number of bytes to return from the logs of each container.
       responses:
         200:
           description: Server logs. An array of strings where each element is a line of the logs.
@@ -338,10 +527,164 @@ def server_logs(user, max_lines, server_name):
     """
     server = UserServer.from_server_name(user, server_name)
     max_lines = request.args.get("max_lines", default=250, type=int)
-    logs = server.get_logs(max_lines)
+    logs = server.get_logs(max_lines, limit_bytes)
     return ServerLogs().dump(logs)
 
 
+@bp.route("logs/<server_name>/stream", methods=["GET"])
+@use_args(
+    {
+        "max_lines": fields.Integer(
+            load_default=250,
+            validate=validate.Range(min=1, max=None, min_inclusive=True),
+        ),
+        "follow": fields.Boolean(load_default=False),
+        "since_seconds": fields.Integer(
+            load_default=None,
+            validate=validate.Range(min=1, max=None, min_inclusive=True),
+        ),
+        "limit_bytes": fields.Integer(
+            load_default=None,
+            validate=validate.Range(min=1, max=None, min_inclusive=True),
+        ),
+        "since_time": fields.AwareDateTime(
+            load_default=None, default_timezone=timezone.utc
+        ),
+        "container": fields.List(fields.String(), load_default=None),
+    },
+    as_kwargs=True,
+    location="query",
+)
+@authenticated
+def server_logs_stream(
+    user,
+    server_name,
+    max_lines,
+    limit_bytes,
+    follow,
+    since_seconds,
+    since_time,
+    container,
+):
+    """
+    Stream the logs of the running server as server-sent events.
+
+    ---
+    get:
+      description: |
+        Server logs as a stream of server-sent events. The name of each event is the
+        name of the container and its data is a single line of the logs. When the
+        stream ends without following the logs a final event called end is sent.
+      parameters:
+        - in: path
+          schema:
+            type: string
+          required: true
+          name: server_name
+          description: The name of the server whose logs should be streamed.
+        - in: query
+          schema:
+            type: integer
+            default: 250
+            minimum: 1
+          name: max_lines
+          required: false
+          description: |
+            The maximum number of (most recent) lines to return from the logs of each
+            container before new lines are streamed.
+        - in: query
+          schema:
+            type: integer
+            minimum: 1
+          name: limit_bytes
+          required: false
+          description: |
+            The maximum number of bytes to stream from the logs of each container.
+        - in: query
+          schema:
+            type: boolean
+            default: false
+          name: follow
+          required: false
+          description: Keep streaming new lines until the client disconnects.
+        - in: query
+          schema:
+            type: integer
+            minimum: 1
+          name: since_seconds
+          required: false
+          description: Only return the lines from the last number of seconds.
+        - in: query
+          schema:
+            type: string
+            format: date-time
+          name: since_time
+          required: false
+          description: |
+            Only return the lines after this time, ignored if since_seconds is given.
+        - in: query
+          schema:
+            type: array
+            items:
+              type: string
+          name: container
+          required: false
+          description: Only stream the logs of these containers.
+      responses:
+        200:
+          description: A stream of server-sent events with the lines of the logs.
+          content:
+            text/event-stream:
+              schema:
+                type: string
+        404:
+          description: The specified server does not exist.
+          content:
+            application/json:
+              schema: ErrorResponse
+      tags:
+        - logs
+    """
+    server = UserServer.from_server_name(user, server_name)
+    if since_seconds is None and since_time is not None:
+        # NOTE: The k8s client only supports the since seconds parameter for logs
+        since_seconds = max(
+            1, ceil((datetime.now(timezone.utc) - since_time).total_seconds())
+        )
+    logs = server.stream_logs(
+        containers=container,
+        follow=follow,
+        since_seconds=since_seconds,
+        max_log_lines=max_lines,
+        limit_bytes=limit_bytes,
+    )
+
+    def _events():
+        try:
+            for item in logs:
+                if item is None:
+                    # NOTE: Writing to a disconnected client fails and closes this
+                    # generator, which closes the logs and stops their readers.
+                    yield ": heartbeat\n\n"
+                    continue
+                container_name, line = item
+                # NOTE: A line break ends the data field of a server-sent event, every
+                # part of a log line (e.g. progress bars that use \r) is sent as its own
+                # data field and the client joins them back with \n.
+                parts = re.split(r"\r\n|\r|\n", line)
+                data = "".join(f"data: {part}\n" for part in parts)
+                yield f"event: {container_name}\n{data}\n"
+            yield "event: end\ndata: \n\n"
+        finally:
+            logs.close()
+
+    return Response(
+        stream_with_context(_events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @bp.route("<path:namespace_project>/autosave", methods=["GET"])
 @authenticated
 def autosave_info(user, namespace_project):
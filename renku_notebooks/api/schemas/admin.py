@@ -0,0 +1,49 @@
+"""Schemas of the requests and responses of the admin endpoints."""
+from marshmallow import Schema, fields, validate
+
+
+class _AdminSelection(Schema):
+    # the names of the sessions
+    names = fields.List(fields.String(), load_default=None)
+    # a k8s label selector that matches the sessions, used if no names are given
+    label_selector = fields.String(load_default=None)
+
+
+class AdminServersListRequest(Schema):
+    label_selector = fields.String(load_default=None)
+    # the maximum number of sessions in a page, the configured page size if not set
+    limit = fields.Integer(load_default=None, validate=validate.Range(min=1, max=1000))
+    # the continue token from the previous page
+    continue_token = fields.String(data_key="continue", load_default=None)
+
+
+class AdminServerSummary(Schema):
+    name = fields.String(required=True)
+    created = fields.String(allow_none=True)
+    username = fields.String(allow_none=True)
+    namespace = fields.String(allow_none=True)
+    project = fields.String(allow_none=True)
+    branch = fields.String(allow_none=True)
+    commit_sha = fields.String(allow_none=True)
+    image = fields.String(allow_none=True)
+    state = fields.String(allow_none=True)
+    culling = fields.Dict()
+
+
+class AdminServersListResponse(Schema):
+    servers = fields.List(fields.Nested(AdminServerSummary()), required=True)
+    # the token to get the next page, null on the last page
+    continue_token = fields.String(data_key="continue", allow_none=True)
+
+
+class AdminServersDeleteRequest(_AdminSelection):
+    forced = fields.Boolean(load_default=False)
+
+
+class AdminCullingPatchRequest(_AdminSelection):
+    idle_seconds_threshold = fields.Integer(
+        load_default=None, validate=validate.Range(min=0)
+    )
+    max_age_seconds_threshold = fields.Integer(
+        load_default=None, validate=validate.Range(min=0)
+    )
@@ -95,6 +95,8 @@ class ServerOptionsDefaults(Schema):
     disk_request = ByteSizeField(required=True)
     lfs_auto_fetch = fields.Bool(required=True)
     gpu_request = GpuField(required=True)
+    lfs_include = fields.Str(required=False, load_default="")
+    lfs_exclude = fields.Str(required=False, load_default="")
 
 
 class CloudStorageServerOption(Schema):
@@ -71,6 +71,13 @@ class LaunchNotebookRequestServerOptions(Schema):
     lfs_auto_fetch = fields.Bool(
         required=False, missing=config.server_options.defaults["lfs_auto_fetch"]
     )
+    # NOTE: Comma separated path patterns of the LFS files that are fetched automatically
+    lfs_include = fields.Str(
+        required=False, missing=config.server_options.defaults["lfs_include"]
+    )
+    lfs_exclude = fields.Str(
+        required=False, missing=config.server_options.defaults["lfs_exclude"]
+    )
     gpu_request = GpuField(
         required=False,
         missing=config.server_options.defaults["gpu_request"],
@@ -1,19 +1,24 @@
 import re
 from collections import OrderedDict
+from copy import deepcopy
 from datetime import datetime
 from enum import Enum
 
 from marshmallow import (
     EXCLUDE,
     Schema,
+    ValidationError,
     fields,
     pre_dump,
     pre_load,
     validate,
+    validates_schema,
 )
 
 from ...config import config
 from ..classes.server import UserServer
+from ...util.cache import TTLCache
+from ...util.metrics import register_cache
 from .cloud_storage import LaunchNotebookResponseS3mount
 from .custom_fields import ByteSizeField, CpuField, GpuField, LowercaseString
 
@@ -91,6 +96,14 @@ class UserPodResources(Schema):
     usage = fields.Nested(ResourceUsage(), required=False)
 
 
+# NOTE: The serialized servers are keyed by the resourceVersion of the k8s resource
+# so they never become stale, they are only evicted when the cache is full. Only servers
+# built from their k8s resource are cached, the image and cloud storage of a server
+# built from a launch request come from the request instead.
+_dumped_servers_cache = TTLCache(maxsize=1024, ttl=None)
+register_cache("server_response", _dumped_servers_cache)
+
+
 class LaunchNotebookResponseWithoutS3(Schema):
     """
     The response sent after a successful creation of a jupyter server. Or
@@ -102,6 +115,35 @@ class LaunchNotebookResponseWithoutS3(Schema):
         # passing unknown params does not error, but the params are ignored
         unknown = EXCLUDE
 
+    def dump(self, obj, *, many=None):
+        """Serialize the server, the output for a server whose k8s resource has not
+        changed since the last time it was serialized is served from a cache."""
+        many = self.many if many is None else bool(many)
+        if many:
+            return [self._dump_server(server) for server in obj]
+        return self._dump_server(obj)
+
+    def _dump_server(self, server):
+        resource_version = (
+            (server.js or {}).get("metadata", {}).get("resourceVersion")
+            if isinstance(server, UserServer) and server.from_k8s
+            else None
+        )
+        if resource_version is None:
+            return super().dump(server, many=False)
+        cache_key = (
+            type(self).__name__,
+            frozenset(self.only or []),
+            frozenset(self.exclude),
+            server.server_name,
+            resource_version,
+        )
+        output = _dumped_servers_cache.get(cache_key)
+        if output is None:
+            output = super().dump(server, many=False)
+            _dumped_servers_cache.set(cache_key, output)
+        return deepcopy(output)
+
     annotations = fields.Nested(config.session_get_endpoint_annotations.schema())
     name = fields.Str()
     state = fields.Dict()
@@ -163,6 +205,7 @@ class LaunchNotebookResponseWithoutS3(Schema):
                 "please stop this session and start a new one with more storage.",
                 204: "Cannot clone repository: Requested branch doesn't exist on remote.",
                 205: "Cannot clone repository: Error fetching submodules.",
+                206: "Cannot clone repository: Error fetching LFS data.",
             }
             return exit_code_msg_xref.get(exit_code, default_server_error_message)
 
@@ -418,7 +461,8 @@ class LaunchNotebookResponseWithoutS3(Schema):
                 "requests": get_resource_requests(server),
                 "usage": get_resource_usage(server),
             },
-            "image": server.image,
+            # NOTE: The image of the resource is the one that was resolved at launch
+            "image": server.js["spec"]["jupyterServer"]["image"],
         }
         if config.s3_mounts_enabled:
             output["cloudstorage"] = server.cloudstorage
@@ -450,6 +494,46 @@ class ServersGetResponse(Schema):
             else LaunchNotebookResponseWithoutS3()
         ),
     )
+    # the token to get the next page of servers, it is null on the last page
+    continue_token = fields.Str(data_key="continue", required=False, allow_none=True)
+
+
+class ServerSummary(Schema):
+    """A server as it is returned by the lightweight listing of servers. It is built
+    from the k8s resource only, without the details of the status or the resources."""
+
+    annotations = fields.Nested(config.session_get_endpoint_annotations.schema())
+    name = fields.Str()
+    started = fields.DateTime(format="iso", allow_none=True)
+    status = fields.Nested(ServerStatus(only=["state"]))
+    image = fields.Str()
+
+    @pre_dump
+    def format_js(self, js, *args, **kwargs):
+        prefix = config.session_get_endpoint_annotations.renku_annotation_prefix
+        annotations = js["metadata"].get("annotations", {})
+        return {
+            "annotations": config.session_get_endpoint_annotations.sanitize_dict(
+                annotations
+            ),
+            "name": annotations.get(f"{prefix}servername", js["metadata"]["name"]),
+            "started": datetime.fromisoformat(
+                re.sub(r"Z$", "+00:00", js["metadata"]["creationTimestamp"])
+            ),
+            "status": {
+                "state": js.get("status", {}).get("state")
+                or ServerStatusEnum.Starting.value
+            },
+            "image": js["spec"]["jupyterServer"]["image"],
+        }
+
+
+class ServersSummaryResponse(Schema):
+    """The response for the lightweight listing of the servers of a user."""
+
+    servers = fields.Dict(keys=fields.Str(), values=fields.Nested(ServerSummary()))
+    # the token to get the next page of servers, it is null on the last page
+    continue_token = fields.Str(data_key="continue", required=False, allow_none=True)
 
 
 class ServersGetRequest(Schema):
@@ -466,6 +550,23 @@ class ServersGetRequest(Schema):
     branch = fields.String(required=False)
 
 
+class ServersListRequest(ServersGetRequest):
+    # the maximum number of servers in a page, all servers are returned if not set
+    limit = fields.Integer(required=False, validate=validate.Range(min=1, max=1000))
+    # the continue token from the previous page
+    continue_token = fields.String(data_key="continue", required=False)
+    # return only a summary of each server without its status details and resources
+    light = fields.Boolean(load_default=False)
+
+    @validates_schema
+    def validate_continue_token(self, data, **kwargs):
+        if data.get("continue_token") is not None and data.get("limit") is None:
+            raise ValidationError(
+                "The continue token can only be used together with a limit.",
+                field_name="continue",
+            )
+
+
 NotebookResponse = (
     LaunchNotebookResponseWithS3
     if config.s3_mounts_enabled
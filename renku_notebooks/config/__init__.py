@@ -10,6 +10,12 @@ from .dynamic import (
     _SentryConfig,
     _GitConfig,
     _K8sConfig,
+    _ProjectCacheConfig,
+    _RegistryCacheConfig,
+    _S3ClientCacheConfig,
+    _HttpClientConfig,
+    _TracingConfig,
+    _AdminConfig,
     _parse_str_as_bool,
 )
 from .static import _ServersGetEndpointAnnotations
@@ -23,7 +29,13 @@ class _NotebooksConfig:
     sentry: _SentryConfig
     git: _GitConfig
     k8s: _K8sConfig
-    current_resource_schema_version: int = 1
+    registry_cache: _RegistryCacheConfig
+    project_cache: _ProjectCacheConfig
+    s3_client_cache: _S3ClientCacheConfig
+    http_client: _HttpClientConfig
+    tracing: _TracingConfig
+    admin: _AdminConfig
+    current_resource_schema_version: int = 2
     s3_mounts_enabled: Union[Text, bool] = False
     anonymous_sessions_enabled: Union[Text, bool] = False
     service_prefix: str = "/notebooks"
@@ -88,6 +100,16 @@ sessions {
         sentry = {
             enabled = false
         }
+        strategy = "full"
+        depth = 1
+        autosave_discovery = "fetch"
+        lfs_concurrent_transfers = 8
+        wait_for_server_timeout_seconds = 600
+        reference_cache {
+            enabled = false
+            lock_timeout_seconds = 60
+            max_age_seconds = 300
+        }
     }
     git_rpc_server {
         host = "0.0.0.0"
@@ -128,6 +150,14 @@ sessions {
     }
     enforce_cpu_limits: false
     autosave_minimum_lfs_file_size_bytes: 1000000
+    autosave_discovery_workers: 8
+    autosave_cleanup_queue_size: 1000
+    log_stream_buffer_lines: 1000
+    log_fetch_workers: 8
+    log_max_bytes: 10485760
+    events_heartbeat_seconds: 15
+    launch_lease_enabled: false
+    launch_lease_seconds: 60
     termination_grace_period_seconds: 600
     image_default_workdir: /home/jovyan
     node_selector: "{}"
@@ -150,6 +180,38 @@ git {
 k8s {
     enabled = true
 }
+project_cache {
+    max_size = 1024
+    ttl_seconds = 60
+}
+s3_client_cache {
+    max_size = 32
+    ttl_seconds = 3600
+}
+registry_cache {
+    max_size = 1024
+    manifest_ttl_seconds = 60
+    missing_image_ttl_seconds = 10
+}
+http_client {
+    pool_connections = 10
+    pool_maxsize = 20
+    connect_timeout_seconds = 5
+    read_timeout_seconds = 30
+    max_retries = 3
+    retry_backoff_factor = 0.3
+}
+tracing {
+    enabled = false
+    exporter = otlp
+    otlp_endpoint = "http://localhost:4317"
+    service_name = renku-notebooks
+    server_timing_enabled = false
+}
+admin {
+    page_size = 100
+    workers = 10
+}
 s3_mounts_enabled = false
 anonymous_sessions_enabled = false
 service_prefix = /notebooks
@@ -69,6 +69,94 @@ class _GitConfig:
     registry: Text
 
 
+@dataclass
+class _ProjectCacheConfig:
+    max_size: Union[Text, int] = 1024
+    ttl_seconds: Union[Text, int] = 60
+
+    def __post_init__(self):
+        self.max_size = _parse_value_as_numeric(self.max_size, int)
+        self.ttl_seconds = _parse_value_as_numeric(self.ttl_seconds, int)
+
+
+@dataclass
+class _S3ClientCacheConfig:
+    max_size: Union[Text, int] = 32
+    ttl_seconds: Union[Text, int] = 3600
+
+    def __post_init__(self):
+        self.max_size = _parse_value_as_numeric(self.max_size, int)
+        self.ttl_seconds = _parse_value_as_numeric(self.ttl_seconds, int)
+
+
+@dataclass
+class _RegistryCacheConfig:
+    max_size: Union[Text, int] = 1024
+    manifest_ttl_seconds: Union[Text, int] = 60
+    missing_image_ttl_seconds: Union[Text, int] = 10
+
+    def __post_init__(self):
+        self.max_size = _parse_value_as_numeric(self.max_size, int)
+        self.manifest_ttl_seconds = _parse_value_as_numeric(
+            self.manifest_ttl_seconds, int
+        )
+        self.missing_image_ttl_seconds = _parse_value_as_numeric(
+            self.missing_image_ttl_seconds, int
+        )
+
+
+@dataclass
+class _HttpClientConfig:
+    pool_connections: Union[Text, int] = 10
+    pool_maxsize: Union[Text, int] = 20
+    connect_timeout_seconds: Union[Text, float] = 5
+    read_timeout_seconds: Union[Text, float] = 30
+    max_retries: Union[Text, int] = 3
+    retry_backoff_factor: Union[Text, float] = 0.3
+
+    def __post_init__(self):
+        self.pool_connections = _parse_value_as_numeric(self.pool_connections, int)
+        self.pool_maxsize = _parse_value_as_numeric(self.pool_maxsize, int)
+        self.connect_timeout_seconds = _parse_value_as_numeric(
+            self.connect_timeout_seconds, float
+        )
+        self.read_timeout_seconds = _parse_value_as_numeric(
+            self.read_timeout_seconds, float
+        )
+        self.max_retries = _parse_value_as_numeric(self.max_retries, int)
+        self.retry_backoff_factor = _parse_value_as_numeric(
+            self.retry_backoff_factor, float
+        )
+
+
+@dataclass
+class _AdminConfig:
+    api_key: Optional[Text] = field(default=None, repr=False)
+    page_size: Union[Text, int] = 100
+    workers: Union[Text, int] = 10
+
+    def __post_init__(self):
+        self.page_size = _parse_value_as_numeric(self.page_size, int)
+        self.workers = _parse_value_as_numeric(self.workers, int)
+
+
+@dataclass
+class _TracingConfig:
+    enabled: Union[Text, bool] = False
+    exporter: Text = "otlp"
+    otlp_endpoint: Text = "http://localhost:4317"
+    service_name: Text = "renku-notebooks"
+    server_timing_enabled: Union[Text, bool] = False
+
+    def __post_init__(self):
+        self.enabled = _parse_str_as_bool(self.enabled)
+        self.server_timing_enabled = _parse_str_as_bool(self.server_timing_enabled)
+        if self.exporter not in ["otlp", "console"]:
+            raise ValueError(
+                f"The tracing exporter should be otlp or console, got {self.exporter}"
+            )
+
+
 @dataclass
 class _GitProxyConfig:
     port: Union[Text, int] = 8080
@@ -92,10 +180,65 @@ class _GitRpcServerConfig:
         self.port = _parse_value_as_numeric(self.port, int)
 
 
+@dataclass
+class _GitCloneReferenceCacheConfig:
+    """A node-local cache of the repositories that is shared by the init containers that
+    clone the repositories. Either a directory of the node or a claim of a persistent
+    volume that can be mounted by many pods has to be provided."""
+
+    enabled: Union[Text, bool] = False
+    host_path: Optional[Text] = None
+    claim_name: Optional[Text] = None
+    lock_timeout_seconds: Union[int, Text] = 60
+    max_age_seconds: Union[int, Text] = 300
+
+    def __post_init__(self):
+        self.enabled = _parse_str_as_bool(self.enabled)
+        self.lock_timeout_seconds = _parse_value_as_numeric(
+            self.lock_timeout_seconds, int
+        )
+        self.max_age_seconds = _parse_value_as_numeric(self.max_age_seconds, int)
+        if self.enabled and bool(self.host_path) == bool(self.claim_name):
+            raise ValueError(
+                "Exactly one of the host path or the claim name of the git clone "
+                "reference cache should be set."
+            )
+
+
 @dataclass
 class _GitCloneConfig:
     image: Text = "renku/git-clone:latest"
     sentry: _SentryConfig = _SentryConfig(enabled=False)
+    reference_cache: _GitCloneReferenceCacheConfig = _GitCloneReferenceCacheConfig()
+    strategy: Text = "full"
+    depth: Union[int, Text] = 1
+    shallow_since: Optional[Text] = None
+    autosave_discovery: Text = "fetch"
+    lfs_concurrent_transfers: Union[int, Text] = 8
+    wait_for_server_timeout_seconds: Union[int, Text] = 600
+
+    def __post_init__(self):
+        self.depth = _parse_value_as_numeric(self.depth, int)
+        self.wait_for_server_timeout_seconds = _parse_value_as_numeric(
+            self.wait_for_server_timeout_seconds, int
+        )
+        self.lfs_concurrent_transfers = _parse_value_as_numeric(
+            self.lfs_concurrent_transfers, int
+        )
+        if self.strategy not in ["full", "single-branch", "shallow", "blobless"]:
+            raise ValueError(
+                "The git clone strategy should be full, single-branch, shallow or "
+                f"blobless, got {self.strategy}"
+            )
+        if self.depth < 1:
+            raise ValueError(
+                f"The git clone depth should be at least 1, got {self.depth}"
+            )
+        if self.autosave_discovery not in ["fetch", "ls-remote"]:
+            raise ValueError(
+                "The git clone autosave discovery should be fetch or ls-remote, "
+                f"got {self.autosave_discovery}"
+            )
 
 
 @dataclass
@@ -192,6 +335,14 @@ class _SessionConfig:
     default_image: Text = "renku/singleuser:latest"
     enforce_cpu_limits: Union[Text, bool] = False
     autosave_minimum_lfs_file_size_bytes: Union[int, Text] = 1000000
+    autosave_discovery_workers: Union[int, Text] = 8
+    autosave_cleanup_queue_size: Union[int, Text] = 1000
+    log_stream_buffer_lines: Union[int, Text] = 1000
+    log_fetch_workers: Union[int, Text] = 8
+    log_max_bytes: Union[int, Text] = 10485760
+    events_heartbeat_seconds: Union[int, Text] = 15
+    launch_lease_enabled: Union[Text, bool] = False
+    launch_lease_seconds: Union[int, Text] = 60
     termination_grace_period_seconds: Union[int, Text] = 600
     image_default_workdir: Text = "/home/jovyan"
     node_selector: Text = "{}"
@@ -209,6 +360,24 @@ class _SessionConfig:
         self.node_selector = yaml.safe_load(self.node_selector)
         self.affinity = yaml.safe_load(self.affinity)
         self.tolerations = yaml.safe_load(self.tolerations)
+        self.autosave_discovery_workers = _parse_value_as_numeric(
+            self.autosave_discovery_workers, int
+        )
+        self.autosave_cleanup_queue_size = _parse_value_as_numeric(
+            self.autosave_cleanup_queue_size, int
+        )
+        self.log_stream_buffer_lines = _parse_value_as_numeric(
+            self.log_stream_buffer_lines, int
+        )
+        self.log_fetch_workers = _parse_value_as_numeric(self.log_fetch_workers, int)
+        self.log_max_bytes = _parse_value_as_numeric(self.log_max_bytes, int)
+        self.events_heartbeat_seconds = _parse_value_as_numeric(
+            self.events_heartbeat_seconds, int
+        )
+        self.launch_lease_enabled = _parse_str_as_bool(self.launch_lease_enabled)
+        self.launch_lease_seconds = _parse_value_as_numeric(
+            self.launch_lease_seconds, int
+        )
 
 
 @dataclass
@@ -217,9 +386,15 @@ class _K8sConfig:
 
     enabled: Union[Text, bool] = True
     namespace: Optional[Text] = None
+    informer_enabled: Union[Text, bool] = True
+    informer_resync_seconds: Union[Text, int] = 600
 
     def __post_init__(self):
         self.enabled = _parse_str_as_bool(self.enabled)
+        self.informer_enabled = _parse_str_as_bool(self.informer_enabled)
+        self.informer_resync_seconds = _parse_value_as_numeric(
+            self.informer_resync_seconds, int
+        )
         if not self.enabled:
             self.client = None
             return
@@ -0,0 +1,58 @@
+"""A small in-memory cache used to avoid repeating expensive calls within a process."""
+from collections import OrderedDict
+from threading import RLock
+from time import monotonic
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """A thread-safe cache with a bounded size whose entries expire after a time to live.
+
+    When the cache is full the least recently used entry is evicted. The time to live
+    can be overridden for individual entries. A ttl of None means that an entry
+    never expires and is only removed when it is evicted."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float]):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = RLock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                expires_at, value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires_at is not None and expires_at <= monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = -1):
+        """Add a value to the cache, if the ttl is not provided the default ttl is used."""
+        if ttl == -1:
+            ttl = self.ttl
+        with self._lock:
+            self._data[key] = (monotonic() + ttl if ttl is not None else None, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry is not None else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -1,42 +1,173 @@
 import base64
 import re
+from dataclasses import dataclass
+from hashlib import sha256
 from json import JSONDecodeError
-from typing import Optional
+from time import monotonic
+from typing import Any, Dict, Optional
 
 import requests
 from werkzeug.http import parse_www_authenticate_header
 
 from ..config import config
 from ..api.classes.user import RegisteredUser
+from .cache import TTLCache
+from .http_session import get_http_session
+from .metrics import register_cache, track_dependency
 
+_manifest_accept_header = "application/vnd.docker.distribution.manifest.v2+json"
 
-def get_docker_token(hostname, image, tag, user):
-    """
-    Get a authorization token from the docker v2 API. This will return
-    the token provided by the API (or None if no token was found). In
-    addition it will also provide an indication of whether the token
-    is for a private image (True) or if it is for a public one (False).
-    """
+
+@dataclass
+class _ManifestCacheEntry:
+    status_code: int
+    fresh_until: float
+    etag: Optional[str] = None
+    manifest: Optional[Dict[str, Any]] = None
+
+
+# NOTE: The authentication challenge of a registry rarely changes so it is kept for a long time.
+_challenge_cache = TTLCache(maxsize=config.registry_cache.max_size, ttl=3600)
+# NOTE: Tokens are cached until they expire, the ttl is set per token from the token response.
+_token_cache = TTLCache(maxsize=config.registry_cache.max_size, ttl=60)
+# NOTE: Manifest entries are kept for a long time but they are revalidated
+# with the registry (by using the ETag) when they are no longer fresh.
+_manifest_cache = TTLCache(maxsize=config.registry_cache.max_size, ttl=3600)
+# NOTE: Blobs are addressed by their digest and are therefore immutable.
+_blob_cache = TTLCache(maxsize=config.registry_cache.max_size, ttl=None)
+register_cache("registry_challenge", _challenge_cache)
+register_cache("registry_token", _token_cache)
+register_cache("registry_manifest", _manifest_cache)
+register_cache("registry_blob", _blob_cache)
+
+
+def _get_auth_challenge(hostname, image, tag):
+    """Get the realm and parameters required to request a token for an image. Returns
+    None if the registry did not respond with the expected authentication challenge."""
+    key = (hostname, image)
+    challenge = _challenge_cache.get(key)
+    if challenge is not None:
+        return challenge or None
     image_digest_url = f"https://{hostname}/v2/{image}/manifests/{tag}"
     try:
-        auth_req = requests.get(image_digest_url)
-    except requests.ConnectionError:
-        auth_req = None
-    if auth_req is None or not (
+        with track_dependency("registry", "challenge"):
+            auth_req = get_http_session().get(image_digest_url)
+    except (requests.ConnectionError, requests.Timeout):
+        return None
+    if not (
         auth_req.status_code == 401 and "Www-Authenticate" in auth_req.headers.keys()
     ):
         # the request status code and header are not what is expected
-        return None, None
+        if auth_req.status_code < 500 and auth_req.status_code != 429:
+            _challenge_cache.set(
+                key, {}, ttl=config.registry_cache.missing_image_ttl_seconds
+            )
+        return None
     www_auth = parse_www_authenticate_header(auth_req.headers["Www-Authenticate"])
     params = dict(www_auth.items())
     realm = params.pop("realm")
+    challenge = {"realm": realm, "params": params}
+    _challenge_cache.set(key, challenge)
+    return challenge
+
+
+def _request_token(realm, params, oauth_token=None) -> Optional[str]:
+    """Request a token from the registry authentication server and cache it until
+    it expires. Tokens obtained with the credentials of a user are cached per user."""
+    key = (
+        realm,
+        tuple(sorted(params.items())),
+        sha256(oauth_token.encode()).hexdigest() if oauth_token else None,
+    )
+    token = _token_cache.get(key)
+    if token is not None:
+        return token
+    headers = {}
+    if oauth_token is not None:
+        creds = base64.urlsafe_b64encode(f"oauth2:{oauth_token}".encode()).decode()
+        headers["Authorization"] = f"Basic {creds}"
+    with track_dependency("registry", "token"):
+        token_req = get_http_session().get(realm, params=params, headers=headers)
+    token_res = token_req.json()
+    token = token_res.get("token")
+    if token is not None:
+        # NOTE: The docker registry spec says that tokens are valid for 60 seconds by default
+        expires_in = token_res.get("expires_in", 60)
+        _token_cache.set(key, token, ttl=max(expires_in - 10, 0))
+    return token
+
+
+def _manifest_ttl(tag) -> float:
+    """How long a manifest that was found in the registry is considered fresh."""
+    if tag.startswith("sha256:"):
+        # NOTE: A manifest referenced by its digest is immutable
+        return float("inf")
+    return config.registry_cache.manifest_ttl_seconds
+
+
+def _get_manifest(hostname, image, tag, token=None) -> Optional[_ManifestCacheEntry]:
+    """Get the manifest of an image. Returns None if the registry cannot be reached."""
+    key = (hostname, image, tag, token)
+    cached = _manifest_cache.get(key)
+    if cached is not None and cached.fresh_until > monotonic():
+        return cached
+    headers = {"Accept": _manifest_accept_header}
+    if token is not None:
+        headers["Authorization"] = f"Bearer {token}"
+    if cached is not None and cached.etag is not None:
+        headers["If-None-Match"] = cached.etag
+    try:
+        with track_dependency("registry", "manifest"):
+            res = get_http_session().get(
+                f"https://{hostname}/v2/{image}/manifests/{tag}", headers=headers
+            )
+    except (requests.ConnectionError, requests.Timeout):
+        return None
+    if res.status_code == 304 and cached is not None:
+        cached.fresh_until = monotonic() + _manifest_ttl(tag)
+        _manifest_cache.set(key, cached)
+        return cached
+    manifest = None
+    if res.status_code == 200:
+        try:
+            manifest = res.json()
+        except JSONDecodeError:
+            pass
+    entry = _ManifestCacheEntry(
+        status_code=res.status_code,
+        fresh_until=monotonic(),
+        etag=res.headers.get("ETag"),
+        manifest=manifest,
+    )
+    if res.status_code == 200:
+        entry.fresh_until += _manifest_ttl(tag)
+        _manifest_cache.set(key, entry)
+    elif res.status_code == 404:
+        entry.fresh_until += config.registry_cache.missing_image_ttl_seconds
+        _manifest_cache.set(key, entry)
+    # NOTE: Other errors (expired credentials, rate limits, registry outages)
+    # are transient and are therefore never cached.
+    return entry
+
+
+def get_docker_token(hostname, image, tag, user):
+    """
+    Get a authorization token from the docker v2 API. This will return
+    the token provided by the API (or None if no token was found). In
+    addition it will also provide an indication of whether the token
+    is for a private image (True) or if it is for a public one (False).
+    """
+    challenge = _get_auth_challenge(hostname, image, tag)
+    if challenge is None:
+        return None, None
+    realm, params = challenge["realm"], challenge["params"]
     # try to get a public docker token
-    token_req = requests.get(realm, params=params)
-    public_token = token_req.json().get("token")
+    public_token = _request_token(realm, params)
     if public_token is not None:
         return public_token, False
     # try to get private token by authenticating
     # ensure that you won't send oauth token somewhere randomly
+    image_digest_url = f"https://{hostname}/v2/{image}/manifests/{tag}"
     if (
         re.match(
             r"^" + re.escape(f"https://{config.git.registry}") + r".*",
@@ -45,12 +176,7 @@ def get_docker_token(hostname, image, tag, user):
         is not None
         and type(user) is RegisteredUser
     ):
-        oauth_token = user.git_token
-        creds = base64.urlsafe_b64encode(f"oauth2:{oauth_token}".encode()).decode()
-        token_req = requests.get(
-            realm, params=params, headers={"Authorization": f"Basic {creds}"}
-        )
-        private_token = token_req.json().get("token")
+        private_token = _request_token(realm, params, user.git_token)
         if private_token is not None:
             return private_token, True
     return None, None
@@ -58,47 +184,25 @@ def get_docker_token(hostname, image, tag, user):
 
 def image_exists(hostname, image, tag, token=None):
     """Check the docker repo API if the image exists and if it is public or not."""
-    image_digest_url = f"https://{hostname}/v2/{image}/manifests/{tag}"
-    if token is None:
-        # the repo does not require authentication
-        pub_req = requests.get(
-            image_digest_url,
-            headers={"Accept": "application/vnd.docker.distribution.manifest.v2+json"},
-        )
-        return pub_req.status_code == 200
-    else:
-        # the repo requires a token, try to use provided token
-        auth_req = requests.get(
-            image_digest_url,
-            headers={
-                "Authorization": f"Bearer {token}",
-                "Accept": "application/vnd.docker.distribution.manifest.v2+json",
-            },
-        )
-        return auth_req.status_code == 200
+    manifest = _get_manifest(hostname, image, tag, token)
+    return manifest is not None and manifest.status_code == 200
 
 
 def get_image_workdir(hostname, image, tag, token=None) -> Optional[str]:
     """Query the docker API to get the workdir of an image."""
-    headers = {
-        "Accept": "application/vnd.docker.distribution.manifest.v2+json",
-    }
-    if token is not None:
-        headers["Authorization"] = f"Bearer {token}"
+    manifest = _get_manifest(hostname, image, tag, token)
+    if manifest is None or manifest.status_code != 200:
+        return None
     try:
-        res = requests.get(
-            f"https://{hostname}/v2/{image}/manifests/{tag}", headers=headers
-        )
-    except requests.exceptions.ConnectionError:
-        res = None
-    if res is not None and res.status_code == 200:
+        config_digest = manifest.manifest["config"]["digest"]
+    except (TypeError, KeyError):
+        return None
+    blob_key = (hostname, image, config_digest)
+    image_config = _blob_cache.get(blob_key)
+    if image_config is None:
         try:
-            config_digest = res.json()["config"]["digest"]
-        except (JSONDecodeError, KeyError):
-            return None
-        else:
-            try:
-                res = requests.get(
+            with track_dependency("registry", "blob"):
+                res = get_http_session().get(
                     f"https://{hostname}/v2/{image}/blobs/{config_digest}",
                     headers={
                         "Authorization": f"Bearer {token}",
@@ -106,16 +210,18 @@ def get_image_workdir(hostname, image, tag, token=None) -> Optional[str]:
                     if token is not None
                     else {},
                 )
-            except requests.exceptions.ConnectionError:
-                res = None
-            if res is not None and res.status_code == 200:
-                try:
-                    working_dir = res.json()["config"]["WorkingDir"]
-                except (JSONDecodeError, KeyError):
-                    return None
-                else:
-                    return working_dir
-    return None
+        except (requests.ConnectionError, requests.Timeout):
+            return None
+        if res.status_code != 200:
+            return None
+        try:
+            image_config = res.json()["config"]
+        except (JSONDecodeError, KeyError):
+            return None
+        if not isinstance(image_config, dict):
+            return None
+        _blob_cache.set(blob_key, image_config)
+    return image_config.get("WorkingDir")
 
 
 def build_re(*parts):
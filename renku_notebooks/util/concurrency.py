@@ -0,0 +1,23 @@
+"""Helpers for running independent blocking calls concurrently."""
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from flask import current_app, has_app_context
+
+
+class AppContextThreadPoolExecutor(ThreadPoolExecutor):
+    """A thread pool that runs the submitted callables inside the Flask app context
+    of the caller so that they can still use the app logger and config.
+
+    When gunicorn runs with gevent workers the threads are monkey patched into
+    greenlets so the same code works for both worker types."""
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        if not has_app_context():
+            return super().submit(fn, *args, **kwargs)
+        app = current_app._get_current_object()
+
+        def _run_in_app_context():
+            with app.app_context():
+                return fn(*args, **kwargs)
+
+        return super().submit(_run_in_app_context)
@@ -0,0 +1,62 @@
+"""A shared HTTP session with connection pooling, timeouts and retries."""
+from http.cookiejar import DefaultCookiePolicy
+from threading import Lock
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from ..config import config
+
+
+class _TimeoutHTTPAdapter(HTTPAdapter):
+    """An HTTP adapter that applies a default timeout to requests that do not set one."""
+
+    def __init__(self, *args, timeout=None, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+def _make_http_session() -> requests.Session:
+    session = requests.Session()
+    # NOTE: The session is shared by the requests of all users, so no cookies should be
+    # kept in it. All authentication is passed explicitly in the headers of each request.
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    retry = Retry(
+        total=config.http_client.max_retries,
+        backoff_factor=config.http_client.retry_backoff_factor,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=["HEAD", "GET", "OPTIONS"],
+        raise_on_status=False,
+    )
+    adapter = _TimeoutHTTPAdapter(
+        pool_connections=config.http_client.pool_connections,
+        pool_maxsize=config.http_client.pool_maxsize,
+        max_retries=retry,
+        timeout=(
+            config.http_client.connect_timeout_seconds,
+            config.http_client.read_timeout_seconds,
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_http_session: Optional[requests.Session] = None
+_http_session_lock = Lock()
+
+
+def get_http_session() -> requests.Session:
+    """Get the HTTP session of this process that should be used for all outbound calls."""
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = _make_http_session()
+    return _http_session
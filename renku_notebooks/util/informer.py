@@ -0,0 +1,372 @@
+"""An in-memory cache of the JupyterServer resources kept up to date by a k8s watch."""
+import logging
+from copy import deepcopy
+from queue import Full, Queue
+from threading import Event, Lock, RLock, Thread
+from time import monotonic, sleep
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from kubernetes import client, watch
+from kubernetes.client.exceptions import ApiException
+
+from ..config import config
+
+
+class Subscription:
+    """The changes to the JupyterServers of a user received by an informer.
+
+    Events are (type, resource) tuples where the type is one of ADDED, MODIFIED or
+    DELETED. If the consumer is too slow and the queue of events fills up the events
+    that do not fit are dropped and ``overflowed`` is set, the consumer should then
+    reset the flag and get the current state of all the servers from the informer."""
+
+    def __init__(self, safe_username: str, maxsize: int = 1000):
+        self.safe_username = safe_username
+        self.events: "Queue[Tuple[str, Dict[str, Any]]]" = Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def _put(self, event_type: str, js: Dict[str, Any]):
+        try:
+            self.events.put_nowait((event_type, deepcopy(js)))
+        except Full:
+            self.overflowed = True
+
+
+class JupyterServerInformer:
+    """Keeps a copy of all the JupyterServer resources from a namespace in memory.
+
+    All resources are listed once and then a watch is used to receive changes. The
+    resources are indexed by the safe username label and by the servername annotation
+    so that the lookups used by the API do not have to scan all resources. The
+    full list is repeated periodically (resync) and whenever the resource version
+    that the watch relies on expires. While the cache is not in sync with the cluster
+    ``has_synced`` is False and callers should query the k8s API directly.
+
+    The watch lags the writes made to the k8s API, so the writes made by this process
+    are recorded with ``record_write`` and ``has_pending_writes`` is True until the
+    watch has delivered them. Callers should query the k8s API directly while this is
+    the case so that they read their own writes."""
+
+    list_page_size = 500
+
+    def __init__(
+        self,
+        namespace: str,
+        group: str,
+        version: str,
+        plural: str,
+        username_label: str,
+        servername_annotation: str,
+        resync_seconds: int = 600,
+        watch_timeout_seconds: int = 300,
+        pending_write_seconds: int = 30,
+    ):
+        self.namespace = namespace
+        self.group = group
+        self.version = version
+        self.plural = plural
+        self.username_label = username_label
+        self.servername_annotation = servername_annotation
+        self.resync_seconds = resync_seconds
+        self.watch_timeout_seconds = watch_timeout_seconds
+        self.pending_write_seconds = pending_write_seconds
+        self._api = client.CustomObjectsApi(client.ApiClient())
+        self._lock = RLock()
+        self._synced = Event()
+        self._stopped = Event()
+        self._thread: Optional[Thread] = None
+        self._resource_version: Optional[str] = None
+        self._last_list = 0.0
+        self._by_name: Dict[str, Dict[str, Any]] = {}
+        self._names_by_username: Dict[str, Set[str]] = {}
+        self._name_by_servername: Dict[str, str] = {}
+        self._subscriptions: Dict[str, Set[Subscription]] = {}
+        # NOTE: The safe username, resource version and expiry of the writes by name
+        self._pending_writes: Dict[str, Tuple[Optional[str], Optional[str], float]] = {}
+
+    @property
+    def has_synced(self) -> bool:
+        return self._synced.is_set()
+
+    def wait_for_sync(self, timeout: Optional[float] = None) -> bool:
+        return self._synced.wait(timeout)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = Thread(
+            target=self._run, name="jupyterserver-informer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._synced.clear()
+
+    def list(self, safe_username: str) -> List[Dict[str, Any]]:
+        """Get all the JupyterServers that belong to a user."""
+        with self._lock:
+            names = self._names_by_username.get(safe_username, set())
+            return [deepcopy(self._by_name[name]) for name in sorted(names)]
+
+    def snapshot(
+        self, safe_username: str
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get all the JupyterServers that belong to a user and the resource version
+        of the cache they were read from."""
+        with self._lock:
+            return self.list(safe_username), self._resource_version
+
+    def get(self, server_name: str) -> Optional[Dict[str, Any]]:
+        """Get a JupyterServer by the value of its servername annotation."""
+        with self._lock:
+            name = self._name_by_servername.get(server_name, server_name)
+            js = self._by_name.get(name)
+            return deepcopy(js) if js is not None else None
+
+    def record_write(
+        self,
+        name: str,
+        safe_username: Optional[str] = None,
+        resource_version: Optional[str] = None,
+    ):
+        """Record that this process created, changed or deleted a JupyterServer. The
+        write is pending until the watch delivers the given resource version (or any
+        deletion if the resource version is not known) or until it expires."""
+        with self._lock:
+            self._pending_writes[name] = (
+                safe_username,
+                resource_version,
+                monotonic() + self.pending_write_seconds,
+            )
+
+    def has_pending_writes(
+        self, safe_username: Optional[str] = None, name: Optional[str] = None
+    ) -> bool:
+        """Check if there are writes to a JupyterServer (or to any JupyterServer of a
+        user) that the watch has not delivered yet."""
+        with self._lock:
+            now = monotonic()
+            for pending_name, (_, _, expires) in list(self._pending_writes.items()):
+                if expires <= now:
+                    self._pending_writes.pop(pending_name)
+            if name is not None:
+                return name in self._pending_writes
+            return any(
+                username == safe_username
+                for username, _, _ in self._pending_writes.values()
+            )
+
+    def _clear_pending_write(self, event_type: str, js: Dict[str, Any]):
+        name = js["metadata"]["name"]
+        pending = self._pending_writes.get(name)
+        if pending is None:
+            return
+        _, resource_version, _ = pending
+        if resource_version is not None:
+            delivered = js["metadata"].get("resourceVersion") == resource_version
+        else:
+            delivered = event_type == "DELETED" or bool(
+                js["metadata"].get("deletionTimestamp")
+            )
+        if delivered:
+            self._pending_writes.pop(name)
+
+    def subscribe(self, safe_username: str) -> Subscription:
+        """Receive the changes to the JupyterServers of a user."""
+        subscription = Subscription(safe_username)
+        with self._lock:
+            self._subscriptions.setdefault(safe_username, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.safe_username, set())
+            subscriptions.discard(subscription)
+            if len(subscriptions) == 0:
+                self._subscriptions.pop(subscription.safe_username, None)
+
+    def _notify(self, event_type: str, js: Dict[str, Any]):
+        username = js["metadata"].get("labels", {}).get(self.username_label)
+        for subscription in self._subscriptions.get(username, []):
+            subscription._put(event_type, js)
+
+    def _index(self, js: Dict[str, Any]):
+        name = js["metadata"]["name"]
+        self._by_name[name] = js
+        username = js["metadata"].get("labels", {}).get(self.username_label)
+        if username is not None:
+            self._names_by_username.setdefault(username, set()).add(name)
+        server_name = (
+            js["metadata"].get("annotations", {}).get(self.servername_annotation)
+        )
+        if server_name is not None:
+            self._name_by_servername[server_name] = name
+
+    def _unindex(self, name: str):
+        js = self._by_name.pop(name, None)
+        if js is None:
+            return
+        username = js["metadata"].get("labels", {}).get(self.username_label)
+        names = self._names_by_username.get(username)
+        if names is not None:
+            names.discard(name)
+            if len(names) == 0:
+                self._names_by_username.pop(username)
+        server_name = (
+            js["metadata"].get("annotations", {}).get(self.servername_annotation)
+        )
+        if self._name_by_servername.get(server_name) == name:
+            self._name_by_servername.pop(server_name)
+
+    def _replace_all(self, jss: List[Dict[str, Any]], resource_version: str):
+        with self._lock:
+            previous = self._by_name
+            self._by_name = {}
+            self._names_by_username = {}
+            self._name_by_servername = {}
+            for js in jss:
+                self._index(js)
+            self._resource_version = resource_version
+            self._last_list = monotonic()
+            if self._subscriptions:
+                self._notify_changes(previous)
+        self._synced.set()
+
+    def _notify_changes(self, previous: Dict[str, Dict[str, Any]]):
+        """Notify the subscribers about the differences between the previous and the
+        current resources, used when all resources are listed again."""
+        for name, js in previous.items():
+            if name not in self._by_name:
+                self._notify("DELETED", js)
+        for name, js in self._by_name.items():
+            previous_js = previous.get(name)
+            if previous_js is None:
+                self._notify("ADDED", js)
+            elif previous_js["metadata"].get("resourceVersion") != js["metadata"].get(
+                "resourceVersion"
+            ):
+                self._notify("MODIFIED", js)
+
+    def _handle_event(self, event: Dict[str, Any]):
+        event_type = event["type"]
+        js = event["raw_object"]
+        with self._lock:
+            if event_type == "BOOKMARK":
+                self._resource_version = js["metadata"]["resourceVersion"]
+                return
+            name = js["metadata"]["name"]
+            # NOTE: Always unindex first because the labels or annotations may have changed
+            self._unindex(name)
+            if event_type in ["ADDED", "MODIFIED"]:
+                self._index(js)
+            self._resource_version = js["metadata"]["resourceVersion"]
+            if event_type in ["ADDED", "MODIFIED", "DELETED"]:
+                self._clear_pending_write(event_type, js)
+                self._notify(event_type, js)
+
+    def _list(self):
+        jss = []
+        next_page = ""
+        while True:
+            res = self._api.list_namespaced_custom_object(
+                group=self.group,
+                version=self.version,
+                namespace=self.namespace,
+                plural=self.plural,
+                limit=self.list_page_size,
+                _continue=next_page,
+            )
+            jss.extend(res["items"])
+            next_page = res["metadata"].get("continue")
+            if not next_page:
+                break
+        self._replace_all(jss, res["metadata"]["resourceVersion"])
+        logging.info(
+            f"JupyterServer informer listed {len(jss)} servers at resource version "
+            f"{self._resource_version}."
+        )
+
+    def _watch(self):
+        w = watch.Watch()
+        for event in w.stream(
+            self._api.list_namespaced_custom_object,
+            group=self.group,
+            version=self.version,
+            namespace=self.namespace,
+            plural=self.plural,
+            resource_version=self._resource_version,
+            allow_watch_bookmarks=True,
+            timeout_seconds=self.watch_timeout_seconds,
+        ):
+            self._handle_event(event)
+            if self._stopped.is_set():
+                w.stop()
+
+    def _run(self):
+        retry_delay = 1
+        while not self._stopped.is_set():
+            try:
+                if (
+                    not self.has_synced
+                    or monotonic() - self._last_list > self.resync_seconds
+                ):
+                    self._list()
+                self._watch()
+                retry_delay = 1
+            except ApiException as err:
+                self._synced.clear()
+                if err.status == 410:
+                    # NOTE: The resource version expired, a fresh list is required
+                    logging.info("JupyterServer informer resource version expired.")
+                    continue
+                logging.warning(f"JupyterServer informer failed, error: {err}")
+                sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60)
+            except Exception as err:
+                self._synced.clear()
+                logging.warning(f"JupyterServer informer failed, error: {err}")
+                sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60)
+
+
+_informer: Optional[JupyterServerInformer] = None
+_informer_lock = Lock()
+
+
+def record_write(
+    name: str,
+    safe_username: Optional[str] = None,
+    resource_version: Optional[str] = None,
+):
+    """Record a write to a JupyterServer made by this process in the informer, if the
+    informer is enabled, so that the server is read from the k8s API until the informer
+    has caught up with the write."""
+    informer = get_informer()
+    if informer is not None:
+        informer.record_write(name, safe_username, resource_version)
+
+
+def get_informer() -> Optional[JupyterServerInformer]:
+    """Get the JupyterServer informer for this process, starting it on first use.
+
+    Returns None if the informer is disabled, in which case the k8s API should be
+    queried directly."""
+    global _informer
+    if not config.k8s.enabled or not config.k8s.informer_enabled:
+        return None
+    with _informer_lock:
+        if _informer is None:
+            prefix = config.session_get_endpoint_annotations.renku_annotation_prefix
+            _informer = JupyterServerInformer(
+                namespace=config.k8s.namespace,
+                group=config.amalthea.group,
+                version=config.amalthea.version,
+                plural=config.amalthea.plural,
+                username_label=f"{prefix}safe-username",
+                servername_annotation=f"{prefix}servername",
+                resync_seconds=config.k8s.informer_resync_seconds,
+            )
+            _informer.start()
+    return _informer
@@ -17,9 +17,15 @@
 # limitations under the License.
 """Kubernetes helper functions."""
 
+import os
+import socket
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from hashlib import md5
+from time import monotonic, sleep
 
 import escapism
+from flask import current_app
 from kubernetes import client
 
 
@@ -83,3 +89,80 @@ def make_server_name(
         project=escapism.escape(project, escape_char="-")[:24].lower(),
         hash=md5(server_string_for_hashing.encode()).hexdigest()[:8].lower(),
     )
+
+
+def make_label_value(value: str) -> str:
+    """Hash a value that cannot be used as the value of a k8s label as is (i.e. it is
+    too long or contains slashes) so that the label can be used in label selectors."""
+    return md5(value.encode()).hexdigest()
+
+
+_lease_holder = f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _try_acquire_lease(api, name, namespace, duration_seconds) -> bool:
+    now = datetime.now(timezone.utc)
+    lease = client.V1Lease(
+        metadata=client.V1ObjectMeta(name=name),
+        spec=client.V1LeaseSpec(
+            holder_identity=_lease_holder,
+            lease_duration_seconds=duration_seconds,
+            acquire_time=now,
+            renew_time=now,
+        ),
+    )
+    try:
+        api.create_namespaced_lease(namespace, lease)
+        return True
+    except client.rest.ApiException as err:
+        if err.status != 409:
+            raise
+    lease = api.read_namespaced_lease(name, namespace)
+    renewed_at = lease.spec.renew_time or lease.spec.acquire_time
+    lease_duration = lease.spec.lease_duration_seconds or duration_seconds
+    if renewed_at is not None and renewed_at + timedelta(seconds=lease_duration) > now:
+        return False
+    # NOTE: The lease has expired (i.e. its holder crashed), the resource version of the
+    # lease ensures that only one of the processes that try to take it over succeeds.
+    lease.spec.holder_identity = _lease_holder
+    lease.spec.acquire_time = now
+    lease.spec.renew_time = now
+    try:
+        api.replace_namespaced_lease(name, namespace, lease)
+        return True
+    except client.rest.ApiException as err:
+        if err.status != 409:
+            raise
+    return False
+
+
+@contextmanager
+def hold_lease(name, namespace, duration_seconds, poll_interval_seconds=0.5):
+    """Hold a coordination.k8s.io Lease while the block runs so that only one replica
+    of the service runs the block at a time. If the lease is held by someone else this
+    waits for at most duration_seconds. The lease only coordinates, the block still
+    runs if the lease could not be acquired in time or if the k8s API failed."""
+    api = client.CoordinationV1Api(client.ApiClient())
+    acquired = False
+    deadline = monotonic() + duration_seconds
+    try:
+        while True:
+            acquired = _try_acquire_lease(api, name, namespace, duration_seconds)
+            if acquired or monotonic() > deadline:
+                break
+            sleep(poll_interval_seconds)
+    except client.rest.ApiException as err:
+        current_app.logger.warning(f"Cannot acquire the lease {name}: {err}")
+    if not acquired:
+        current_app.logger.warning(f"Proceeding without holding the lease {name}")
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                api.delete_namespaced_lease(name, namespace)
+            except client.rest.ApiException as err:
+                if err.status != 404:
+                    current_app.logger.warning(
+                        f"Cannot release the lease {name}: {err}"
+                    )
@@ -0,0 +1,290 @@
+"""Prometheus metrics of the service, rendered in the Prometheus text format.
+
+The metrics are kept in the memory of each process, the service runs a single
+gunicorn worker so a scrape of the metrics endpoint covers all requests."""
+from contextlib import contextmanager
+from math import inf
+from threading import Lock
+from time import monotonic
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from flask import Flask, Response, g, request
+
+_LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    if value == inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if len(names) == 0:
+        return ""
+    labels = ",".join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"),
+        )
+        for name, value in zip(names, values)
+    )
+    return "{" + labels + "}"
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = Lock()
+        self._values: Dict[_LabelValues, float] = {}
+
+    def _label_values(self, labels: Dict[str, str]) -> _LabelValues:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _samples(self) -> List[Tuple[str, Sequence[str], Sequence[str], float]]:
+        with self._lock:
+            return [
+                (self.name, self.label_names, label_values, value)
+                for label_values, value in sorted(self._values.items())
+            ]
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for name, label_names, label_values, value in self._samples():
+            lines.append(
+                f"{name}{_format_labels(label_names, label_values)} "
+                f"{_format_value(value)}"
+            )
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels):
+        """Set the total of a counter that is tracked somewhere else (i.e. by a cache)."""
+        with self._lock:
+            self._values[self._label_values(labels)] = value
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._label_values(labels)] = value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = default_buckets,
+    ):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (inf,)
+        self._histograms: Dict[_LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._label_values(labels)
+        with self._lock:
+            counts, total = self._histograms.setdefault(
+                key, ([0] * len(self.buckets), [0.0])
+            )
+            for ind, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    counts[ind] += 1
+                    break
+            total[0] += value
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for label_values, (counts, total) in sorted(self._histograms.items()):
+                cumulative = 0
+                for upper_bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    samples.append(
+                        (
+                            f"{self.name}_bucket",
+                            self.label_names + ("le",),
+                            label_values + (_format_value(upper_bound),),
+                            cumulative,
+                        )
+                    )
+                samples.append(
+                    (f"{self.name}_sum", self.label_names, label_values, total[0])
+                )
+                samples.append(
+                    (f"{self.name}_count", self.label_names, label_values, cumulative)
+                )
+        return samples
+
+
+class Registry:
+    """A collection of metrics. Collectors are called before the metrics are rendered
+    to update the metrics whose values are tracked elsewhere."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], None]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+REQUEST_DURATION = REGISTRY.register(
+    Histogram(
+        "notebooks_request_duration_seconds",
+        "Duration of the requests handled by the service.",
+        ["endpoint", "method", "status"],
+    )
+)
+DEPENDENCY_DURATION = REGISTRY.register(
+    Histogram(
+        "notebooks_dependency_request_duration_seconds",
+        "Duration of the requests made to the services the notebooks service depends on.",
+        ["dependency", "operation"],
+    )
+)
+DEPENDENCY_ERRORS = REGISTRY.register(
+    Counter(
+        "notebooks_dependency_errors_total",
+        "Number of failed requests made to the services the notebooks service depends on.",
+        ["dependency", "operation"],
+    )
+)
+LAUNCH_PHASE_DURATION = REGISTRY.register(
+    Histogram(
+        "notebooks_launch_phase_duration_seconds",
+        "Duration of the phases of launching a session.",
+        ["phase"],
+    )
+)
+CACHE_HITS = REGISTRY.register(
+    Counter("notebooks_cache_hits_total", "Number of cache hits.", ["cache"])
+)
+CACHE_MISSES = REGISTRY.register(
+    Counter("notebooks_cache_misses_total", "Number of cache misses.", ["cache"])
+)
+CACHE_HIT_RATIO = REGISTRY.register(
+    Gauge("notebooks_cache_hit_ratio", "Ratio of cache lookups that hit.", ["cache"])
+)
+CACHE_SIZE = REGISTRY.register(
+    Gauge("notebooks_cache_size", "Number of entries in a cache.", ["cache"])
+)
+WORK_QUEUE_DEPTH = REGISTRY.register(
+    Gauge("notebooks_work_queue_depth", "Number of jobs waiting in a queue.", ["queue"])
+)
+WORK_QUEUE_JOBS = REGISTRY.register(
+    Counter(
+        "notebooks_work_queue_jobs_total",
+        "Number of jobs of a queue by their result.",
+        ["queue", "result"],
+    )
+)
+WORK_QUEUE_LATENCY = REGISTRY.register(
+    Gauge(
+        "notebooks_work_queue_latency_seconds",
+        "Average time recent jobs of a queue spent waiting and running.",
+        ["queue", "stage"],
+    )
+)
+
+
+@contextmanager
+def track_dependency(dependency: str, operation: str):
+    """Record the duration of a call to a dependency and count it if it fails."""
+    start = monotonic()
+    try:
+        yield
+    except Exception:
+        DEPENDENCY_ERRORS.inc(dependency=dependency, operation=operation)
+        raise
+    finally:
+        DEPENDENCY_DURATION.observe(
+            monotonic() - start, dependency=dependency, operation=operation
+        )
+
+
+def register_cache(name: str, cache):
+    """Export the hits and misses of a TTLCache."""
+
+    def _collect():
+        hits, misses = cache.hits, cache.misses
+        CACHE_HITS.set_total(hits, cache=name)
+        CACHE_MISSES.set_total(misses, cache=name)
+        CACHE_HIT_RATIO.set(hits / (hits + misses) if hits + misses else 0, cache=name)
+        CACHE_SIZE.set(len(cache), cache=name)
+
+    REGISTRY.register_collector(_collect)
+
+
+def register_work_queue(queue):
+    """Export the depth, job counts and latency of a WorkQueue."""
+
+    def _collect():
+        stats = queue.stats()
+        WORK_QUEUE_DEPTH.set(stats["depth"], queue=queue.name)
+        for result in ["processed", "failed", "dropped"]:
+            WORK_QUEUE_JOBS.set_total(stats[result], queue=queue.name, result=result)
+        for stage in ["wait", "run"]:
+            WORK_QUEUE_LATENCY.set(
+                stats[f"{stage}_seconds_avg"], queue=queue.name, stage=stage
+            )
+
+    REGISTRY.register_collector(_collect)
+
+
+def instrument_app(app: Flask):
+    """Record the duration of all requests and serve the metrics on /metrics."""
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_request_start = monotonic()
+
+    @app.after_request
+    def _record_request_duration(response):
+        start = g.pop("_metrics_request_start", None)
+        if start is not None:
+            REQUEST_DURATION.observe(
+                monotonic() - start,
+                endpoint=request.endpoint or "unknown",
+                method=request.method,
+                status=response.status_code,
+            )
+        return response
+
+    def metrics():
+        return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+    app.add_url_rule("/metrics", "metrics", metrics)
@@ -0,0 +1,150 @@
+"""Tracing of the phases of operations that call several dependencies (i.e. launching
+a session).
+
+The spans of a trace are always kept in memory so that their durations can be logged,
+recorded in metrics and returned in the Server-Timing header. When tracing is enabled
+the spans are also exported with OpenTelemetry and when Sentry is enabled they are
+added to the Sentry transaction of the request."""
+from contextlib import contextmanager
+from dataclasses import dataclass
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Optional
+
+from ..config import config
+
+_otel_tracer = None
+
+
+def configure_tracing():
+    """Set up the OpenTelemetry exporter if tracing is enabled.
+
+    The optional opentelemetry-sdk package is required, and for the otlp exporter the
+    opentelemetry-exporter-otlp-proto-grpc package as well."""
+    global _otel_tracer
+    if not config.tracing.enabled:
+        return
+    try:
+        from opentelemetry import trace
+        from opentelemetry.sdk.resources import SERVICE_NAME, Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import (
+            BatchSpanProcessor,
+            ConsoleSpanExporter,
+        )
+    except ImportError as err:
+        raise ImportError(
+            "Tracing requires the opentelemetry-sdk package, "
+            "it can be installed with 'pip install opentelemetry-sdk'."
+        ) from err
+
+    if config.tracing.exporter == "otlp":
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import (
+            OTLPSpanExporter,
+        )
+
+        exporter = OTLPSpanExporter(endpoint=config.tracing.otlp_endpoint)
+    else:
+        exporter = ConsoleSpanExporter()
+    provider = TracerProvider(
+        resource=Resource.create({SERVICE_NAME: config.tracing.service_name})
+    )
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    _otel_tracer = trace.get_tracer(__name__)
+
+
+def _get_sentry_span():
+    if not config.sentry.enabled:
+        return None
+    import sentry_sdk
+
+    return sentry_sdk.Hub.current.scope.span
+
+
+@dataclass
+class Span:
+    name: str
+    start: float
+    duration: Optional[float] = None
+    failed: bool = False
+
+
+class Trace:
+    """The spans of a single operation. Spans can be started from several threads.
+
+    The trace is used as a context manager around the whole operation, the exported
+    spans are children of a span for the whole operation."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.spans: List[Span] = []
+        self._lock = Lock()
+        self._otel_span = None
+        self._otel_context = None
+        self._sentry_span = None
+
+    def __enter__(self):
+        if _otel_tracer is not None:
+            from opentelemetry import trace
+
+            self._otel_span = _otel_tracer.start_span(self.name)
+            self._otel_context = trace.set_span_in_context(self._otel_span)
+        sentry_parent = _get_sentry_span()
+        if sentry_parent is not None:
+            self._sentry_span = sentry_parent.start_child(op=self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._otel_span is not None:
+            self._otel_span.end()
+            self._otel_span = self._otel_context = None
+        if self._sentry_span is not None:
+            self._sentry_span.finish()
+            self._sentry_span = None
+
+    @contextmanager
+    def span(self, name: str):
+        """Record the duration of a phase of the operation."""
+        record = Span(name=name, start=monotonic())
+        otel_span = (
+            _otel_tracer.start_span(name, context=self._otel_context)
+            if _otel_tracer is not None
+            else None
+        )
+        sentry_span = (
+            self._sentry_span.start_child(op=name)
+            if self._sentry_span is not None
+            else None
+        )
+        try:
+            yield record
+        except Exception as err:
+            record.failed = True
+            if otel_span is not None:
+                otel_span.record_exception(err)
+            raise
+        finally:
+            record.duration = monotonic() - record.start
+            with self._lock:
+                self.spans.append(record)
+            if otel_span is not None:
+                otel_span.end()
+            if sentry_span is not None:
+                sentry_span.finish()
+
+    @property
+    def timings(self) -> Dict[str, float]:
+        """The duration in seconds of the finished spans by name, spans that were
+        started more than once are summed."""
+        timings: Dict[str, float] = {}
+        with self._lock:
+            for span in self.spans:
+                timings[span.name] = timings.get(span.name, 0.0) + span.duration
+        return timings
+
+    def server_timing(self) -> str:
+        """Format the durations of the spans as the value of a Server-Timing header."""
+        return ", ".join(
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.timings.items()
+        )
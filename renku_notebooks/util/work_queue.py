@@ -0,0 +1,106 @@
+"""An in-process queue for work that does not have to finish before a response is sent."""
+from collections import deque
+from queue import Full, Queue
+from threading import Lock, Thread
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from flask import current_app, has_app_context
+
+
+class WorkQueue:
+    """A bounded queue of jobs that are run one at a time in a background thread.
+
+    Jobs are deduplicated by key, a job is not added if a job with the same key is
+    still waiting in the queue. Jobs are dropped when the queue is full. The Flask app
+    context of the caller is pushed when the job runs."""
+
+    def __init__(self, name: str, maxsize: int = 1000, latency_samples: int = 100):
+        self.name = name
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self._queue: Queue = Queue(maxsize=maxsize)
+        self._pending_keys = set()
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+        self._wait_seconds = deque(maxlen=latency_samples)
+        self._run_seconds = deque(maxlen=latency_samples)
+
+    @property
+    def depth(self) -> int:
+        """The number of jobs that are waiting to run."""
+        return self._queue.qsize()
+
+    def enqueue(self, key: Hashable, fn: Callable, *args, **kwargs) -> bool:
+        """Add a job to the queue, returns False if the job was deduplicated or dropped."""
+        app = current_app._get_current_object() if has_app_context() else None
+        with self._lock:
+            if key in self._pending_keys:
+                return False
+            try:
+                self._queue.put_nowait((key, app, monotonic(), fn, args, kwargs))
+            except Full:
+                self.dropped += 1
+                if app is not None:
+                    app.logger.warning(
+                        f"The {self.name} queue is full, dropping job {key}."
+                    )
+                return False
+            self._pending_keys.add(key)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(
+                    target=self._run, name=f"{self.name}-worker", daemon=True
+                )
+                self._thread.start()
+        return True
+
+    def join(self):
+        """Block until all the jobs in the queue have run."""
+        self._queue.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """The size of the queue and the time jobs spent waiting and running."""
+        with self._lock:
+            wait_seconds = list(self._wait_seconds)
+            run_seconds = list(self._run_seconds)
+        return {
+            "depth": self.depth,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "wait_seconds_avg": _avg(wait_seconds),
+            "wait_seconds_max": max(wait_seconds, default=0.0),
+            "run_seconds_avg": _avg(run_seconds),
+            "run_seconds_max": max(run_seconds, default=0.0),
+        }
+
+    def _run(self):
+        while True:
+            key, app, enqueued_at, fn, args, kwargs = self._queue.get()
+            with self._lock:
+                self._pending_keys.discard(key)
+            started_at = monotonic()
+            try:
+                if app is not None:
+                    with app.app_context():
+                        fn(*args, **kwargs)
+                else:
+                    fn(*args, **kwargs)
+            except Exception as err:
+                self.failed += 1
+                if app is not None:
+                    app.logger.warning(
+                        f"Job {key} in the {self.name} queue failed: {err}"
+                    )
+            else:
+                self.processed += 1
+            finally:
+                with self._lock:
+                    self._wait_seconds.append(started_at - enqueued_at)
+                    self._run_seconds.append(monotonic() - started_at)
+                self._queue.task_done()
+
+
+def _avg(values) -> float:
+    return sum(values) / len(values) if values else 0.0
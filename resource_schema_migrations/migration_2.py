@@ -0,0 +1,74 @@
+from hashlib import md5
+
+from kubernetes import client
+from kubernetes import config as k8s_config
+
+from run_all import parse_args
+import config
+
+
+def make_label_value(value):
+    # NOTE: This has to match renku_notebooks.util.kubernetes_.make_label_value
+    return md5(value.encode()).hexdigest()
+
+
+def add_filter_labels(args):
+    k8s_config.load_config()
+    k8s_api = client.CustomObjectsApi(client.ApiClient())
+
+    print(
+        "Running migration 2: Adding the hashed namespace, project and branch "
+        "labels used to filter sessions."
+    )
+
+    next_page = ""
+    dry_run_prefix = "DRY RUN: " if args.dry_run else ""
+
+    while True:
+        jss = k8s_api.list_namespaced_custom_object(
+            version=args.api_version,
+            namespace=args.namespace,
+            plural=args.plural,
+            limit=config.PAGINATION_LIMIT,
+            group=args.group,
+            _continue=next_page,
+            # select only servers that are not already at schema version 2
+            label_selector=f"{args.prefix}{config.SCHEMA_VERSION_LABEL_NAME}!=2",
+        )
+
+        for js in jss["items"]:
+            js_name = js["metadata"]["name"]
+            annotations = js["metadata"].get("annotations", {})
+            print(f"Checking session {js_name}")
+            labels = {f"{args.prefix}{config.SCHEMA_VERSION_LABEL_NAME}": "2"}
+            for annotation_name, label_name, lowercase in [
+                ("namespace", "namespace-hash", True),
+                ("projectName", "project-hash", True),
+                ("branch", "branch-hash", False),
+            ]:
+                annotation_val = annotations.get(f"{args.prefix}{annotation_name}")
+                if annotation_val is None:
+                    print(f"Annotation {annotation_name} not found in {js_name}.")
+                    continue
+                if lowercase:
+                    annotation_val = annotation_val.lower()
+                labels[f"{args.prefix}{label_name}"] = make_label_value(annotation_val)
+            print(f"{dry_run_prefix}Patching {js_name} with labels {labels}")
+            if not args.dry_run:
+                k8s_api.patch_namespaced_custom_object(
+                    group=args.group,
+                    version=args.api_version,
+                    namespace=args.namespace,
+                    plural=args.plural,
+                    name=js_name,
+                    body={"metadata": {"labels": labels}},
+                )
+
+        next_page = jss["metadata"].get("continue")
+        if next_page is None or next_page == "":
+            break
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    add_filter_labels(args)
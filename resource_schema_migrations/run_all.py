@@ -3,6 +3,7 @@ import os
 import re
 
 import migration_1
+import migration_2
 import config
 
 
@@ -62,6 +63,7 @@ def run_all(args):
     # Run all migrations in order
     print("Starting k8s resource migrations.")
     migration_1.adjust_annotations(args)
+    migration_2.add_filter_labels(args)
 
 
 if __name__ == "__main__":
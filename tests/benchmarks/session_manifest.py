@@ -0,0 +1,83 @@
+"""Micro-benchmark of building the manifest of a session.
+
+Compares building the manifest with the memoized config patches against
+rebuilding every patch from scratch, as was done before the patches were memoized.
+
+Run from the root of the repository with:
+    python -m tests.benchmarks.session_manifest
+"""
+import os
+from timeit import repeat
+from unittest.mock import MagicMock, patch
+
+os.environ.setdefault("NB_GIT__URL", "https://gitlab-url.com")
+os.environ.setdefault("NB_GIT__REGISTRY", "registry.gitlab-url.com")
+os.environ.setdefault("NB_SESSIONS__INGRESS__HOST", "renkulab.io")
+os.environ.setdefault("NB_SESSIONS__OIDC__CLIENT_SECRET", "oidc_client_secret")
+os.environ.setdefault("NB_SESSIONS__OIDC__TOKEN_URL", "http://localhost/token")
+os.environ.setdefault("NB_SESSIONS__OIDC__AUTH_URL", "http://localhost/auth")
+os.environ.setdefault(
+    "NB_SERVER_OPTIONS__DEFAULTS_PATH", "tests/unit/dummy_server_defaults.json"
+)
+os.environ.setdefault(
+    "NB_SERVER_OPTIONS__UI_CHOICES_PATH", "tests/unit/dummy_server_options.json"
+)
+os.environ.setdefault("NB_K8S__ENABLED", "false")
+
+from renku_notebooks.api.amalthea_patches.utils import (  # noqa: E402
+    clear_config_patches_cache,
+)
+from renku_notebooks.api.classes.server import UserServer  # noqa: E402
+from renku_notebooks.wsgi import app  # noqa: E402
+
+
+def make_server():
+    user = MagicMock()
+    user.username = "john"
+    user.safe_username = "john"
+    user.get_renku_project.return_value.path = "project"
+    user.get_renku_project.return_value.path_with_namespace = "namespace/project"
+    server = UserServer(
+        user=user,
+        namespace="namespace",
+        project="project",
+        branch="master",
+        commit_sha="abcdefg123456789",
+        notebook="",
+        image="renku/singleuser:latest",
+        server_options={
+            "lfs_auto_fetch": 0,
+            "defaultUrl": "/lab",
+            "cpu_request": "1",
+            "mem_request": "1G",
+            "disk_request": "1G",
+        },
+        environment_variables={},
+        cloudstorage=[],
+    )
+    server.verified_image = server.image
+    server.image_workdir = "/home/jovyan"
+    return server
+
+
+def uncached(server):
+    clear_config_patches_cache()
+    server._get_session_manifest()
+
+
+def main(number=200, repetitions=5):
+    with app.app_context(), patch.object(UserServer, "_check_flask_config"), patch(
+        "renku_notebooks.api.classes.server.client"
+    ):
+        server = make_server()
+        for name, fn in [
+            ("rebuilt patches", lambda: uncached(server)),
+            ("memoized patches", server._get_session_manifest),
+        ]:
+            fn()  # warm up
+            best = min(repeat(fn, number=number, repeat=repetitions)) / number
+            print(f"{name:>18}: {best * 1e6:8.1f} us per manifest")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import json
+
+from unittest.mock import call
+
+import pytest
+from kubernetes.client.exceptions import ApiException
+
+from renku_notebooks.config import config
+
+ADMIN_KEY = "admin-key"
+
+
+@pytest.fixture
+def admin_key(mocker):
+    mocker.patch.object(config.admin, "api_key", ADMIN_KEY)
+    return {"Renku-Auth-Admin-Key": ADMIN_KEY}
+
+
+@pytest.fixture
+def k8s_api(mocker):
+    api = mocker.MagicMock()
+    mocker.patch("renku_notebooks.api.admin._k8s_api").return_value = api
+    return api
+
+
+def _js(name):
+    return {
+        "metadata": {
+            "name": name,
+            "resourceVersion": "1",
+            "labels": {"renku.io/safe-username": "john"},
+            "annotations": {"renku.io/username": "john"},
+        },
+        "spec": {"culling": {"idleSecondsThreshold": 60}},
+    }
+
+
+def _results(res):
+    return [json.loads(line) for line in res.get_data(as_text=True).splitlines()]
+
+
+def test_admin_endpoints_require_the_key(client, admin_key, k8s_api):
+    res = client.get(
+        "/notebooks/admin/servers", headers={"Renku-Auth-Admin-Key": "wrong"}
+    )
+    assert res.status_code == 401
+    k8s_api.list_namespaced_custom_object.assert_not_called()
+
+
+def test_admin_endpoints_are_disabled_without_key(client, k8s_api):
+    res = client.get("/notebooks/admin/servers")
+    assert res.status_code == 401
+
+
+def test_admin_list_servers_is_paginated(client, admin_key, k8s_api):
+    k8s_api.list_namespaced_custom_object.return_value = {
+        "items": [_js("server-1")],
+        "metadata": {"continue": "token"},
+    }
+    res = client.get(
+        "/notebooks/admin/servers?limit=1&continue=previous", headers=admin_key
+    )
+    assert res.status_code == 200
+    assert res.json["continue"] == "token"
+    assert res.json["servers"][0]["name"] == "server-1"
+    assert res.json["servers"][0]["username"] == "john"
+    kwargs = k8s_api.list_namespaced_custom_object.call_args.kwargs
+    assert kwargs["limit"] == 1
+    assert kwargs["_continue"] == "previous"
+
+
+def test_admin_delete_servers_by_label_selector(mocker, client, admin_key, k8s_api):
+    record_write = mocker.patch("renku_notebooks.api.admin.record_write")
+    k8s_api.list_namespaced_custom_object.side_effect = [
+        {"items": [_js("server-1"), _js("server-2")], "metadata": {"continue": "a"}},
+        {"items": [_js("server-3")], "metadata": {}},
+    ]
+
+    def _delete(**kwargs):
+        if kwargs["name"] == "server-2":
+            raise ApiException(status=404)
+
+    k8s_api.delete_namespaced_custom_object.side_effect = _delete
+    res = client.delete(
+        "/notebooks/admin/servers",
+        json={"label_selector": "renku.io/safe-username=john"},
+        headers=admin_key,
+    )
+    assert res.status_code == 200
+    results = _results(res)
+    assert results[-1] == {"summary": {"succeeded": 2, "failed": 0, "not_found": 1}}
+    assert {result["name"] for result in results[:-1]} == {
+        "server-1",
+        "server-2",
+        "server-3",
+    }
+    assert k8s_api.list_namespaced_custom_object.call_count == 2
+    assert sorted(record_write.call_args_list) == [
+        call("server-1", "john"),
+        call("server-3", "john"),
+    ]
+
+
+def test_admin_delete_servers_requires_a_selection(client, admin_key, k8s_api):
+    res = client.delete("/notebooks/admin/servers", json={}, headers=admin_key)
+    assert res.status_code == 422
+    k8s_api.delete_namespaced_custom_object.assert_not_called()
+
+
+def test_admin_patch_culling(mocker, client, admin_key, k8s_api):
+    record_write = mocker.patch("renku_notebooks.api.admin.record_write")
+    k8s_api.patch_namespaced_custom_object.return_value = _js("server-1")
+    res = client.patch(
+        "/notebooks/admin/servers/culling",
+        json={"names": ["server-1", "server-1"], "idle_seconds_threshold": 3600},
+        headers=admin_key,
+    )
+    assert res.status_code == 200
+    assert _results(res)[-1] == {
+        "summary": {"succeeded": 1, "failed": 0, "not_found": 0}
+    }
+    kwargs = k8s_api.patch_namespaced_custom_object.call_args.kwargs
+    assert kwargs["name"] == "server-1"
+    assert kwargs["body"] == {"spec": {"culling": {"idleSecondsThreshold": 3600}}}
+    record_write.assert_called_once_with("server-1", "john", "1")
+
+
+def test_admin_endpoints_are_documented(client):
+    spec = client.get("/notebooks/spec.json").json
+    assert spec["components"]["securitySchemes"]["admin-key"] == {
+        "type": "apiKey",
+        "in": "header",
+        "name": "Renku-Auth-Admin-Key",
+        "description": "The API key of the admin endpoints.",
+    }
+    operations = [
+        spec["paths"]["/notebooks/admin/servers"]["get"],
+        spec["paths"]["/notebooks/admin/servers"]["delete"],
+        spec["paths"]["/notebooks/admin/servers/culling"]["patch"],
+    ]
+    for operation in operations:
+        assert operation["security"] == [{"admin-key": []}]
+        assert operation["tags"] == ["admin"]
@@ -0,0 +1,143 @@
+import pytest
+
+from renku_notebooks.util.informer import JupyterServerInformer
+
+
+def make_js(name, username, resource_version="1", server_name=None):
+    return {
+        "metadata": {
+            "name": name,
+            "resourceVersion": resource_version,
+            "labels": {"renku.io/safe-username": username},
+            "annotations": {"renku.io/servername": server_name or name},
+        }
+    }
+
+
+@pytest.fixture
+def informer():
+    return JupyterServerInformer(
+        namespace="test",
+        group="amalthea.dev",
+        version="v1alpha1",
+        plural="jupyterservers",
+        username_label="renku.io/safe-username",
+        servername_annotation="renku.io/servername",
+    )
+
+
+def test_informer_list_and_get(informer):
+    assert not informer.has_synced
+    informer._replace_all(
+        [make_js("s1", "john"), make_js("s2", "john"), make_js("s3", "jane")], "10"
+    )
+    assert informer.has_synced
+    assert [js["metadata"]["name"] for js in informer.list("john")] == ["s1", "s2"]
+    assert [js["metadata"]["name"] for js in informer.list("jane")] == ["s3"]
+    assert informer.list("nobody") == []
+    assert informer.get("s3")["metadata"]["labels"]["renku.io/safe-username"] == "jane"
+    assert informer.get("missing") is None
+
+
+def test_informer_returns_copies(informer):
+    informer._replace_all([make_js("s1", "john")], "10")
+    informer.get("s1")["metadata"]["name"] = "changed"
+    assert informer.get("s1")["metadata"]["name"] == "s1"
+
+
+def test_informer_snapshot(informer):
+    informer._replace_all([make_js("s1", "john"), make_js("s2", "jane")], "10")
+    informer._handle_event(
+        {"type": "BOOKMARK", "raw_object": {"metadata": {"resourceVersion": "12"}}}
+    )
+    jss, resource_version = informer.snapshot("john")
+    assert [js["metadata"]["name"] for js in jss] == ["s1"]
+    assert resource_version == "12"
+
+
+def test_informer_events(informer):
+    informer._replace_all([make_js("s1", "john")], "10")
+    informer._handle_event(
+        {"type": "ADDED", "raw_object": make_js("s2", "john", resource_version="11")}
+    )
+    informer._handle_event(
+        {"type": "MODIFIED", "raw_object": make_js("s1", "jane", resource_version="12")}
+    )
+    assert [js["metadata"]["name"] for js in informer.list("john")] == ["s2"]
+    assert [js["metadata"]["name"] for js in informer.list("jane")] == ["s1"]
+    informer._handle_event(
+        {"type": "DELETED", "raw_object": make_js("s2", "john", resource_version="13")}
+    )
+    assert informer.list("john") == []
+    assert informer.get("s2") is None
+    informer._handle_event(
+        {"type": "BOOKMARK", "raw_object": {"metadata": {"resourceVersion": "20"}}}
+    )
+    assert informer._resource_version == "20"
+
+
+def test_informer_relist_replaces_state(informer):
+    informer._replace_all([make_js("s1", "john"), make_js("s2", "john")], "10")
+    informer._replace_all([make_js("s2", "john")], "30")
+    assert [js["metadata"]["name"] for js in informer.list("john")] == ["s2"]
+    assert informer.get("s1") is None
+
+
+def test_informer_subscriptions(informer):
+    informer._replace_all([make_js("s1", "john"), make_js("s2", "jane")], "10")
+    subscription = informer.subscribe("john")
+    informer._handle_event(
+        {"type": "MODIFIED", "raw_object": make_js("s1", "john", resource_version="11")}
+    )
+    informer._handle_event(
+        {"type": "ADDED", "raw_object": make_js("s3", "jane", resource_version="12")}
+    )
+    event_type, js = subscription.events.get_nowait()
+    assert event_type == "MODIFIED"
+    assert js["metadata"]["resourceVersion"] == "11"
+    assert subscription.events.empty()
+    # NOTE: A relist notifies the subscribers about the differences
+    informer._replace_all([make_js("s4", "john", resource_version="13")], "20")
+    events = [subscription.events.get_nowait() for _ in range(2)]
+    assert [(t, js["metadata"]["name"]) for t, js in events] == [
+        ("DELETED", "s1"),
+        ("ADDED", "s4"),
+    ]
+    informer.unsubscribe(subscription)
+    informer._handle_event(
+        {"type": "DELETED", "raw_object": make_js("s4", "john", resource_version="21")}
+    )
+    assert subscription.events.empty()
+
+
+def test_informer_pending_writes(informer):
+    informer._replace_all([make_js("s1", "john")], "10")
+    informer.record_write("s2", "john", "11")
+    informer.record_write("s1", "john")
+    assert informer.has_pending_writes("john")
+    assert informer.has_pending_writes(name="s2")
+    assert not informer.has_pending_writes("jane")
+    # NOTE: An older change does not deliver the write
+    informer._handle_event(
+        {"type": "ADDED", "raw_object": make_js("s2", "john", resource_version="9")}
+    )
+    assert informer.has_pending_writes(name="s2")
+    informer._handle_event(
+        {"type": "MODIFIED", "raw_object": make_js("s2", "john", resource_version="11")}
+    )
+    assert not informer.has_pending_writes(name="s2")
+    # NOTE: A write without resource version is a deletion
+    informer._handle_event(
+        {"type": "MODIFIED", "raw_object": make_js("s1", "john", resource_version="12")}
+    )
+    assert informer.has_pending_writes(name="s1")
+    informer._handle_event(
+        {"type": "DELETED", "raw_object": make_js("s1", "john", resource_version="13")}
+    )
+    assert not informer.has_pending_writes("john")
+
+
+def test_informer_pending_writes_expire(informer):
+    informer.pending_write_seconds = 0
+    informer.record_write("s1", "john", "11")
+    assert not informer.has_pending_writes("john")
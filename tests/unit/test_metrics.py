@@ -0,0 +1,90 @@
+import pytest
+from flask import Flask
+
+from renku_notebooks.util.cache import TTLCache
+from renku_notebooks.util.metrics import (
+    Counter,
+    Histogram,
+    Registry,
+    REGISTRY,
+    instrument_app,
+    register_cache,
+    track_dependency,
+)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """The global registry without any collectors or recorded values. Everything that
+    a test records or registers is removed again when the test is done."""
+    monkeypatch.setattr(REGISTRY, "_collectors", [])
+    for metric in REGISTRY._metrics:
+        monkeypatch.setattr(metric, "_values", {})
+        if isinstance(metric, Histogram):
+            monkeypatch.setattr(metric, "_histograms", {})
+    return REGISTRY
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test histogram.", ["op"], buckets=[1, 5])
+    histogram.observe(0.5, op="a")
+    histogram.observe(2, op="a")
+    histogram.observe(10, op="a")
+    rendered = histogram.render()
+    assert "# TYPE test_seconds histogram" in rendered
+    assert 'test_seconds_bucket{op="a",le="1"} 1' in rendered
+    assert 'test_seconds_bucket{op="a",le="5"} 2' in rendered
+    assert 'test_seconds_bucket{op="a",le="+Inf"} 3' in rendered
+    assert 'test_seconds_sum{op="a"} 12.5' in rendered
+    assert 'test_seconds_count{op="a"} 3' in rendered
+
+
+def test_counter_escapes_label_values():
+    registry = Registry()
+    counter = registry.register(Counter("test_total", "Test counter.", ["name"]))
+    counter.inc(name='a"b')
+    counter.inc(2, name='a"b')
+    assert 'test_total{name="a\\"b"} 3' in registry.render()
+
+
+def test_track_dependency_counts_errors(registry):
+    with pytest.raises(ValueError):
+        with track_dependency("test_dependency", "fail"):
+            raise ValueError()
+    rendered = registry.render()
+    assert (
+        'notebooks_dependency_errors_total{dependency="test_dependency",operation="fail"} 1'
+        in rendered
+    )
+    assert (
+        'notebooks_dependency_request_duration_seconds_count{dependency="test_dependency",'
+        'operation="fail"} 1'
+    ) in rendered
+
+
+def test_cache_metrics_are_collected_on_render(registry):
+    cache = TTLCache(maxsize=10, ttl=None)
+    register_cache("test_cache", cache)
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("b")
+    rendered = registry.render()
+    assert 'notebooks_cache_hits_total{cache="test_cache"} 1' in rendered
+    assert 'notebooks_cache_misses_total{cache="test_cache"} 1' in rendered
+    assert 'notebooks_cache_hit_ratio{cache="test_cache"} 0.5' in rendered
+    assert 'notebooks_cache_size{cache="test_cache"} 1' in rendered
+
+
+def test_metrics_endpoint_records_requests(registry):
+    app = Flask(__name__)
+    app.add_url_rule("/ping", "ping", lambda: "pong")
+    instrument_app(app)
+    client = app.test_client()
+    assert client.get("/ping").status_code == 200
+    res = client.get("/metrics")
+    assert res.status_code == 200
+    assert res.mimetype == "text/plain"
+    assert (
+        'notebooks_request_duration_seconds_count{endpoint="ping",method="GET",status="200"} 1'
+        in res.get_data(as_text=True)
+    )
@@ -0,0 +1,126 @@
+import pytest
+
+
+@pytest.fixture
+def user(mocker):
+    user = mocker.MagicMock()
+    user.authenticated = True
+    user.safe_username = "john"
+    mocker.patch("renku_notebooks.api.auth.RegisteredUser").return_value = user
+    return user
+
+
+def test_server_logs_stream_splits_lines(client, user, mocker):
+    server = mocker.patch(
+        "renku_notebooks.api.notebooks.UserServer.from_server_name"
+    ).return_value
+    server.stream_logs.return_value = (
+        item
+        for item in [
+            ("jupyter-server", "first line"),
+            ("jupyter-server", "10%\r50%\r\n100%\nevent: fake"),
+            None,
+            ("git-proxy", ""),
+        ]
+    )
+    res = client.get("/notebooks/logs/server/stream")
+    assert res.status_code == 200
+    assert res.get_data(as_text=True) == (
+        "event: jupyter-server\ndata: first line\n\n"
+        "event: jupyter-server\ndata: 10%\ndata: 50%\ndata: 100%\n"
+        "data: event: fake\n\n"
+        ": heartbeat\n\n"
+        "event: git-proxy\ndata: \n\n"
+        "event: end\ndata: \n\n"
+    )
+
+
+@pytest.mark.parametrize("exists,created", [(True, None), (False, False)])
+def test_launch_existing_server(app, mocker, exists, created):
+    from renku_notebooks.api import notebooks
+
+    enqueue = mocker.patch.object(notebooks.autosave_cleanup_queue, "enqueue")
+    mocker.patch("renku_notebooks.api.notebooks.NotebookResponse")
+    server = mocker.MagicMock()
+    server.server_exists.return_value = exists
+    server.start.return_value = created
+    with app.app_context():
+        _, status, headers = notebooks._launch_server(mocker.MagicMock(), server)
+    assert (status, headers) == (200, {})
+    server.get_js.assert_called_once_with(direct=True)
+    assert server.start.called is not exists
+    enqueue.assert_not_called()
+
+
+def _js(name, namespace="namespace", project="project"):
+    return {
+        "metadata": {
+            "name": name,
+            "creationTimestamp": "2022-10-01T10:00:00Z",
+            "annotations": {
+                "renku.io/servername": name,
+                "renku.io/namespace": namespace,
+                "renku.io/projectName": project,
+                "renku.io/branch": "master",
+                "renku.io/commit-sha": "abc",
+                "renku.io/repository": f"https://gitlab.com/{namespace}/{project}",
+                "renku.io/default_image_used": "False",
+            },
+        },
+        "spec": {"jupyterServer": {"image": "image"}},
+        "status": {"state": "running"},
+    }
+
+
+def test_user_servers_light(client, user):
+    user.get_jss.return_value = ([_js("server-1")], "token")
+    res = client.get("/notebooks/servers?light=true&limit=1&continue=previous")
+    assert res.status_code == 200
+    assert res.json["continue"] == "token"
+    server = res.json["servers"]["server-1"]
+    assert set(server) == {"annotations", "name", "started", "status", "image"}
+    assert server["status"] == {"state": "running"}
+    assert server["image"] == "image"
+    assert server["annotations"]["renku.io/projectName"] == "project"
+    assert user.get_jss.call_args.args[1:] == (1, "previous")
+
+
+def test_user_servers_checks_hashed_labels_against_annotations(client, user, mocker):
+    # NOTE: The label selector matches hashes of the values, a server whose hash
+    # collides with the requested project must still be filtered out.
+    user.get_jss.return_value = (
+        [_js("server-1"), _js("server-2", project="other")],
+        None,
+    )
+    res = client.get("/notebooks/servers?light=true&project=project")
+    assert res.status_code == 200
+    assert list(res.json["servers"]) == ["server-1"]
+    labels = user.get_jss.call_args.args[0]
+    assert "project" not in labels.values()
+    assert "continue" not in res.json
+
+
+def test_user_servers_continue_requires_limit(client, user):
+    res = client.get("/notebooks/servers?continue=previous")
+    assert res.status_code == 422
+    user.get_jss.assert_not_called()
+
+
+def test_server_logs_stream_closes_logs_on_disconnect(client, user, mocker):
+    closed = []
+
+    def _logs():
+        try:
+            while True:
+                yield None
+        finally:
+            closed.append(True)
+
+    server = mocker.patch(
+        "renku_notebooks.api.notebooks.UserServer.from_server_name"
+    ).return_value
+    server.stream_logs.return_value = _logs()
+    res = client.get("/notebooks/logs/server/stream?follow=true", buffered=False)
+    assert next(res.response) == b": heartbeat\n\n"
+    res.close()
+    assert closed == [True]
@@ -203,3 +203,103 @@ def test_image_workdir_check():
     workdir = get_image_workdir(**parse_image_name(image), token=token)
     assert workdir == "/home/jovyan"
     assert get_image_workdir("invalid_host", "invalid_image", "invalid_tag") is None
+
+
+@pytest.fixture
+def registry_responses(mocker):
+    from renku_notebooks.util import check_image
+
+    for cache in [
+        check_image._challenge_cache,
+        check_image._token_cache,
+        check_image._manifest_cache,
+        check_image._blob_cache,
+    ]:
+        cache.clear()
+
+    def response(status_code, json=None, headers=None):
+        res = mocker.MagicMock()
+        res.status_code = status_code
+        res.json.return_value = json
+        res.headers = headers or {}
+        return res
+
+    responses = {
+        "https://registry.io/v2/user/image/manifests/tag": [
+            response(
+                401,
+                headers={
+                    "Www-Authenticate": 'Bearer realm="https://auth.io/token",'
+                    'service="registry.io",scope="repository:user/image:pull"'
+                },
+            ),
+            response(
+                200,
+                json={"config": {"digest": "sha256:abc"}},
+                headers={"ETag": '"etag"'},
+            ),
+            response(304),
+        ],
+        "https://auth.io/token": [
+            response(200, json={"token": "t", "expires_in": 300})
+        ],
+        "https://registry.io/v2/user/image/blobs/sha256:abc": [
+            response(200, json={"config": {"WorkingDir": "/home/user"}})
+        ],
+        "https://registry.io/v2/user/missing/manifests/tag": [response(404)],
+        "https://registry.io/v2/user/limited/manifests/tag": [
+            response(429),
+            response(503),
+            response(200, json={"config": {"digest": "sha256:abc"}}),
+        ],
+        "https://registry.io/v2/user/image/manifests/sha256:def": [
+            response(200, json={"config": {"digest": "sha256:abc"}}),
+        ],
+    }
+
+    def _get(url, **kwargs):
+        return responses[url].pop(0)
+
+    session = mocker.patch("renku_notebooks.util.check_image.get_http_session")
+    session.return_value.get.side_effect = _get
+    return session.return_value.get
+
+
+def test_registry_lookups_are_cached(registry_responses):
+    for _ in range(3):
+        token, is_private = get_docker_token("registry.io", "user/image", "tag", None)
+        assert (token, is_private) == ("t", False)
+        assert image_exists("registry.io", "user/image", "tag", token)
+        assert get_image_workdir("registry.io", "user/image", "tag", token) == (
+            "/home/user"
+        )
+    # challenge, token, manifest and blob are all requested exactly once
+    assert registry_responses.call_count == 4
+
+
+def test_registry_manifest_revalidation(registry_responses, mocker):
+    token, _ = get_docker_token("registry.io", "user/image", "tag", None)
+    assert image_exists("registry.io", "user/image", "tag", token)
+    mocker.patch("renku_notebooks.util.check_image.monotonic", return_value=1e12)
+    assert image_exists("registry.io", "user/image", "tag", token)
+    assert registry_responses.call_args.kwargs["headers"]["If-None-Match"] == '"etag"'
+
+
+def test_registry_missing_image_is_cached(registry_responses):
+    assert not image_exists("registry.io", "user/missing", "tag")
+    assert not image_exists("registry.io", "user/missing", "tag")
+    assert registry_responses.call_count == 1
+
+
+def test_registry_errors_are_not_cached(registry_responses):
+    assert not image_exists("registry.io", "user/limited", "tag")
+    assert not image_exists("registry.io", "user/limited", "tag")
+    assert image_exists("registry.io", "user/limited", "tag")
+    assert registry_responses.call_count == 3
+
+
+def test_registry_manifest_by_digest_never_expires(registry_responses, mocker):
+    assert image_exists("registry.io", "user/image", "sha256:def")
+    mocker.patch("renku_notebooks.util.check_image.monotonic", return_value=1e12)
+    assert image_exists("registry.io", "user/image", "sha256:def")
+    assert registry_responses.call_count == 1
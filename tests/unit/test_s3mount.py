@@ -0,0 +1,31 @@
+import pytest
+
+from renku_notebooks.api.classes.s3mount import S3mount, _s3_clients
+
+
+@pytest.fixture
+def boto3_session(mocker):
+    _s3_clients.clear()
+    yield mocker.patch("boto3.session.Session")
+    _s3_clients.clear()
+
+
+def test_s3mount_does_not_create_a_client(boto3_session):
+    S3mount("bucket", "/cloudstorage", "https://s3.amazonaws.com", "key", "secret")
+    boto3_session.assert_not_called()
+
+
+def test_s3_clients_are_shared_by_endpoint_and_credentials(boto3_session):
+    boto3_session.return_value.client.side_effect = lambda **kwargs: object()
+    mounts = [
+        S3mount("bucket-1", "/cloudstorage", "https://s3.amazonaws.com", "key", "s"),
+        S3mount("bucket-2", "/cloudstorage", "https://s3.amazonaws.com", "key", "s"),
+        S3mount("bucket-3", "/cloudstorage", "https://s3.amazonaws.com", "other", "s"),
+        S3mount("bucket-4", "/cloudstorage", "https://s3.amazonaws.com"),
+    ]
+    clients = [mount.client for mount in mounts]
+    assert clients[0] is clients[1]
+    assert clients[0] is not clients[2]
+    assert clients[0] is not clients[3]
+    assert boto3_session.return_value.client.call_count == 3
+    assert "config" in boto3_session.return_value.client.call_args.kwargs
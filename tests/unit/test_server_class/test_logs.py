@@ -0,0 +1,162 @@
+from threading import Barrier, Event
+from unittest.mock import MagicMock
+
+import pytest
+from kubernetes.client.exceptions import ApiException
+
+from renku_notebooks.api.classes.server import UserServer
+from renku_notebooks.errors.user import MissingResourceError
+
+
+class FakeLogResponse:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.released = False
+
+    def stream(self, amt, decode_content=True):
+        yield from self.chunks
+
+    def release_conn(self):
+        self.released = True
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def server_with_logs(app, patch_user_server, user_with_project_path):
+    def _server_with_logs(logs):
+        with app.app_context():
+            server = UserServer(
+                user_with_project_path("namespace/project"),
+                "namespace",
+                "project",
+                "branch",
+                "12345678910",
+                "notebook",
+                "image",
+                "server_options",
+                {},
+                [],
+            )
+        server.js = {
+            "status": {
+                "mainPod": {
+                    "name": "pod",
+                    "status": {
+                        "containerStatuses": [{"name": name} for name in logs],
+                    },
+                }
+            }
+        }
+
+        def _read_namespaced_pod_log(pod, namespace, container, **kwargs):
+            if isinstance(logs[container], Exception):
+                raise logs[container]
+            if kwargs.get("_preload_content") is False:
+                return FakeLogResponse(logs[container])
+            return b"".join(logs[container]).decode()
+
+        server._k8s_client = MagicMock()
+        server._k8s_client.read_namespaced_pod_log.side_effect = (
+            _read_namespaced_pod_log
+        )
+        return server
+
+    yield _server_with_logs
+
+
+def test_stream_logs_multiplexes_containers(app, server_with_logs):
+    server = server_with_logs(
+        {
+            "jupyter-server": [b"line 1\nline", b" 2\n", b"line 3"],
+            "git-proxy": [b"proxy line\n"],
+            "git-sidecar": ApiException(status=400),
+        }
+    )
+    with app.app_context():
+        lines = list(server.stream_logs(follow=True, since_seconds=10))
+    assert [line for name, line in lines if name == "jupyter-server"] == [
+        "line 1",
+        "line 2",
+        "line 3",
+    ]
+    assert [line for name, line in lines if name == "git-proxy"] == ["proxy line"]
+    kwargs = server._k8s_client.read_namespaced_pod_log.call_args.kwargs
+    assert kwargs["follow"] is True
+    assert kwargs["since_seconds"] == 10
+
+
+def test_stream_logs_heartbeat_and_close(app, server_with_logs, mocker):
+    mocker.patch(
+        "renku_notebooks.api.classes.server.config.sessions.events_heartbeat_seconds",
+        0.01,
+    )
+    server = server_with_logs({"jupyter-server": [b"line 1\n"]})
+    response = FakeLogResponse([b"line 1\n"])
+    closed = Event()
+    response.close = closed.set
+
+    def _stream_until_closed(amt, decode_content=True):
+        yield b"line 1\n"
+        closed.wait(5)
+
+    response.stream = _stream_until_closed
+    server._k8s_client.read_namespaced_pod_log.side_effect = None
+    server._k8s_client.read_namespaced_pod_log.return_value = response
+    with app.app_context():
+        lines = server.stream_logs(follow=True)
+        assert next(lines) == ("jupyter-server", "line 1")
+        # NOTE: The container is idle, the consumer gets a chance to notice a disconnect
+        assert next(lines) is None
+        lines.close()
+    assert closed.is_set()
+
+
+def test_stream_logs_container_filter(app, server_with_logs):
+    server = server_with_logs(
+        {"jupyter-server": [b"line 1\n"], "git-proxy": [b"proxy line\n"]}
+    )
+    with app.app_context():
+        assert list(server.stream_logs(containers=["git-proxy"])) == [
+            ("git-proxy", "proxy line")
+        ]
+        with pytest.raises(MissingResourceError):
+            server.stream_logs(containers=["missing"])
+
+
+def test_get_logs_reads_containers_concurrently(app, server_with_logs, mocker):
+    mocker.patch(
+        "renku_notebooks.api.classes.server.config.sessions.log_max_bytes", 1000
+    )
+    server = server_with_logs(
+        {
+            "jupyter-server": [b"line 1\n"],
+            "git-proxy": [b"proxy line\n"],
+            "git-sidecar": ApiException(status=404),
+        }
+    )
+    mocker.patch(
+        "renku_notebooks.api.classes.server.config.sessions.log_fetch_workers", 3
+    )
+    # NOTE: Every request waits until all containers are requested, this only
+    # passes when the logs of the containers are read at the same time.
+    barrier = Barrier(3, timeout=5)
+    read_log = server._k8s_client.read_namespaced_pod_log.side_effect
+
+    def _read_log_together(*args, **kwargs):
+        barrier.wait()
+        return read_log(*args, **kwargs)
+
+    server._k8s_client.read_namespaced_pod_log.side_effect = _read_log_together
+    with app.app_context():
+        assert server.get_logs(10) == {
+            "jupyter-server": "line 1\n",
+            "git-proxy": "proxy line\n",
+        }
+        kwargs = server._k8s_client.read_namespaced_pod_log.call_args.kwargs
+        assert kwargs["limit_bytes"] == 1000
+        assert kwargs["tail_lines"] == 10
+        server.get_logs(10, limit_bytes=100)
+        kwargs = server._k8s_client.read_namespaced_pod_log.call_args.kwargs
+        assert kwargs["limit_bytes"] == 100
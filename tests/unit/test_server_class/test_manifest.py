@@ -11,7 +11,22 @@ from renku_notebooks.api.classes.server import UserServer
             {"environment_variables": {"TEST": "testval"}},
             "/containers/0/env/-', 'value': {'name': 'TEST', 'value': 'testval'}",
             lambda m: len(m.environment_variables) > 0,
-        )
+        ),
+        (
+            {
+                "server_options": {
+                    "lfs_auto_fetch": 1,
+                    "lfs_include": "data/*.csv",
+                    "defaultUrl": "/lab",
+                    "cpu_request": "100",
+                    "mem_request": "100",
+                    "disk_request": "100",
+                }
+            },
+            "{'name': 'GIT_CLONE_LFS_INCLUDE', 'value': 'data/*.csv'}",
+            lambda m: m.server_options["lfs_include"] == "data/*.csv"
+            and m.server_options["lfs_exclude"] == "",
+        ),
     ],
 )
 def test_session_manifest(
@@ -55,3 +70,108 @@ def test_session_manifest(
 
     if manifest_checks:
         assert manifest_checks(server_from_manifest)
+
+
+def test_config_patches_are_memoized_copies():
+    from renku_notebooks.api.amalthea_patches.utils import (
+        clear_config_patches_cache,
+        get_certificates_volume_mounts,
+        memoize_config_patches,
+    )
+
+    calls = []
+
+    @memoize_config_patches
+    def patches():
+        calls.append(1)
+        return [{"patch": [{"value": []}]}]
+
+    patches()[0]["patch"][0]["value"].append("modified")
+    assert patches() == [{"patch": [{"value": []}]}]
+    assert len(calls) == 1
+    clear_config_patches_cache()
+    patches()
+    assert len(calls) == 2
+    assert get_certificates_volume_mounts(custom_certs=False) == [
+        {"mountPath": "/etc/ssl/certs/", "name": "etc-ssl-certs", "readOnly": False}
+    ]
+
+
+def test_session_manifest_has_filter_labels(
+    patch_user_server, user_with_project_path, app
+):
+    user = user_with_project_path("namespace/project")
+    with app.app_context():
+        server = UserServer(
+            user,
+            "Test-Namespace",
+            "test-project",
+            "feature/branch",
+            "abcdefg123456789",
+            "",
+            None,
+            {
+                "lfs_auto_fetch": 0,
+                "defaultUrl": "/lab",
+                "cpu_request": "100",
+                "mem_request": "100",
+                "disk_request": "100",
+            },
+            {},
+            [],
+        )
+        server.image_workdir = ""
+        labels = server._get_session_manifest()["metadata"]["labels"]
+    filter_labels = UserServer.get_filter_labels(
+        namespace="test-namespace",
+        project="test-project",
+        branch="feature/branch",
+        commit_sha="abcdefg123456789",
+    )
+    assert filter_labels.items() <= labels.items()
+    assert len(labels["renku.io/branch-hash"]) <= 63
+    assert labels["renku.io/schemaVersion"] == "2"
+
+
+def test_session_manifest_mounts_git_clone_reference_cache(
+    patch_user_server, user_with_project_path, app, monkeypatch
+):
+    from renku_notebooks.config import config
+
+    reference_cache = config.sessions.git_clone.reference_cache
+    monkeypatch.setattr(reference_cache, "enabled", True)
+    monkeypatch.setattr(reference_cache, "host_path", "/var/cache/renku-git")
+    user = user_with_project_path("namespace/project")
+    with app.app_context():
+        server = UserServer(
+            user,
+            "test-namespace",
+            "test-project",
+            "master",
+            "abcdefg123456789",
+            "",
+            None,
+            {
+                "lfs_auto_fetch": 0,
+                "defaultUrl": "/lab",
+                "cpu_request": "100",
+                "mem_request": "100",
+                "disk_request": "100",
+            },
+            {},
+            [],
+        )
+        server.image_workdir = ""
+        manifest = str(server._get_session_manifest())
+    assert (
+        "{'name': 'git-clone-reference-cache', 'hostPath': "
+        "{'path': '/var/cache/renku-git', 'type': 'DirectoryOrCreate'}}"
+    ) in manifest
+    assert (
+        "{'name': 'GIT_CLONE_REFERENCE_CACHE_PATH', 'value': '/reference-cache'}"
+        in (manifest)
+    )
+    assert (
+        "{'name': 'GIT_CLONE_REFERENCE_CACHE_MAX_AGE_SECONDS', 'value': '300'}"
+        in manifest
+    )
@@ -0,0 +1,102 @@
+from time import monotonic, sleep
+
+import pytest
+from kubernetes.client.exceptions import ApiException
+
+from renku_notebooks.api.classes.server import UserServer
+from renku_notebooks.errors.intermittent import CannotStartServerError
+from renku_notebooks.errors.user import MissingResourceError
+
+
+@pytest.fixture
+def server(app, patch_user_server, user_with_project_path):
+    user = user_with_project_path("namespace/project")
+    with app.app_context():
+        yield UserServer(
+            user,
+            "namespace",
+            "project",
+            "branch",
+            "12345678910",
+            "notebook",
+            "image",
+            "server_options",
+            {},
+            [],
+        )
+
+
+def slow(result, seconds=0.3):
+    def _slow(*args, **kwargs):
+        sleep(seconds)
+        return result
+
+    return _slow
+
+
+def test_preflight_checks_run_concurrently(app, server, mocker):
+    mocker.patch.object(UserServer, "_branch_exists", side_effect=slow(True))
+    mocker.patch.object(UserServer, "_commit_sha_exists", side_effect=slow(True))
+    mocker.patch(
+        "renku_notebooks.api.classes.server.get_docker_token"
+    ).side_effect = slow(("token", False))
+    mocker.patch("renku_notebooks.api.classes.server.image_exists").return_value = True
+    mocker.patch(
+        "renku_notebooks.api.classes.server.get_image_workdir"
+    ).return_value = "/home/jovyan"
+    with app.app_context():
+        start = monotonic()
+        assert server._run_preflight_checks() == []
+        assert monotonic() - start < 0.6
+    assert server.verified_image == "image"
+    timings = server.launch_trace.timings
+    assert set(timings) == {
+        "project",
+        "branch",
+        "commit",
+        "verify_image",
+        "registry_token",
+        "image_exists",
+        "image_workdir",
+    }
+    assert timings["branch"] >= 0.3
+    assert timings["registry_token"] >= 0.3
+
+
+def test_preflight_checks_collect_all_errors(app, server, mocker):
+    server._user.get_renku_project.return_value = None
+    mocker.patch.object(UserServer, "_branch_exists").return_value = False
+    mocker.patch.object(UserServer, "_commit_sha_exists").return_value = False
+    with app.app_context():
+        with pytest.raises(MissingResourceError) as err:
+            server.start()
+    assert "project project does not exist" in err.value.message
+    assert "branch branch does not exist" in err.value.message
+    assert "commit 12345678910 does not exist" in err.value.message
+    assert "image image does not exist" in err.value.message
+
+
+def test_start_returns_existing_session_on_conflict(app, server, mocker):
+    mocker.patch.object(UserServer, "_run_preflight_checks").return_value = []
+    mocker.patch.object(UserServer, "_get_session_manifest").return_value = {}
+    server.verified_image = "image"
+    server._k8s_api_instance.create_namespaced_custom_object.side_effect = ApiException(
+        status=409
+    )
+    server._user.get_js.return_value = {"metadata": {"name": "existing"}}
+    with app.app_context():
+        assert server.start() is False
+    assert server.js == {"metadata": {"name": "existing"}}
+    assert server._user.get_js.call_args.kwargs["direct"] is True
+
+
+def test_start_fails_on_other_errors(app, server, mocker):
+    mocker.patch.object(UserServer, "_run_preflight_checks").return_value = []
+    mocker.patch.object(UserServer, "_get_session_manifest").return_value = {}
+    server.verified_image = "image"
+    server._k8s_api_instance.create_namespaced_custom_object.side_effect = ApiException(
+        status=422
+    )
+    with app.app_context():
+        with pytest.raises(CannotStartServerError):
+            server.start()
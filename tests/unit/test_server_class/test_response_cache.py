@@ -0,0 +1,76 @@
+import pytest
+
+from renku_notebooks.api.classes.server import UserServer
+from renku_notebooks.api.schemas.servers_get import (
+    LaunchNotebookResponseWithoutS3,
+    _dumped_servers_cache,
+)
+
+
+@pytest.fixture
+def server_js(patch_user_server, user_with_project_path, app):
+    user = user_with_project_path("namespace/project")
+    user.get_renku_project.return_value.id = 1
+    user.get_renku_project.return_value.web_url = "https://gitlab.com/namespace/project"
+    with app.app_context():
+        server = UserServer(
+            user=user,
+            namespace="test-namespace",
+            project="test-project",
+            image=None,
+            server_options={
+                "lfs_auto_fetch": 0,
+                "defaultUrl": "/lab",
+                "cpu_request": "100",
+                "mem_request": "100",
+                "disk_request": "100",
+            },
+            branch="master",
+            commit_sha="abcdefg123456789",
+            notebook="",
+            environment_variables={},
+            cloudstorage=[],
+        )
+        server.image_workdir = ""
+        js = server._get_session_manifest()
+    js["spec"]["jupyterServer"]["image"] = "registry.io/resolved/image:1.0"
+    js["metadata"]["resourceVersion"] = "1"
+    js["metadata"]["creationTimestamp"] = "2022-09-01T10:00:00Z"
+    js["status"] = {"state": "running", "mainPod": {"name": "pod", "status": {}}}
+    yield user, js, server
+    _dumped_servers_cache.clear()
+
+
+def test_dumped_servers_are_cached_per_resource_version(server_js, mocker, app):
+    user, js, _ = server_js
+    get_server_options = mocker.spy(UserServer, "_get_server_options_from_js")
+    schema = LaunchNotebookResponseWithoutS3()
+    with app.app_context():
+        first = schema.dump(UserServer.from_js(user, js))
+        assert get_server_options.call_count == 2  # from_js and the dump
+        second = schema.dump(UserServer.from_js(user, js))
+        assert get_server_options.call_count == 3  # from_js only
+        assert first == second
+        js["metadata"]["resourceVersion"] = "2"
+        js["status"]["state"] = "stopping"
+        third = schema.dump(UserServer.from_js(user, js))
+        assert get_server_options.call_count == 5
+    assert third["status"] != first["status"]
+    first["name"] = "modified"
+    with app.app_context():
+        assert (
+            schema.dump(UserServer.from_js(user, js), many=False)["name"] != "modified"
+        )
+
+
+def test_launch_response_is_not_cached(server_js, app):
+    user, js, launched_server = server_js
+    launched_server.set_js(js)
+    schema = LaunchNotebookResponseWithoutS3()
+    with app.app_context():
+        launch = schema.dump(launched_server)
+        assert len(_dumped_servers_cache) == 0
+        get = schema.dump(UserServer.from_js(user, js))
+    assert launched_server.image is None
+    assert launch["image"] == get["image"] == "registry.io/resolved/image:1.0"
+    assert len(_dumped_servers_cache) == 1
@@ -0,0 +1,81 @@
+from threading import Event, Thread
+from time import monotonic, sleep
+
+import pytest
+
+from renku_notebooks.util.single_flight import SingleFlight
+
+
+def _run_concurrently(flight, key, fn, count):
+    results, errors = [], []
+
+    def _call():
+        try:
+            results.append(flight.do(key, fn))
+        except Exception as err:
+            errors.append(err)
+
+    threads = [Thread(target=_call) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def _wait_for_waiters(flight, key, count, timeout=5):
+    deadline = monotonic() + timeout
+    while monotonic() < deadline:
+        call = flight._calls.get(key)
+        if call is not None and call.waiters == count:
+            return
+        sleep(0.01)
+    pytest.fail(f"{count} callers did not wait for the call in progress")
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    release = Event()
+    calls = []
+
+    def _launch():
+        calls.append(1)
+        release.wait(5)
+        return "js"
+
+    threads, results, _ = _run_concurrently(flight, "server", _launch, 3)
+    _wait_for_waiters(flight, "server", 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(results) == [("js", False), ("js", True), ("js", True)]
+
+
+def test_concurrent_calls_share_the_error():
+    flight = SingleFlight()
+    release = Event()
+    calls = []
+
+    def _launch():
+        calls.append(1)
+        release.wait(5)
+        raise ValueError("cannot start")
+
+    threads, results, errors = _run_concurrently(flight, "server", _launch, 3)
+    _wait_for_waiters(flight, "server", 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == []
+    assert len(errors) == 3
+    assert isinstance(errors[0], ValueError)
+    assert all(err is errors[0] for err in errors)
+
+
+def test_calls_after_completion_run_again():
+    flight = SingleFlight()
+    assert flight.do("server", lambda: 1) == (1, False)
+    assert flight.do("server", lambda: 2) == (2, False)
+    with pytest.raises(ValueError):
+        flight.do("server", lambda: int("a"))
+    assert flight.do("server", lambda: 3) == (3, False)
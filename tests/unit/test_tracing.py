@@ -0,0 +1,45 @@
+from threading import Thread
+from time import sleep
+
+import pytest
+
+from renku_notebooks.util.tracing import Trace
+
+
+def test_trace_records_spans_from_threads():
+    trace = Trace("test")
+
+    def _work(name):
+        with trace.span(name):
+            sleep(0.01)
+
+    with trace:
+        threads = [Thread(target=_work, args=(name,)) for name in ["a", "b", "a"]]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert len(trace.spans) == 3
+    assert set(trace.timings) == {"a", "b"}
+    assert trace.timings["a"] >= 0.02
+
+
+def test_trace_marks_failed_spans():
+    trace = Trace("test")
+    with pytest.raises(ValueError):
+        with trace.span("fail"):
+            raise ValueError()
+    assert trace.spans[0].failed
+    assert trace.spans[0].duration is not None
+
+
+def test_server_timing_header_value():
+    trace = Trace("test")
+    with trace.span("project"):
+        pass
+    with trace.span("create_cr"):
+        pass
+    name, duration = trace.server_timing().split(", ")[0].split(";dur=")
+    assert name == "project"
+    assert float(duration) >= 0
+    assert trace.server_timing().split(", ")[1].startswith("create_cr;dur=")
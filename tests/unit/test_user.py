@@ -0,0 +1,248 @@
+from unittest.mock import MagicMock
+
+import pytest
+from kubernetes.client.exceptions import ApiException
+
+from renku_notebooks.api.classes.user import RegisteredUser, User, _project_cache
+
+
+@pytest.fixture
+def user_with_k8s_js():
+    def _user_with_k8s_js(js=None, status=None):
+        user = MagicMock()
+        user.safe_username = "john"
+        user._get_synced_informer = lambda server_name=None: (
+            User._get_synced_informer(user, server_name)
+        )
+        if status is not None:
+            user._k8s_api_instance.get_namespaced_custom_object.side_effect = (
+                ApiException(status=status)
+            )
+        else:
+            user._k8s_api_instance.get_namespaced_custom_object.return_value = js
+        return user
+
+    yield _user_with_k8s_js
+
+
+def test_get_js_by_name(user_with_k8s_js):
+    js = {"metadata": {"name": "server", "labels": {"renku.io/safe-username": "john"}}}
+    user = user_with_k8s_js(js)
+    assert User.get_js(user, "server") == js
+    user._k8s_api_instance.get_namespaced_custom_object.assert_called_once()
+    assert (
+        user._k8s_api_instance.get_namespaced_custom_object.call_args.kwargs["name"]
+        == "server"
+    )
+
+
+def test_get_js_belonging_to_other_user(user_with_k8s_js):
+    js = {"metadata": {"name": "server", "labels": {"renku.io/safe-username": "jane"}}}
+    assert User.get_js(user_with_k8s_js(js), "server") is None
+
+
+def test_get_js_missing(user_with_k8s_js):
+    assert User.get_js(user_with_k8s_js(status=404), "server") is None
+    with pytest.raises(ApiException):
+        User.get_js(user_with_k8s_js(status=500), "server")
+
+
+@pytest.fixture
+def user_with_gitlab_project(app):
+    user = MagicMock()
+    user.id = "user-id"
+    user.gitlab_client.projects.get.return_value.attributes = {
+        "id": 1,
+        "path": "project",
+        "path_with_namespace": "namespace/project",
+        "http_url_to_repo": "https://gitlab.com/namespace/project.git",
+        "web_url": "https://gitlab.com/namespace/project",
+        "permissions": {"project_access": {"access_level": 30}},
+        "description": "not cached",
+    }
+    with app.app_context():
+        yield user
+    _project_cache.clear()
+
+
+def test_get_renku_project_is_cached(user_with_gitlab_project):
+    project = User.get_renku_project(user_with_gitlab_project, "namespace/project")
+    assert project.path_with_namespace == "namespace/project"
+    assert project.permissions["project_access"]["access_level"] == 30
+    assert "description" not in project.attributes
+    project = User.get_renku_project(user_with_gitlab_project, "namespace/project")
+    assert project.id == 1
+    user_with_gitlab_project.gitlab_client.projects.get.assert_called_once()
+
+
+def test_get_renku_project_missing_is_not_cached(user_with_gitlab_project):
+    user_with_gitlab_project.gitlab_client.projects.get.side_effect = Exception()
+    assert User.get_renku_project(user_with_gitlab_project, "namespace/project") is None
+    assert User.get_renku_project(user_with_gitlab_project, "namespace/project") is None
+    assert user_with_gitlab_project.gitlab_client.projects.get.call_count == 2
+
+
+def make_project(path, branch_names):
+    project = MagicMock()
+    project.path_with_namespace = path
+    branches = []
+    for name in branch_names:
+        branch = MagicMock()
+        branch.name = name
+        branch.attributes = {
+            "name": name,
+            "commit": {"committed_date": "2022-09-01T10:00:00.000+02:00"},
+        }
+        branches.append(branch)
+    project.branches.list.return_value = branches
+    return project
+
+
+def test_get_autosaves_for_all_projects(app):
+    user = RegisteredUser.__new__(RegisteredUser)
+    user.username = "john"
+    user.gitlab_client = MagicMock()
+    user.gitlab_client.projects.list.return_value = [
+        make_project(f"namespace/project{i}", []) for i in range(3)
+    ] + [
+        make_project(
+            "namespace/project",
+            ["renku/autosave/john/master/1234567/abcdefg", "renku/autosave/jane/x"],
+        )
+    ]
+    with app.app_context():
+        autosaves = list(user.get_autosaves())
+    assert len(autosaves) == 1
+    autosave = autosaves[0]
+    assert autosave.namespace_project == "namespace/project"
+    assert autosave.root_branch_name == "master"
+    assert autosave.creation_date.year == 2022
+    autosave.gl_project.branches.get.assert_not_called()
+
+
+def test_cleanup_autosaves_checks_each_root_commit_once():
+    autosaves = [MagicMock(root_commit_sha=sha) for sha in ["aaa", "aaa", "bbb"]]
+    autosaves[0]._root_commit_is_parent_of.return_value = True
+    autosaves[2]._root_commit_is_parent_of.return_value = False
+    user = MagicMock()
+    user.get_autosaves.return_value = iter(autosaves)
+    User.cleanup_autosaves(user, "namespace/project", "ccc")
+    autosaves[0]._root_commit_is_parent_of.assert_called_once_with("ccc")
+    autosaves[1]._root_commit_is_parent_of.assert_not_called()
+    autosaves[0].delete.assert_called_once()
+    autosaves[1].delete.assert_called_once()
+    autosaves[2].delete.assert_not_called()
+
+
+def test_watch_jss_from_k8s(mocker, user_with_k8s_js):
+    js = {"metadata": {"name": "server", "resourceVersion": "2"}}
+    user = user_with_k8s_js()
+    user._k8s_api_instance.list_namespaced_custom_object.return_value = {
+        "metadata": {"resourceVersion": "1"},
+        "items": [js],
+    }
+    watch = mocker.patch("renku_notebooks.api.classes.user.watch.Watch")
+    watch.return_value.stream.side_effect = [
+        [
+            {"type": "BOOKMARK", "raw_object": {"metadata": {"resourceVersion": "3"}}},
+            {
+                "type": "MODIFIED",
+                "raw_object": {"metadata": {"name": "server", "resourceVersion": "4"}},
+            },
+        ],
+        ApiException(status=410),
+    ]
+    events = User._watch_jss_from_k8s(user)
+    assert next(events) == (
+        "RESET",
+        {"metadata": {"resourceVersion": "1"}, "items": [js]},
+    )
+    assert next(events)[0] == "MODIFIED"
+    assert next(events) is None
+    assert watch.return_value.stream.call_args.kwargs["resource_version"] == "1"
+    # NOTE: When the resource version expires all servers are listed again
+    assert next(events) == (
+        "RESET",
+        {"metadata": {"resourceVersion": "1"}, "items": [js]},
+    )
+    assert watch.return_value.stream.call_args.kwargs["resource_version"] == "4"
+    assert user._k8s_api_instance.list_namespaced_custom_object.call_count == 2
+
+
+def test_watch_jss_resumes_from_resource_version(mocker, user_with_k8s_js):
+    user = user_with_k8s_js()
+    watch = mocker.patch("renku_notebooks.api.classes.user.watch.Watch")
+    watch.return_value.stream.return_value = []
+    events = User._watch_jss_from_k8s(user, "5")
+    assert next(events) is None
+    user._k8s_api_instance.list_namespaced_custom_object.assert_not_called()
+    assert watch.return_value.stream.call_args.kwargs["resource_version"] == "5"
+
+
+def test_get_jss_filters_with_label_selectors(user_with_k8s_js):
+    user = user_with_k8s_js()
+    user._k8s_api_instance.list_namespaced_custom_object.return_value = {
+        "metadata": {"continue": "next"},
+        "items": [{"metadata": {"name": "server"}}],
+    }
+    jss, continue_token = User.get_jss(
+        user, {"renku.io/commit-sha": "abc"}, limit=10, continue_token="previous"
+    )
+    assert jss == [{"metadata": {"name": "server"}}]
+    assert continue_token == "next"
+    kwargs = user._k8s_api_instance.list_namespaced_custom_object.call_args.kwargs
+    assert (
+        kwargs["label_selector"]
+        == "renku.io/safe-username=john,renku.io/commit-sha=abc"
+    )
+    assert kwargs["limit"] == 10
+    assert kwargs["_continue"] == "previous"
+
+
+def test_get_jss_filters_informer_servers_by_labels(mocker, user_with_k8s_js):
+    user = user_with_k8s_js()
+    informer = mocker.patch("renku_notebooks.api.classes.user.get_informer")
+    informer.return_value.has_synced = True
+    informer.return_value.has_pending_writes.return_value = False
+    informer.return_value.list.return_value = [
+        {"metadata": {"name": "a", "labels": {"renku.io/commit-sha": "abc"}}},
+        {"metadata": {"name": "b", "labels": {"renku.io/commit-sha": "def"}}},
+    ]
+    jss, continue_token = User.get_jss(user, {"renku.io/commit-sha": "abc"})
+    assert [js["metadata"]["name"] for js in jss] == ["a"]
+    assert continue_token is None
+    user._k8s_api_instance.list_namespaced_custom_object.assert_not_called()
+
+
+def test_get_js_reads_own_writes_from_k8s(mocker, user_with_k8s_js):
+    js = {"metadata": {"name": "server", "labels": {"renku.io/safe-username": "john"}}}
+    user = user_with_k8s_js(js)
+    informer = mocker.patch("renku_notebooks.api.classes.user.get_informer")
+    informer.return_value.has_synced = True
+    informer.return_value.get.return_value = None
+    informer.return_value.has_pending_writes.return_value = True
+    assert User.get_js(user, "server") == js
+    informer.return_value.has_pending_writes.assert_called_once_with("john", "server")
+    informer.return_value.has_pending_writes.return_value = False
+    assert User.get_js(user, "server") is None
+    # NOTE: Direct reads always go to k8s
+    assert User.get_js(user, "server", direct=True) == js
+    assert user._k8s_api_instance.get_namespaced_custom_object.call_count == 2
+
+
+def test_watch_jss_from_informer_starts_with_snapshot(user_with_k8s_js):
+    js = {"metadata": {"name": "server", "resourceVersion": "2"}}
+    user = user_with_k8s_js()
+    informer = MagicMock()
+    informer.snapshot.return_value = ([js], "7")
+    informer.subscribe.return_value.overflowed = False
+    informer.subscribe.return_value.events.get.return_value = ("MODIFIED", js)
+    events = User._watch_jss_from_informer(user, informer)
+    assert next(events) == (
+        "RESET",
+        {"metadata": {"resourceVersion": "7"}, "items": [js]},
+    )
+    assert next(events) == ("MODIFIED", js)
+    informer.snapshot.assert_called_once_with("john")
+    events.close()
+    informer.unsubscribe.assert_called_once_with(informer.subscribe.return_value)
@@ -0,0 +1,56 @@
+from threading import Event
+
+from renku_notebooks.util.work_queue import WorkQueue
+
+
+def test_work_queue_runs_jobs_in_background():
+    queue = WorkQueue("test")
+    results = []
+    assert queue.enqueue("a", results.append, 1)
+    assert queue.enqueue("b", results.append, 2)
+    queue.join()
+    assert results == [1, 2]
+    stats = queue.stats()
+    assert stats["depth"] == 0
+    assert stats["processed"] == 2
+    assert stats["wait_seconds_max"] >= 0
+
+
+def test_work_queue_deduplicates_pending_jobs():
+    queue = WorkQueue("test")
+    started, release = Event(), Event()
+    results = []
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    queue.enqueue("blocker", block)
+    started.wait(5)
+    assert queue.enqueue("a", results.append, 1)
+    assert not queue.enqueue("a", results.append, 2)
+    assert queue.depth == 1
+    release.set()
+    queue.join()
+    assert results == [1]
+
+
+def test_work_queue_failures_and_drops():
+    queue = WorkQueue("test", maxsize=1)
+    started, release = Event(), Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    def fail():
+        raise ValueError()
+
+    queue.enqueue("blocker", block)
+    started.wait(5)
+    assert queue.enqueue("fail", fail)
+    assert not queue.enqueue("dropped", fail)
+    release.set()
+    queue.join()
+    assert queue.stats()["failed"] == 1
+    assert queue.stats()["dropped"] == 1